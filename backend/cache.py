@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", 300))
+# How often the sync generation marker is read to find out whether a sync run has finished.
+# Cached reads may be served for up to this long after a run finishes; ETag revalidations
+# check the marker on every request instead (see check_generation).
+CACHE_GENERATION_CHECK_SECONDS = float(os.getenv("CACHE_GENERATION_CHECK_SECONDS", 15))
+
+
+class _Flight:
+    """A load in progress, which concurrent misses for the same key wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ReadThroughCache:
+    """
+    A bounded LRU cache with a TTL for Datastore reads, safe to use from multiple threads.
+
+    get(key, loader) returns the cached value or calls loader() once, however many requests
+    miss the same key at the same time; the others wait for its result. None results are not
+    cached. Every CACHE_GENERATION_CHECK_SECONDS, generation_loader() is called to read the
+    generation marker the sync job writes after each run, and the whole cache is dropped when
+    it changes, so data older than the last finished sync is served for at most that long.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 generation_loader=None, generation_check_seconds: float = CACHE_GENERATION_CHECK_SECONDS,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation_loader = generation_loader
+        self.generation_check_seconds = generation_check_seconds
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires at, value), least recently used first
+        self._in_flight = {}  # key -> _Flight
+        self._lock = threading.Lock()
+        self._generation_lock = threading.Lock()
+        self._generation = None
+        self._generation_checked_at = None
+        # Bumped by invalidate(), so loads that started before it do not store their results.
+        self._epoch = 0
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key, loader):
+        self.check_generation()
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+                self.stats["expirations"] += 1
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+            epoch = self._epoch
+
+        if not leader:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                if flight.error is None and flight.value is not None and epoch == self._epoch:
+                    self._store(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def _store(self, key, value):
+        self._entries[key] = (self.clock() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self):
+        """Drops every cached entry."""
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+            self.stats["invalidations"] += 1
+
+    def check_generation(self, force: bool = False):
+        """
+        Reads the generation marker if generation_check_seconds have passed since it was last
+        read, or always with force, and drops the cache if it changed.
+        """
+        if self.generation_loader is None:
+            return
+        now = self.clock()
+        if not force and self._generation_checked_at is not None and now - self._generation_checked_at < self.generation_check_seconds:
+            return
+        # One request reads the marker; the others keep using the cache meanwhile.
+        if not self._generation_lock.acquire(blocking=False):
+            return
+        try:
+            self._generation_checked_at = now
+            generation = self.generation_loader()
+            if generation is not None and generation != self._generation:
+                if self._generation is not None:
+                    logging.info(f"Sync generation changed to {generation}, dropping cached reads.")
+                    self.invalidate()
+                self._generation = generation
+        except Exception as e:
+            logging.warning(f"Could not read the sync generation: {e}")
+        finally:
+            self._generation_lock.release()
+
+    def get_stats(self):
+        """Returns the hit, miss and eviction counters, the entry count and the current generation."""
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries, generation=self._generation)
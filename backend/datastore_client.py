@@ -1,6 +1,13 @@
 from google.cloud import datastore
+import asyncio
+import json
 import logging
 import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,9 +20,171 @@ DASHBOARD_GCP_PROJECT_ID = os.getenv("DASHBOARD_GCP_PROJECT_ID")
 if not DASHBOARD_GCP_PROJECT_ID or DASHBOARD_GCP_PROJECT_ID == "YOUR_DATASTORE_PROJECT_ID_HERE":
     raise RuntimeError("DASHBOARD_GCP_PROJECT_ID is not set in the .env file.")
 
+# Datastore clients live for the whole process and are shared by every request: the pool is
+# filled at FastAPI startup (or on first use) and closed on shutdown. Each client has its own
+# gRPC channel and is thread-safe; requests get them round-robin.
+DATASTORE_CLIENT_POOL_SIZE = int(os.getenv("DATASTORE_CLIENT_POOL_SIZE", 1))
+# Latency percentiles are computed over this many of the most recent calls of each method.
+DATASTORE_LATENCY_SAMPLES = int(os.getenv("DATASTORE_LATENCY_SAMPLES", 1000))
+TIMED_METHODS = ("get", "get_multi", "put", "put_multi", "delete", "delete_multi")
+
+class DatastoreLatency:
+    """Per-method call counts, errors and latency percentiles of the pooled clients."""
+
+    def __init__(self, samples: int = DATASTORE_LATENCY_SAMPLES):
+        self._samples = samples
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def record(self, method: str, seconds: float, error: bool = False):
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = {"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                                                 "recent": deque(maxlen=self._samples)}
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["recent"].append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            methods = {name: dict(stats, recent=sorted(stats["recent"])) for name, stats in self._methods.items()}
+        snapshot = {}
+        for name, stats in methods.items():
+            recent = stats["recent"]
+            percentile = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 2) if recent else 0.0
+            snapshot[name] = {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "mean_ms": round(stats["total_seconds"] / stats["calls"] * 1000, 2),
+                "p50_ms": percentile(0.50),
+                "p95_ms": percentile(0.95),
+                "p99_ms": percentile(0.99),
+                "max_ms": round(stats["max_seconds"] * 1000, 2),
+            }
+        return snapshot
+
+class _TimedClient:
+    """A datastore.Client whose RPC methods record their latency."""
+
+    def __init__(self, client, latency: DatastoreLatency):
+        self._client = client
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in TIMED_METHODS:
+            return attr
+
+        def timed(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                self._latency.record(name, time.monotonic() - started, error=True)
+                raise
+            self._latency.record(name, time.monotonic() - started)
+            return result
+
+        return timed
+
+class DatastoreClientPool:
+    """A thread-safe pool of long-lived Datastore clients, handed out round-robin."""
+
+    def __init__(self, size: int = DATASTORE_CLIENT_POOL_SIZE):
+        self.size = max(1, size)
+        self.latency = DatastoreLatency()
+        self._lock = threading.Lock()
+        self._clients = []
+        self._next = 0
+        self.created = 0
+
+    def open(self):
+        """Creates any missing clients, so credential discovery and channel setup happen up front."""
+        with self._lock:
+            self._fill()
+
+    def _fill(self):
+        while len(self._clients) < self.size:
+            self._clients.append(_TimedClient(datastore.Client(project=DASHBOARD_GCP_PROJECT_ID), self.latency))
+            self.created += 1
+
+    def get(self):
+        with self._lock:
+            if not self._clients:
+                self._fill()
+            client = self._clients[self._next % len(self._clients)]
+            self._next += 1
+            return client
+
+    def close(self):
+        """Closes every client's HTTP session and gRPC channel; later calls open new clients."""
+        with self._lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            try:
+                client.close()
+                api = getattr(client._client, "_datastore_api_internal", None)
+                transport = getattr(api, "transport", None)
+                if transport is not None:
+                    transport.close()
+            except Exception as e:
+                logging.warning(f"Failed to close a Datastore client: {e}")
+        if clients:
+            logging.info(f"Closed {len(clients)} pooled Datastore clients.")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            open_clients = len(self._clients)
+        return {"pool_size": self.size, "open_clients": open_clients, "clients_created": self.created,
+                "methods": self.latency.snapshot()}
+
+_client_pool = DatastoreClientPool()
+
+def open_datastore_clients():
+    """Fills the client pool; called at FastAPI startup. A failure is logged and retried on first use."""
+    try:
+        _client_pool.open()
+        logging.info(f"Opened {_client_pool.size} pooled Datastore clients for project {DASHBOARD_GCP_PROJECT_ID}.")
+    except Exception as e:
+        logging.error(f"Failed to open the Datastore clients: {e}")
+
+def close_datastore_clients():
+    """Closes the pooled clients; called at FastAPI shutdown."""
+    _client_pool.close()
+
+def get_datastore_stats() -> dict:
+    """Returns the pool's size and the per-method call counts and latencies of its clients."""
+    return _client_pool.get_stats()
+
 def get_datastore_client():
-    """Initializes and returns a Datastore client."""
-    return datastore.Client(project=DASHBOARD_GCP_PROJECT_ID)
+    """Returns a long-lived Datastore client from the process-wide pool."""
+    return _client_pool.get()
+
+async def run_datastore_call(func, *args, **kwargs):
+    """Runs a blocking Datastore helper (e.g. get_dashboard_data) from an async endpoint on a worker thread."""
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+# Stored by the data sync job with every entity it writes, and indexed.
+CONTENT_HASH_FIELD = "content_hash"
+
+def get_content_hash(kind: str, name: str):
+    """
+    Returns the content hash stored with an entity, or None if there is none. It is read from
+    the content_hash index with a projection query, without loading the entity itself.
+    """
+    try:
+        client = get_datastore_client()
+        query = client.query(kind=kind, projection=[CONTENT_HASH_FIELD])
+        query.key_filter(client.key(kind, name), "=")
+        for entity in query.fetch(limit=1):
+            return entity[CONTENT_HASH_FIELD]
+        return None
+    except Exception as e:
+        logging.error(f"Failed to retrieve the content hash of {kind} {name} from Datastore: {e}")
+        return None
 
 def save_dashboard_data(project_id: str, data: dict):
     """Saves the aggregated dashboard data to Datastore."""
@@ -49,6 +218,58 @@ def get_dashboard_data(project_id: str):
         logging.error(f"Failed to retrieve data for project {project_id} from Datastore: {e}")
         return None
 
+# Written by the data sync job: the full org policies behind a project's org_policies entries,
+# as zlib-compressed JSON keyed by constraint. Decoded only when a policy's details are requested.
+ORG_POLICY_DETAILS_FIELD = "org_policy_details"
+
+# Dashboards read in a batch are looked up DASHBOARD_BATCH_LOOKUP_SIZE keys per get_multi, with up
+# to DASHBOARD_BATCH_READ_WORKERS lookups in flight.
+DASHBOARD_BATCH_LOOKUP_SIZE = int(os.getenv("DASHBOARD_BATCH_LOOKUP_SIZE", 100))
+DASHBOARD_BATCH_READ_WORKERS = int(os.getenv("DASHBOARD_BATCH_READ_WORKERS", 4))
+
+def iter_dashboard_data(project_ids):
+    """
+    Yields (project_id, dashboard data or None) for each of project_ids, a chunk at a time as the
+    chunks' get_multi lookups complete. The projects of a failed lookup are yielded with None.
+    """
+    client = get_datastore_client()
+    chunks = [project_ids[i:i + DASHBOARD_BATCH_LOOKUP_SIZE] for i in range(0, len(project_ids), DASHBOARD_BATCH_LOOKUP_SIZE)]
+
+    def lookup(chunk):
+        entities = client.get_multi([client.key(DATASTORE_KIND, project_id) for project_id in chunk])
+        return {entity.key.name: dict(entity) for entity in entities}
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(DASHBOARD_BATCH_READ_WORKERS, len(chunks))))
+    try:
+        futures = {pool.submit(lookup, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                found = future.result()
+            except Exception as e:
+                logging.error(f"Failed to retrieve data for {len(chunk)} projects from Datastore: {e}")
+                found = {}
+            for project_id in chunk:
+                yield project_id, found.get(project_id)
+    finally:
+        # Lookups not started yet are dropped if the caller stops early.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def get_org_policy_details(project_id: str, constraint: str):
+    """Retrieves the full org policy stored for a project's constraint."""
+    try:
+        client = get_datastore_client()
+        key = client.key(DATASTORE_KIND, project_id)
+        entity = client.get(key)
+        blob = entity.get(ORG_POLICY_DETAILS_FIELD) if entity else None
+        if not blob:
+            logging.warning(f"No org policy details found for project {project_id}.")
+            return None
+        return json.loads(zlib.decompress(blob)).get(constraint)
+    except Exception as e:
+        logging.error(f"Failed to retrieve org policy {constraint} for project {project_id} from Datastore: {e}")
+        return None
+
 PROJECTS_KIND = "OrganizationProjects"
 
 def save_projects_data(org_id: str, projects_data: dict):
@@ -67,18 +288,147 @@ def save_projects_data(org_id: str, projects_data: dict):
         logging.error(f"Failed to save project data for organization {org_id}: {e}")
         return False
 
-def get_projects_data(org_id: str):
-    """Retrieves the organization's project structure from Datastore."""
+# The data sync job stores the project list as a manifest entity plus shards of projects
+# (PROJECTS_KIND/"<org id>:<generation>:<i>", zlib-compressed JSON). The manifest's folder_shards
+# maps each folder name to the shards holding its projects.
+PROJECTS_SHARDS_PER_LOOKUP = int(os.getenv("PROJECTS_SHARDS_PER_LOOKUP", 4))
+PROJECTS_READ_WORKERS = int(os.getenv("PROJECTS_READ_WORKERS", 8))
+
+def _load_project_shards(client, org_id: str, manifest, folder_names=None):
+    """
+    Loads the projects of the manifest's shards, or only of the shards holding the projects of
+    folder_names, with get_multi lookups of PROJECTS_SHARDS_PER_LOOKUP shards run in parallel.
+    """
+    if folder_names is None:
+        indexes = range(manifest["shards"])
+    else:
+        folder_shards = json.loads(manifest.get("folder_shards") or "{}")
+        indexes = sorted({i for name in folder_names for i in folder_shards.get(name, [])})
+    keys = [client.key(PROJECTS_KIND, f"{org_id}:{manifest['generation']}:{i}") for i in indexes]
+    lookups = [keys[i:i + PROJECTS_SHARDS_PER_LOOKUP] for i in range(0, len(keys), PROJECTS_SHARDS_PER_LOOKUP)]
+    found = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(PROJECTS_READ_WORKERS, len(lookups)))) as pool:
+        for entities in pool.map(client.get_multi, lookups):
+            found.update((entity.key.name, entity["data"]) for entity in entities)
+    missing = [key.name for key in keys if key.name not in found]
+    if missing:
+        raise LookupError(f"Missing project shards: {missing}")
+    return [project for key in keys for project in json.loads(zlib.decompress(found[key.name]))]
+
+def get_projects_data(org_id: str, folder_names=None):
+    """
+    Retrieves the organization's project structure from Datastore. With folder_names (a
+    collection of folder display names), only the shards holding those folders' projects are
+    loaded, and "projects" holds only their projects.
+    """
     try:
         client = get_datastore_client()
         key = client.key(PROJECTS_KIND, org_id)
-        entity = client.get(key)
-        if entity:
-            logging.info(f"Successfully retrieved project data for organization {org_id}.")
-            return dict(entity)
-        else:
-            logging.warning(f"No project data found for organization {org_id}.")
-            return None
+        # A new project list replaces the old shards after its manifest; read again if they were just replaced.
+        for attempt in range(2):
+            entity = client.get(key)
+            if not entity:
+                logging.warning(f"No project data found for organization {org_id}.")
+                return None
+            data = dict(entity)
+            if "generation" not in data:
+                # A project list stored in a single entity.
+                break
+            try:
+                data["projects"] = _load_project_shards(client, org_id, data, folder_names)
+                break
+            except LookupError as e:
+                if attempt:
+                    raise
+                logging.warning(f"Reading project data for organization {org_id} again: {e}")
+        if folder_names is not None:
+            data["projects"] = [p for p in data.get("projects", []) if p.get("folder_name") in folder_names]
+        logging.info(f"Successfully retrieved project data for organization {org_id}.")
+        return data
     except Exception as e:
         logging.error(f"Failed to retrieve project data for organization {org_id}: {e}")
         return None
+
+def _load_chunked_json(kind: str, name: str):
+    """
+    Reads a value the data sync job stored as a manifest entity (kind/name) plus chunks
+    ("name:<generation>:<i>", or "name:<i>" before chunks had generations) of zlib-compressed
+    JSON, with one get and one get_multi; None if there is none.
+    """
+    client = get_datastore_client()
+    manifest = client.get(client.key(kind, name))
+    if not manifest:
+        return None
+    prefix = f"{name}:{manifest['generation']}" if manifest.get("generation") else name
+    keys = [client.key(kind, f"{prefix}:{i}") for i in range(manifest["chunks"])]
+    found = {entity.key.name: entity["data"] for entity in client.get_multi(keys)}
+    return json.loads(zlib.decompress(b"".join(found[key.name] for key in keys)))
+
+# Written by the data sync job: the organization's folder hierarchy as a manifest entity
+# (FOLDER_GRAPH_KIND/<org id>) plus chunks ("<org id>:<generation>:<i>") of zlib-compressed JSON.
+FOLDER_GRAPH_KIND = "FolderGraph"
+
+def get_folder_graph(org_id: str):
+    """
+    Retrieves the organization's cached folder graph: {"root", "refreshed_at", "folders":
+    {folder name: {"display_name", "parent", "etag", "update_time"}}}.
+    """
+    try:
+        graph = _load_chunked_json(FOLDER_GRAPH_KIND, org_id)
+        if graph is None:
+            logging.warning(f"No folder graph found for organization {org_id}.")
+            return None
+        logging.info(f"Successfully retrieved the folder graph for organization {org_id}.")
+        return graph
+    except Exception as e:
+        logging.error(f"Failed to retrieve the folder graph for organization {org_id}: {e}")
+        return None
+
+def descendant_folders(graph: dict, folder_ids) -> set:
+    """Returns the given folders (names like 'folders/123') and every folder below them in graph."""
+    children = {}
+    for name, folder in graph["folders"].items():
+        children.setdefault(folder["parent"], []).append(name)
+    found = set()
+    stack = list(folder_ids)
+    while stack:
+        name = stack.pop()
+        if name not in found:
+            found.add(name)
+            stack.extend(children.get(name, []))
+    return found
+
+# Written by the data sync job at the end of every run, stored like the folder graph: the
+# organization's project counts per control and status, in total, per folder and per environment.
+COMPLIANCE_ROLLUP_KIND = "ComplianceRollup"
+
+def get_compliance_rollup(org_id: str):
+    """
+    Retrieves the organization's compliance rollup: {"generated_at", "projects", "controls",
+    "statuses", "totals", "folders", "environments"}, its counts as flat lists indexed by
+    control index * len(statuses) + status index.
+    """
+    try:
+        rollup = _load_chunked_json(COMPLIANCE_ROLLUP_KIND, org_id)
+        if rollup is None:
+            logging.warning(f"No compliance rollup found for organization {org_id}.")
+            return None
+        logging.info(f"Successfully retrieved the compliance rollup for organization {org_id}.")
+        return rollup
+    except Exception as e:
+        logging.error(f"Failed to retrieve the compliance rollup for organization {org_id}: {e}")
+        return None
+
+# Written by the data sync job at the end of every run.
+SYNC_GENERATION_KIND = "GcpSyncGeneration"
+SYNC_GENERATION_NAME = "current"
+
+def get_sync_generation():
+    """Returns the generation of the latest finished sync run, or None if it cannot be read."""
+    try:
+        client = get_datastore_client()
+        entity = client.get(client.key(SYNC_GENERATION_KIND, SYNC_GENERATION_NAME))
+        return entity.get("generation") if entity else None
+    except Exception as e:
+        logging.error(f"Failed to retrieve the sync generation from Datastore: {e}")
+        return None
@@ -1,10 +1,19 @@
+import hashlib
 import logging
 import os
 import json
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from backend.datastore_client import get_dashboard_data, get_projects_data
+from fastapi.responses import StreamingResponse
+from backend.cache import ReadThroughCache
+from backend.datastore_client import (
+    CONTENT_HASH_FIELD, DATASTORE_KIND, ORG_POLICY_DETAILS_FIELD, PROJECTS_KIND, close_datastore_clients, descendant_folders,
+    get_compliance_rollup, get_content_hash, get_dashboard_data, get_datastore_stats, get_folder_graph, get_org_policy_details, get_projects_data,
+    get_sync_generation, iter_dashboard_data, open_datastore_clients,
+)
 from backend.vertex_ai import generate_summary
 
 load_dotenv()
@@ -12,7 +21,23 @@ load_dotenv()
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI()
+# --- Configuration ---
+# Browsers may reuse a dashboard or project list for HTTP_CACHE_MAX_AGE_SECONDS and then revalidate
+# it with its ETag. The data only changes when a sync run finishes, every SYNC_INTERVAL_SECONDS,
+# so a stale copy may be shown for that long while it is revalidated in the background.
+HTTP_CACHE_MAX_AGE_SECONDS = int(os.getenv("HTTP_CACHE_MAX_AGE_SECONDS", 60))
+SYNC_INTERVAL_SECONDS = int(os.getenv("SYNC_INTERVAL_SECONDS", 3600))
+# The most dashboards one /api/dashboards request may ask for.
+DASHBOARD_BATCH_MAX_PROJECTS = int(os.getenv("DASHBOARD_BATCH_MAX_PROJECTS", 500))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The Datastore clients are created once per process, before the first request.
+    open_datastore_clients()
+    yield
+    close_datastore_clients()
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CORS Middleware ---
 origins = [
@@ -29,67 +54,275 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Datastore reads, cached in process until they expire or the next sync run finishes.
+# Cached values are shared between requests and must not be modified.
+read_cache = ReadThroughCache(generation_loader=get_sync_generation)
+
+def _load_dashboard(project_id: str):
+    return _strip_dashboard(get_dashboard_data(project_id))
+
+def _strip_dashboard(data):
+    if data:
+        # The compressed full org policies are served by get_org_policy instead.
+        data.pop(ORG_POLICY_DETAILS_FIELD, None)
+    return data
+
+def _cache_headers(etag: str):
+    headers = {"Cache-Control": f"private, max-age={HTTP_CACHE_MAX_AGE_SECONDS}, stale-while-revalidate={SYNC_INTERVAL_SECONDS}"}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+def _etag(content_hash: str, *variant, weak: bool = False):
+    """
+    Returns the ETag of a response built from data with content_hash, or None without a hash.
+    It is weak if the response also carries fields the hash leaves out, like last_updated.
+    """
+    if not content_hash:
+        return None
+    if variant:
+        # Filtered views of the same data are different representations.
+        content_hash = hashlib.sha256(json.dumps([content_hash, *variant]).encode("utf-8")).hexdigest()
+    return f'W/"{content_hash}"' if weak else f'"{content_hash}"'
+
+def _dashboard_etag(content_hash: str):
+    # The dashboard body includes last_updated and the other sync metadata, which a run may
+    # rewrite without changing the content hash, so the body is only semantically equivalent.
+    return _etag(content_hash, weak=True)
+
+def _opaque_tag(etag: str):
+    return etag[2:] if etag.startswith("W/") else etag
+
+def _not_modified(request: Request, etag: str):
+    """Returns True if the request's If-None-Match header matches etag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match or not etag:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison.
+    return "*" in tags or _opaque_tag(etag) in [_opaque_tag(tag) for tag in tags]
+
 @app.get("/api/dashboard/{project_id}")
-def get_dashboard(project_id: str):
+def get_dashboard(project_id: str, request: Request, response: Response):
     """Retrieves cached dashboard data from Datastore."""
     logging.info(f"Fetching dashboard data for project: {project_id}")
-    data = get_dashboard_data(project_id)
+    # Revalidations only read the stored content hash, not the dashboard data.
+    if request.headers.get("if-none-match"):
+        read_cache.check_generation(force=True)
+        etag = _dashboard_etag(read_cache.get(("dashboard_hash", project_id), lambda: get_content_hash(DATASTORE_KIND, project_id)))
+        if _not_modified(request, etag):
+            return Response(status_code=304, headers=_cache_headers(etag))
+    data = read_cache.get(("dashboard", project_id), lambda: _load_dashboard(project_id))
     if data:
+        response.headers.update(_cache_headers(_dashboard_etag(data.get(CONTENT_HASH_FIELD))))
         return data
     else:
         raise HTTPException(status_code=404, detail="Dashboard data not found. The data sync job may not have run yet.")
 
+@app.get("/api/dashboards")
+def get_dashboards(projectIds: str = None, folderName: str = None, includeSubfolders: bool = False):
+    """
+    Streams the dashboard data of several projects, given as comma-separated projectIds or as the
+    projects of a folder, as newline-delimited JSON: one {"project_id", "data"} object per project,
+    or {"project_id", "detail"} if it has no data, in the order the Datastore lookups complete.
+    """
+    if projectIds:
+        project_ids = list(dict.fromkeys(p.strip() for p in projectIds.split(",") if p.strip()))
+    elif folderName:
+        org_id = os.getenv("ORGANIZATION_ID")
+        if not org_id:
+            raise HTTPException(status_code=500, detail="ORGANIZATION_ID not set.")
+        loaded = read_cache.get(
+            ("projects", org_id, folderName, includeSubfolders),
+            lambda: _load_projects(org_id, folderName, includeSubfolders),
+        )
+        if loaded is None:
+            raise HTTPException(status_code=404, detail="No cached project data found. The data sync job may not have run yet.")
+        project_ids = [p["project_id"] for p in loaded["projects"]]
+    else:
+        raise HTTPException(status_code=400, detail="Either projectIds or folderName is required.")
+    if len(project_ids) > DASHBOARD_BATCH_MAX_PROJECTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{len(project_ids)} projects requested, at most {DASHBOARD_BATCH_MAX_PROJECTS} are allowed per request.",
+        )
+    logging.info(f"Fetching dashboard data for {len(project_ids)} projects.")
+
+    def stream():
+        for project_id, data in iter_dashboard_data(project_ids):
+            data = _strip_dashboard(data)
+            if data:
+                line = {"project_id": project_id, "data": data}
+            else:
+                line = {"project_id": project_id, "detail": "Dashboard data not found. The data sync job may not have run yet."}
+            yield json.dumps(jsonable_encoder(line)) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/api/dashboard/{project_id}/org_policies/{constraint}")
+def get_org_policy(project_id: str, constraint: str):
+    """Retrieves the full org policy behind a project's org policy entry."""
+    logging.info(f"Fetching org policy {constraint} for project: {project_id}")
+    policy = get_org_policy_details(project_id, constraint)
+    if policy:
+        return policy
+    else:
+        raise HTTPException(status_code=404, detail="Org policy details not found. The data sync job may not have run yet.")
+
+def _load_folder_graph(org_id: str):
+    graph = read_cache.get(("folder_graph", org_id), lambda: get_folder_graph(org_id))
+    if not graph:
+        raise HTTPException(status_code=404, detail="No cached folder graph found. The data sync job may not have run yet.")
+    return graph
+
+def _folder_scope(org_id: str, folderName: str, includeSubfolders: bool):
+    """
+    Returns the display names of the folders whose projects to load and, with includeSubfolders,
+    the ids of the folders named folderName and all their descendant folders (None otherwise).
+    """
+    if not includeSubfolders:
+        return [folderName], None
+    graph = _load_folder_graph(org_id)
+    matched = [name for name, folder in graph["folders"].items() if folder["display_name"] == folderName]
+    folder_ids = descendant_folders(graph, matched)
+    return {graph["folders"][name]["display_name"] for name in folder_ids}, folder_ids
+
+def _load_projects(org_id: str, folderName: str, includeSubfolders: bool):
+    """
+    Returns {"etag", "projects"} with the organization's projects, or those of a folder, or None
+    if there is no cached project list.
+    """
+    # With a folder filter, only the shards holding the folders' projects are read.
+    folder_names, folder_ids = _folder_scope(org_id, folderName, includeSubfolders) if folderName else (None, None)
+    data = get_projects_data(org_id, folder_names)
+    if not data or "projects" not in data:
+        return None
+
+    projects = data["projects"]
+    if folder_ids is not None:
+        projects = [p for p in projects if folder_ids.intersection(p.get("ancestry", []))]
+    if folderName:
+        logging.info(f"Loaded {len(projects)} projects for folder: {folderName}")
+    return {"etag": _projects_etag(data.get(CONTENT_HASH_FIELD), folderName, includeSubfolders), "projects": projects}
+
+def _projects_etag(content_hash: str, folderName: str, includeSubfolders: bool):
+    return _etag(content_hash, folderName, includeSubfolders) if folderName else _etag(content_hash)
+
+def _projects_not_modified(request: Request, org_id: str, folderName: str, includeSubfolders: bool):
+    """Returns the 304 response for a revalidation of an unchanged project list, or None."""
+    if not request.headers.get("if-none-match"):
+        return None
+    # Only the manifest's content hash is read, not the project list.
+    read_cache.check_generation(force=True)
+    content_hash = read_cache.get(("projects_hash", org_id), lambda: get_content_hash(PROJECTS_KIND, org_id))
+    etag = _projects_etag(content_hash, folderName, includeSubfolders)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=_cache_headers(etag))
+    return None
+
+@app.get("/api/folders")
+def list_folders(folderName: str = None):
+    """Lists the organization's folders from the cached folder graph, optionally only a folder and its descendants."""
+    org_id = os.getenv("ORGANIZATION_ID")
+    if not org_id:
+        raise HTTPException(status_code=500, detail="ORGANIZATION_ID not set.")
+
+    graph = _load_folder_graph(org_id)
+    folders = graph["folders"]
+    if folderName:
+        selected = descendant_folders(graph, [name for name, folder in folders.items() if folder["display_name"] == folderName])
+        folders = {name: folder for name, folder in folders.items() if name in selected}
+    return [
+        {"name": name, "display_name": folder["display_name"], "parent": folder["parent"]}
+        for name, folder in folders.items()
+    ]
+
 @app.get("/api/projects")
-def list_projects(folderName: str = None):
+def list_projects(request: Request, response: Response, folderName: str = None, includeSubfolders: bool = False):
     """Lists all projects, optionally filtered by folder name."""
     logging.debug(f"API call to /api/projects received with folderName='{folderName}'")
     org_id = os.getenv("ORGANIZATION_ID")
     if not org_id:
         raise HTTPException(status_code=500, detail="ORGANIZATION_ID not set.")
 
+    not_modified = _projects_not_modified(request, org_id, folderName, includeSubfolders)
+    if not_modified:
+        return not_modified
+
     logging.info("Fetching projects from Datastore cache.")
-    data = get_projects_data(org_id)
+    loaded = read_cache.get(
+        ("projects", org_id, folderName or None, includeSubfolders),
+        lambda: _load_projects(org_id, folderName, includeSubfolders),
+    )
 
-    if not data or "projects" not in data:
+    if loaded is None:
         raise HTTPException(status_code=404, detail="No cached project data found. The data sync job may not have run yet.")
 
-    projects = data["projects"]
+    projects = loaded["projects"]
     logging.debug(f"Found {len(projects)} projects in cache.")
-
-    if folderName:
-        logging.info(f"Filtering projects for folder: {folderName}")
-        filtered_projects = [p for p in projects if p.get("folder_name") == folderName]
-        logging.debug(f"Found {len(filtered_projects)} projects in folder '{folderName}'.")
-        return filtered_projects
-
+    response.headers.update(_cache_headers(loaded["etag"]))
     return projects
 
-@app.get("/api/projects")
-def list_projects(folderName: str = None):
-    """Lists all projects in the organization, optionally filtered by folder or region."""
-    logging.debug(f"API call to /api/projects received with folderName='{folderName}'")
+def _rollup_controls(rollup: dict, group: dict, controls: list):
+    """Returns {control: {status: project count}} of a rollup group for the given control indexes, without zero counts."""
+    statuses = rollup["statuses"]
+    counts = group["counts"]
+    expanded = {}
+    for c in controls:
+        row = counts[c * len(statuses):(c + 1) * len(statuses)]
+        expanded[rollup["controls"][c]] = {status: count for status, count in zip(statuses, row) if count}
+    return expanded
+
+@app.get("/api/rollups")
+def get_rollups(control: str = None, folderName: str = None):
+    """
+    Returns the org-wide compliance rollup computed by the last sync run: the number of projects
+    per control and status, in total, per folder (counting every project below it) and per
+    environment. control ("<section>/<name>" or just the name) and folderName narrow it down.
+    """
     org_id = os.getenv("ORGANIZATION_ID")
     if not org_id:
         raise HTTPException(status_code=500, detail="ORGANIZATION_ID not set.")
 
-    logging.info("Fetching projects from Datastore cache.")
-    data = get_projects_data(org_id)
-
-    if not data or "projects" not in data:
-        raise HTTPException(status_code=404, detail="No cached project data found. Please refresh first.")
+    rollup = read_cache.get(("rollup", org_id), lambda: get_compliance_rollup(org_id))
+    if not rollup:
+        raise HTTPException(status_code=404, detail="No compliance rollup found. The data sync job may not have run yet.")
 
-    projects = data["projects"]
-    logging.debug(f"Found {len(projects)} projects in cache.")
+    controls = [
+        i for i, name in enumerate(rollup["controls"])
+        if not control or control in (name, name.split("/", 1)[-1])
+    ]
+    if control and not controls:
+        raise HTTPException(status_code=404, detail=f"Control {control} not found in the compliance rollup.")
+    folders = [
+        {"name": name, "display_name": folder["display_name"], "projects": folder["projects"], "controls": _rollup_controls(rollup, folder, controls)}
+        for name, folder in rollup["folders"].items()
+        if not folderName or folder["display_name"] == folderName
+    ]
+    return {
+        "generated_at": rollup["generated_at"],
+        "projects": rollup["projects"],
+        "projects_without_data": rollup["projects_without_data"],
+        "totals": {"projects": rollup["totals"]["projects"], "controls": _rollup_controls(rollup, rollup["totals"], controls)},
+        "folders": folders,
+        "environments": {
+            environment: {"projects": group["projects"], "controls": _rollup_controls(rollup, group, controls)}
+            for environment, group in rollup["environments"].items()
+        },
+    }
 
-    if folderName:
-        logging.info(f"Filtering projects for folder: {folderName}")
-        filtered_projects = [p for p in projects if p.get("folder_name") == folderName]
-        logging.debug(f"Found {len(filtered_projects)} projects in folder '{folderName}'.")
-        return filtered_projects
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Returns the hit, miss and eviction counters of the in-process read cache."""
+    return read_cache.get_stats()
 
-    return projects
+@app.get("/api/datastore/stats")
+def get_datastore_client_stats():
+    """Returns the Datastore client pool's size and per-method call counts and latencies."""
+    return get_datastore_stats()
 
 @app.post("/api/summarize")
 async def summarize_data(request: Request):
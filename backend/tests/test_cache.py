@@ -0,0 +1,133 @@
+import unittest
+import os
+import threading
+
+# Add the parent directory to the Python path to allow module imports
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cache import ReadThroughCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestReadThroughCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_hit_after_miss(self):
+        """Test that a value is loaded once and then served from the cache."""
+        cache = ReadThroughCache(clock=self.clock)
+        loads = []
+        loader = lambda: loads.append(1) or {'key': 'value'}
+        self.assertEqual(cache.get('p1', loader), {'key': 'value'})
+        self.assertEqual(cache.get('p1', loader), {'key': 'value'})
+        self.assertEqual(len(loads), 1)
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_ttl_expiry(self):
+        """Test that an entry is loaded again once its TTL has passed."""
+        cache = ReadThroughCache(ttl_seconds=10, clock=self.clock)
+        cache.get('p1', lambda: 'old')
+        self.clock.now = 11
+        self.assertEqual(cache.get('p1', lambda: 'new'), 'new')
+        self.assertEqual(cache.get_stats()['expirations'], 1)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted when the cache is full."""
+        cache = ReadThroughCache(max_entries=2, clock=self.clock)
+        cache.get('p1', lambda: 1)
+        cache.get('p2', lambda: 2)
+        cache.get('p1', lambda: 1)
+        cache.get('p3', lambda: 3)
+        self.assertEqual(cache.get('p1', lambda: 'reloaded'), 1)
+        self.assertEqual(cache.get('p2', lambda: 'reloaded'), 'reloaded')
+        self.assertEqual(cache.get_stats()['evictions'], 2)
+
+    def test_none_is_not_cached(self):
+        """Test that missing data is looked up again on the next request."""
+        cache = ReadThroughCache(clock=self.clock)
+        self.assertIsNone(cache.get('p1', lambda: None))
+        self.assertEqual(cache.get('p1', lambda: 'found'), 'found')
+
+    def test_concurrent_misses_are_single_flighted(self):
+        """Test that concurrent misses for the same key share one load."""
+        cache = ReadThroughCache(clock=self.clock)
+        started, release = threading.Event(), threading.Event()
+        loads = []
+
+        def loader():
+            loads.append(1)
+            started.set()
+            release.wait(5)
+            return 'value'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get('p1', loader)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(cache.get('p1', loader))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        while cache.get_stats()['coalesced'] < 3:
+            pass
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        self.assertEqual(results, ['value'] * 4)
+        self.assertEqual(len(loads), 1)
+
+    def test_loader_error_is_not_cached(self):
+        """Test that a failed load raises and is retried by the next request."""
+        cache = ReadThroughCache(clock=self.clock)
+
+        def failing():
+            raise RuntimeError('Datastore unavailable')
+
+        with self.assertRaises(RuntimeError):
+            cache.get('p1', failing)
+        self.assertEqual(cache.get('p1', lambda: 'value'), 'value')
+
+    def test_generation_change_invalidates(self):
+        """Test that a new sync generation drops every cached entry."""
+        generation = ['run-1']
+        cache = ReadThroughCache(generation_loader=lambda: generation[0], generation_check_seconds=5, clock=self.clock)
+        cache.get('p1', lambda: 'old')
+        generation[0] = 'run-2'
+        # Not checked again before generation_check_seconds have passed.
+        self.assertEqual(cache.get('p1', lambda: 'new'), 'old')
+        self.clock.now = 6
+        self.assertEqual(cache.get('p1', lambda: 'new'), 'new')
+        stats = cache.get_stats()
+        self.assertEqual((stats['invalidations'], stats['generation']), (1, 'run-2'))
+
+    def test_forced_generation_check(self):
+        """Test that a forced check reads the generation marker before generation_check_seconds have passed."""
+        generation = ['run-1']
+        cache = ReadThroughCache(generation_loader=lambda: generation[0], generation_check_seconds=5, clock=self.clock)
+        cache.get('p1', lambda: 'old')
+        generation[0] = 'run-2'
+        cache.check_generation(force=True)
+        self.assertEqual(cache.get('p1', lambda: 'new'), 'new')
+
+    def test_load_across_invalidation_is_not_stored(self):
+        """Test that a value loaded before an invalidation is returned but not cached."""
+        cache = ReadThroughCache(clock=self.clock)
+
+        def loader():
+            cache.invalidate()
+            return 'stale'
+
+        self.assertEqual(cache.get('p1', loader), 'stale')
+        self.assertEqual(cache.get('p1', lambda: 'fresh'), 'fresh')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,8 @@ import unittest
 from unittest.mock import patch, MagicMock
 import os
 import importlib
+import json
+import zlib
 
 # Add the parent directory to the Python path to allow module imports
 import sys
@@ -27,6 +29,36 @@ class TestDatastoreClient(unittest.TestCase):
         datastore_client.get_datastore_client()
         MockDatastoreClient.assert_called_once_with(project='test-datastore-project')
 
+    @patch('datastore_client.datastore.Client')
+    def test_get_datastore_client_is_reused(self, MockDatastoreClient):
+        """Test that requests share one long-lived client until the pool is closed."""
+        first = datastore_client.get_datastore_client()
+        second = datastore_client.get_datastore_client()
+        self.assertIs(first, second)
+        MockDatastoreClient.assert_called_once_with(project='test-datastore-project')
+
+        datastore_client.close_datastore_clients()
+        MockDatastoreClient.return_value.close.assert_called_once()
+        datastore_client.get_datastore_client()
+        self.assertEqual(MockDatastoreClient.call_count, 2)
+
+    @patch('datastore_client.datastore.Client')
+    def test_datastore_latency_is_recorded(self, MockDatastoreClient):
+        """Test that every timed call of a pooled client is counted, including failures."""
+        MockDatastoreClient.return_value.put.side_effect = RuntimeError('unavailable')
+        datastore_client.open_datastore_clients()
+        client = datastore_client.get_datastore_client()
+        client.get('key')
+        client.get('key')
+        client.key('kind', 'name')
+        with self.assertRaises(RuntimeError):
+            client.put('entity')
+        stats = datastore_client.get_datastore_stats()
+        self.assertEqual(stats['open_clients'], 1)
+        self.assertEqual((stats['methods']['get']['calls'], stats['methods']['get']['errors']), (2, 0))
+        self.assertEqual((stats['methods']['put']['calls'], stats['methods']['put']['errors']), (1, 1))
+        self.assertNotIn('key', stats['methods'])
+
     @patch('datastore_client.get_datastore_client')
     def test_save_dashboard_data_success(self, mock_get_client):
         """Test that data is saved to Datastore correctly."""
@@ -57,6 +89,73 @@ class TestDatastoreClient(unittest.TestCase):
         result = datastore_client.get_dashboard_data('test-id')
         self.assertIsNone(result)
 
+    @patch('datastore_client.get_datastore_client')
+    def test_get_org_policy_details_found(self, mock_get_client):
+        """Test that a constraint's full policy is decoded from the compressed details blob."""
+        mock_client = MagicMock()
+        policy = {'policy': {'name': 'projects/test-id/policies/run.allowedIngress', 'spec': {'rules': [{'enforce': True}]}}}
+        blob = zlib.compress(json.dumps({'run.allowedIngress': policy}).encode('utf-8'))
+        mock_client.get.return_value = {datastore_client.ORG_POLICY_DETAILS_FIELD: blob}
+        mock_get_client.return_value = mock_client
+        result = datastore_client.get_org_policy_details('test-id', 'run.allowedIngress')
+        self.assertEqual(result, policy)
+        self.assertIsNone(datastore_client.get_org_policy_details('test-id', 'storage.restrictAuthTypes'))
+
+    @patch('datastore_client.get_datastore_client')
+    def test_get_org_policy_details_without_blob(self, mock_get_client):
+        """Test that None is returned when the data has no org policy details."""
+        mock_client = MagicMock()
+        mock_client.get.return_value = {'org_policies': []}
+        mock_get_client.return_value = mock_client
+        self.assertIsNone(datastore_client.get_org_policy_details('test-id', 'run.allowedIngress'))
+
+    @patch('datastore_client.get_datastore_client')
+    def test_iter_dashboard_data(self, mock_get_client):
+        """Test that dashboards are looked up in chunks, with None for missing projects and failed lookups."""
+        mock_client = MagicMock()
+        mock_client.key.side_effect = lambda kind, name: datastore_client.datastore.Key(kind, name, project='test')
+
+        def get_multi(keys):
+            if keys[0].name == 'p4':
+                raise RuntimeError('Datastore unavailable')
+            entities = []
+            for key in keys:
+                if key.name != 'p1':
+                    entity = datastore_client.datastore.Entity(key=key)
+                    entity['org_policies'] = [key.name]
+                    entities.append(entity)
+            return entities
+
+        mock_client.get_multi.side_effect = get_multi
+        mock_get_client.return_value = mock_client
+        with patch.object(datastore_client, 'DASHBOARD_BATCH_LOOKUP_SIZE', 2):
+            result = dict(datastore_client.iter_dashboard_data(['p0', 'p1', 'p2', 'p3', 'p4']))
+        self.assertEqual(result, {
+            'p0': {'org_policies': ['p0']}, 'p1': None, 'p2': {'org_policies': ['p2']}, 'p3': {'org_policies': ['p3']}, 'p4': None,
+        })
+        self.assertEqual(mock_client.get_multi.call_count, 3)
+        mock_client.get.assert_not_called()
+
+    @patch('datastore_client.get_datastore_client')
+    def test_get_content_hash_found(self, mock_get_client):
+        """Test that the content hash is read with a projection query on the entity's key."""
+        mock_client = MagicMock()
+        mock_query = mock_client.query.return_value
+        mock_query.fetch.return_value = iter([{'content_hash': 'abc123'}])
+        mock_get_client.return_value = mock_client
+        self.assertEqual(datastore_client.get_content_hash(datastore_client.DATASTORE_KIND, 'test-id'), 'abc123')
+        mock_client.query.assert_called_once_with(kind=datastore_client.DATASTORE_KIND, projection=['content_hash'])
+        mock_query.key_filter.assert_called_once_with(mock_client.key.return_value, '=')
+        mock_client.get.assert_not_called()
+
+    @patch('datastore_client.get_datastore_client')
+    def test_get_content_hash_not_found(self, mock_get_client):
+        """Test that None is returned when the entity has no content hash."""
+        mock_client = MagicMock()
+        mock_client.query.return_value.fetch.return_value = iter([])
+        mock_get_client.return_value = mock_client
+        self.assertIsNone(datastore_client.get_content_hash(datastore_client.PROJECTS_KIND, '123'))
+
     def test_datastore_project_id_not_set(self):
         """Test that a RuntimeError is raised if the environment variable is not set."""
         self.patcher.stop() # Stop the default patcher
@@ -81,5 +180,118 @@ class TestDatastoreClient(unittest.TestCase):
         mock_client.key.assert_called_once_with(datastore_client.PROJECTS_KIND, org_id)
         mock_client.put.assert_called_once()
 
+    def _sharded_client(self, shards, folder_shards):
+        """Returns a mock client holding a project list manifest and its zlib-compressed shards."""
+        mock_client = MagicMock()
+        mock_client.key.side_effect = lambda kind, name: datastore_client.datastore.Key(kind, name, project='test')
+        mock_client.get.return_value = {
+            'shards': len(shards), 'count': sum(len(s) for s in shards), 'generation': 'g1',
+            'folder_shards': json.dumps(folder_shards),
+        }
+        stored = {
+            f'123:g1:{i}': zlib.compress(json.dumps(shard).encode('utf-8')) for i, shard in enumerate(shards)
+        }
+
+        def get_multi(keys):
+            entities = []
+            for key in keys:
+                entity = datastore_client.datastore.Entity(key=key)
+                entity['data'] = stored[key.name]
+                entities.append(entity)
+            return list(reversed(entities))
+
+        mock_client.get_multi.side_effect = get_multi
+        return mock_client
+
+    @patch('datastore_client.get_datastore_client')
+    def test_get_projects_data_reassembles_shards(self, mock_get_client):
+        """Test that a sharded project list is read back in order from all its shards."""
+        shards = [[{'project_id': f'p{i}', 'folder_name': 'a'} for i in range(3)],
+                  [{'project_id': f'p{i}', 'folder_name': 'b'} for i in range(3, 6)]]
+        mock_get_client.return_value = self._sharded_client(shards, {'a': [0], 'b': [1]})
+        result = datastore_client.get_projects_data('123')
+        self.assertEqual([p['project_id'] for p in result['projects']], [f'p{i}' for i in range(6)])
+
+    @patch('datastore_client.get_datastore_client')
+    def test_get_projects_data_loads_only_folder_shards(self, mock_get_client):
+        """Test that a folder filter only reads the shards holding that folder's projects."""
+        shards = [[{'project_id': 'p0', 'folder_name': 'a'}, {'project_id': 'p1', 'folder_name': 'b'}],
+                  [{'project_id': 'p2', 'folder_name': 'c'}]]
+        mock_client = self._sharded_client(shards, {'a': [0], 'b': [0], 'c': [1]})
+        mock_get_client.return_value = mock_client
+        result = datastore_client.get_projects_data('123', ['b'])
+        self.assertEqual(result['projects'], [{'project_id': 'p1', 'folder_name': 'b'}])
+        requested = [key.name for call in mock_client.get_multi.call_args_list for key in call.args[0]]
+        self.assertEqual(requested, ['123:g1:0'])
+
+    @patch('datastore_client.get_datastore_client')
+    def test_get_projects_data_single_entity(self, mock_get_client):
+        """Test that a project list stored in a single entity is still read and filtered."""
+        mock_client = MagicMock()
+        mock_client.get.return_value = {'projects': [{'project_id': 'p0', 'folder_name': 'a'}, {'project_id': 'p1'}]}
+        mock_get_client.return_value = mock_client
+        result = datastore_client.get_projects_data('123', ['a'])
+        self.assertEqual(result['projects'], [{'project_id': 'p0', 'folder_name': 'a'}])
+        mock_client.get_multi.assert_not_called()
+
+    @patch('datastore_client.get_datastore_client')
+    def test_get_folder_graph(self, mock_get_client):
+        """Test that the folder graph is reassembled from the chunks of its current generation and decoded."""
+        graph = {'root': 'organizations/1', 'folders': {'folders/2': {'display_name': 'a', 'parent': 'organizations/1'}}}
+        payload = zlib.compress(json.dumps(graph).encode('utf-8'))
+        chunks = {'1:g1:0': payload[:10], '1:g1:1': payload[10:]}
+        mock_client = MagicMock()
+        mock_client.key.side_effect = lambda kind, name: datastore_client.datastore.Key(kind, name, project='test')
+        mock_client.get.return_value = {'chunks': 2, 'size': len(payload), 'generation': 'g1'}
+
+        def get_multi(keys):
+            entities = []
+            for key in keys:
+                entity = datastore_client.datastore.Entity(key=key)
+                entity['data'] = chunks[key.name]
+                entities.append(entity)
+            return entities
+
+        mock_client.get_multi.side_effect = get_multi
+        mock_get_client.return_value = mock_client
+        self.assertEqual(datastore_client.get_folder_graph('1'), graph)
+
+    @patch('datastore_client.get_datastore_client')
+    def test_get_compliance_rollup(self, mock_get_client):
+        """Test that the compliance rollup is read with one get and one get_multi, whatever the project count."""
+        rollup = {'projects': 5000, 'controls': ['org_policies/compute.vmExternalIpAccess'], 'statuses': ['Disabled', 'Enabled'],
+                  'totals': {'projects': 5000, 'counts': [3000, 2000]}, 'folders': {}, 'environments': {}}
+        payload = zlib.compress(json.dumps(rollup).encode('utf-8'))
+        mock_client = MagicMock()
+        mock_client.key.side_effect = lambda kind, name: datastore_client.datastore.Key(kind, name, project='test')
+        mock_client.get.return_value = {'chunks': 1, 'size': len(payload)}
+        entity = datastore_client.datastore.Entity(key=datastore_client.datastore.Key(datastore_client.COMPLIANCE_ROLLUP_KIND, '1:0', project='test'))
+        entity['data'] = payload
+        mock_client.get_multi.return_value = [entity]
+        mock_get_client.return_value = mock_client
+        self.assertEqual(datastore_client.get_compliance_rollup('1'), rollup)
+        mock_client.get.assert_called_once()
+        mock_client.get_multi.assert_called_once()
+
+    @patch('datastore_client.get_datastore_client')
+    def test_get_compliance_rollup_not_found(self, mock_get_client):
+        """Test that None is returned before the sync job has written a rollup."""
+        mock_client = MagicMock()
+        mock_client.get.return_value = None
+        mock_get_client.return_value = mock_client
+        self.assertIsNone(datastore_client.get_compliance_rollup('1'))
+        mock_client.get_multi.assert_not_called()
+
+    def test_descendant_folders(self):
+        """Test that a folder's descendants are found at every depth, and nothing else."""
+        graph = {'folders': {
+            'folders/2': {'parent': 'organizations/1'},
+            'folders/3': {'parent': 'folders/2'},
+            'folders/4': {'parent': 'folders/3'},
+            'folders/5': {'parent': 'organizations/1'},
+        }}
+        self.assertEqual(datastore_client.descendant_folders(graph, ['folders/2']), {'folders/2', 'folders/3', 'folders/4'})
+        self.assertEqual(datastore_client.descendant_folders(graph, []), set())
+
 if __name__ == '__main__':
     unittest.main()
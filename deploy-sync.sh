@@ -23,6 +23,7 @@ export AR_REPO_NAME="${AR_REPO_NAME:-gcp-data-sync-repo}"         # Artifact Reg
 export JOB_NAME="${JOB_NAME:-gcp-data-sync-job}"               # Cloud Run job name
 export SCHEDULER_JOB_NAME="${SCHEDULER_JOB_NAME:-gcp-data-sync-scheduler}" # Cloud Scheduler job name
 export SERVICE_ACCOUNT_EMAIL="${SERVICE_ACCOUNT_EMAIL:-1088176764975-compute@developer.gserviceaccount.com}"  # Service account for the job
+export JOB_TASKS="${JOB_TASKS:-1}"                               # Number of parallel shards (Cloud Run tasks) per execution
 
 # 1. Check if required variables are set
 if [[ -z "$GCP_PROJECT_ID" || -z "$GCP_REGION" || -z "$SERVICE_ACCOUNT_EMAIL" ]]; then
@@ -107,6 +108,8 @@ if [ -f $TEMP_ENV_FILE ]; then
         --region $GCP_REGION \
         --service-account=$SERVICE_ACCOUNT_EMAIL \
         --env-vars-file=$TEMP_ENV_FILE \
+        --tasks=$JOB_TASKS \
+        --parallelism=$JOB_TASKS \
         --task-timeout=3600 # 1 hour timeout, adjust as needed
     # Clean up the temporary file
     rm $TEMP_ENV_FILE
@@ -116,6 +119,8 @@ else
         --image $IMAGE_TAG \
         --region $GCP_REGION \
         --service-account=$SERVICE_ACCOUNT_EMAIL \
+        --tasks=$JOB_TASKS \
+        --parallelism=$JOB_TASKS \
         --task-timeout=3600 # 1 hour timeout, adjust as needed
 fi
 
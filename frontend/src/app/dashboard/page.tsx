@@ -292,13 +292,14 @@ function Home() {
   const pageRef = useRef(null);
   const projectId = searchParams.get('project_id');
 
-  const fetchData = useCallback(async (projectId: string) => {
+  const fetchData = useCallback(async (projectId: string, revalidate = false) => {
     setLoading(true);
     setError(null);
     setAllControls(null);
     try {
       console.log(`Fetching data for project: ${projectId}`);
-      const response = await fetch(`${BACKEND_URL}/api/dashboard/${projectId}`);
+      // The browser reuses a cached copy while it is fresh; a refresh revalidates it with its ETag.
+      const response = await fetch(`${BACKEND_URL}/api/dashboard/${projectId}`, { cache: revalidate ? 'no-cache' : 'default' });
       if (!response.ok) {
         const errorData = await response.json();
         throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
@@ -312,13 +313,13 @@ function Home() {
 
       const controls: Control[] = [];
 
-      // Preventative: Org Policies
+      // Preventative: Org Policies (details are a compact summary object, or an error message)
       (data.org_policies || []).forEach((p: any) => {
         controls.push({
           name: p.name,
           status: p.status,
           controlType: 'Org Policy',
-          details: p.details,
+          details: typeof p.details === 'string' ? p.details : JSON.stringify(p.details, null, 2),
         });
       });
 
@@ -404,7 +405,7 @@ function Home() {
 
   const handleRefresh = () => {
     if (projectId) {
-      fetchData(projectId);
+      fetchData(projectId, true);
     }
   };
 
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+from functools import partial
+from dotenv import load_dotenv
+from .clients import create_async_client
+from .executor import run_ordered_async
+from .negative_cache import call_project_api_async, load_negative_cache
+from .rate_limiter import call_api_async
+
+load_dotenv()
+
+# --- Configuration ---
+# ASYNC_COLLECTORS runs every collector on one event loop with the async GCP clients instead
+# of worker threads with blocking clients. ASYNC_MAX_PROJECTS bounds the projects collected at
+# once and ASYNC_MAX_IN_FLIGHT the API requests in flight across all of them; the per-API
+# rate limiters still apply on top.
+ASYNC_COLLECTORS = os.getenv("ASYNC_COLLECTORS", "false").lower() == "true"
+ASYNC_MAX_PROJECTS = int(os.getenv("ASYNC_MAX_PROJECTS", 500))
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", 2000))
+
+
+class AsyncCollectorContext:
+    """
+    The async clients and the in-flight request semaphore shared by every project in one
+    pipeline run. Async clients are bound to the event loop, so the context must be created
+    and closed on the loop that uses it.
+    """
+
+    def __init__(self, max_in_flight: int = ASYNC_MAX_IN_FLIGHT):
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.clients = {}
+
+    def client(self, name: str):
+        """Returns this run's async client registered under name, creating it on first use."""
+        client = self.clients.get(name)
+        if client is None:
+            client = self.clients[name] = create_async_client(name)
+        return client
+
+    async def call(self, api: str, func, *args, **kwargs):
+        """Awaits an API call through call_api_async, holding an in-flight slot."""
+        async with self.semaphore:
+            return await call_api_async(api, func, *args, **kwargs)
+
+    async def call_project(self, project_id: str, api: str, func, *args, **kwargs):
+        """Awaits a project-scoped API call through the negative cache, holding an in-flight slot."""
+        async with self.semaphore:
+            return await call_project_api_async(project_id, api, func, *args, **kwargs)
+
+    async def close(self):
+        for name, client in self.clients.items():
+            try:
+                await client.transport.close()
+            except Exception as e:
+                logging.warning(f"Failed to close async GCP client {name}: {e}")
+        self.clients.clear()
+
+
+async def _run_pipeline(collect, projects, max_projects, timeout, on_error, on_result):
+    # The negative cache is loaded with a blocking query; do it before any project starts.
+    await asyncio.to_thread(load_negative_cache)
+    ctx = AsyncCollectorContext()
+    try:
+        return await run_ordered_async(
+            partial(collect, ctx), projects,
+            max_workers=max_projects, timeout=timeout, on_error=on_error, on_result=on_result,
+        )
+    finally:
+        await ctx.close()
+
+
+def run_async_pipeline(collect, projects, max_projects: int = ASYNC_MAX_PROJECTS, timeout: float = None,
+                       on_error=None, on_result=None):
+    """
+    Collects projects on a single event loop.
+
+    Args:
+        collect: A coroutine function called as collect(ctx, project), e.g.
+            tasks.collect_single_project_data_async.
+        projects: The project dicts.
+        max_projects: Upper bound on projects collected concurrently.
+        timeout, on_error, on_result: As for executor.run_ordered.
+
+    Returns:
+        A list of results in the same order as projects.
+    """
+    return asyncio.run(_run_pipeline(collect, projects, max_projects, timeout, on_error, on_result))
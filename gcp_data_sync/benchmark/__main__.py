@@ -0,0 +1,105 @@
+import argparse
+import json
+import logging
+import os
+import sys
+
+# Offline benchmark of the sync job.
+#
+#   python -m gcp_data_sync.benchmark generate --projects 10000 --output org.json.gz
+#   python -m gcp_data_sync.benchmark record --output org.json.gz [--max-projects 200]
+#   python -m gcp_data_sync.benchmark run --fixture org.json.gz [--latency-ms 80 --error-rate 0.01 --throttle-rate 0.02]
+#   python -m gcp_data_sync.benchmark run --projects 10000 --output result.json --fail-below 2000
+#
+# The job's own settings (ASYNC_COLLECTORS, MAX_WORKERS, SYNC_EXECUTOR, <API>_QPS, INCREMENTAL_SYNC,
+# DEFERRED_RETRY_BACKOFF_SECONDS, ...) are read from the environment as usual.
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m gcp_data_sync.benchmark", description="Offline benchmark of the sync job.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Generate a synthetic organization fixture.")
+    generate.add_argument("--output", required=True, help="Fixture path (.json or .json.gz).")
+
+    record = commands.add_parser("record", help="Record a fixture from the real organization (ORGANIZATION_ID).")
+    record.add_argument("--output", required=True, help="Fixture path (.json or .json.gz).")
+    record.add_argument("--max-projects", type=int, help="Only collect, and keep, this many projects.")
+
+    run = commands.add_parser("run", help="Run the sync job against a fixture and an in-memory Datastore.")
+    run.add_argument("--fixture", help="Fixture to replay. Without it, a synthetic organization is generated.")
+    run.add_argument("--latency-ms", type=float, default=0.0, help="Mean latency of every fake API request.")
+    run.add_argument("--latency-jitter", type=float, default=0.5, help="Latency varies uniformly within this fraction of the mean.")
+    run.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with a transient error.")
+    run.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests failing with a 429.")
+    run.add_argument("--listing-faults", action="store_true", help="Inject failures into the org listing calls too.")
+    run.add_argument("--page-size", type=int, default=100, help="Items per page of fake listings.")
+    run.add_argument("--datastore-latency-ms", type=float, default=0.0, help="Latency of every in-memory Datastore call.")
+    run.add_argument("--runs", type=int, default=1, help="Run the job this many times against the same Datastore.")
+    run.add_argument("--output", help="Write the results as JSON to this path.")
+    run.add_argument("--fail-below", type=float, help="Exit with status 1 if the last run's throughput (projects/min) is lower.")
+
+    for command in (generate, run):
+        command.add_argument("--projects", type=int, default=10000, help="Projects in the synthetic organization.")
+        command.add_argument("--folder-depth", type=int, default=5)
+        command.add_argument("--folder-fanout", type=int, default=5)
+        command.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the sync job while it runs.")
+    return parser.parse_args(argv)
+
+
+def _generate(args):
+    from .synthetic_org import generate_org
+    return generate_org(args.projects, folder_depth=args.folder_depth, folder_fanout=args.folder_fanout, seed=args.seed)
+
+
+def main(argv=None):
+    args = _parse_args(argv if argv is not None else sys.argv[1:])
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # The sync modules refuse to import without a Datastore project; the benchmark never uses it.
+    os.environ.setdefault("DASHBOARD_GCP_PROJECT_ID", "benchmark")
+
+    if args.command == "generate":
+        _generate(args).save(args.output)
+        return 0
+
+    if args.command == "record":
+        from .fixtures import record_fixture
+        record_fixture(args.output, args.max_projects)
+        return 0
+
+    from .fake_clients import LISTING_METHODS, FaultInjector
+    from .fixtures import Fixture
+    from .runner import run_benchmark
+    fixture = Fixture.load(args.fixture) if args.fixture else _generate(args)
+    faults = FaultInjector(
+        args.latency_ms, args.latency_jitter, args.error_rate, args.throttle_rate, seed=args.seed,
+        spared_methods=() if args.listing_faults else LISTING_METHODS,
+    )
+    # The job configures logging when it is imported; quiet it down afterwards.
+    from .. import main as _sync_main  # noqa: F401
+    logging.getLogger().setLevel(args.log_level.upper())
+    results = run_benchmark(fixture, faults, args.datastore_latency_ms, args.page_size, args.runs)
+
+    for run in results["runs"]:
+        report = run["report"] or {}
+        fake_api = run["fake_api"]
+        print(
+            f"Run {run['run']}: {report.get('successful', 0)}/{report.get('projects', 0)} projects in {run['wall_seconds']}s "
+            f"({report.get('throughput_per_minute', 0)} projects/min), {fake_api['requests']} API requests "
+            f"({fake_api['injected_errors']} injected errors, {fake_api['injected_throttles']} injected 429s), "
+            f"{run['datastore']['rpcs']} Datastore RPCs, {report.get('failed_count', 0)} failed projects."
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    throughput = (results["runs"][-1]["report"] or {}).get("throughput_per_minute", 0)
+    if args.fail_below is not None and throughput < args.fail_below:
+        print(f"Throughput {throughput} projects/min is below {args.fail_below}.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
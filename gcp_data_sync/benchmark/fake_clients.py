@@ -0,0 +1,297 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from google.api_core import exceptions
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import orgpolicy_v2
+from .fixtures import (
+    ACCESS_POLICIES_METHOD, DISCOVERY_ITEMS_FIELDS, RECORDED_METHODS, SERVICE_PERIMETERS_METHOD,
+    Fixture, call_key, error_from_json,
+)
+
+# Fake GCP clients that replay a fixture. They implement the same methods as the real sync and
+# async clients (and the Access Context Manager discovery client), so the collectors run
+# unchanged against them, with latency, transient errors and 429s injected by a FaultInjector.
+
+DEFAULT_PAGE_SIZE = 100
+
+# The org listing calls. The listing fails as a whole on any error, so by default only the
+# collectors' calls get injected failures (every call gets the injected latency).
+LISTING_METHODS = ("search_projects", "list_folders", "search_folders")
+
+
+class FaultInjector:
+    """
+    Decides the latency and the injected failure of every fake request (each call, and each
+    page after the first). Latency is uniform within latency_jitter of latency_ms. error_rate
+    requests fail with ServiceUnavailable (a transient error, left to the deferred retry pass)
+    and throttle_rate requests with TooManyRequests (a quota error, retried inline). Failures
+    are only injected into requests of methods outside spared_methods.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, latency_jitter: float = 0.5, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, seed: int = None, spared_methods=LISTING_METHODS):
+        self.latency_ms = latency_ms
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.spared_methods = frozenset(spared_methods or ())
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "injected_errors": 0, "injected_throttles": 0}
+        self.requests_by_method = {}
+
+    def _draw(self, method: str):
+        """Returns (seconds to wait, exception to raise or None) for one request."""
+        with self._lock:
+            self.stats["requests"] += 1
+            self.requests_by_method[method] = self.requests_by_method.get(method, 0) + 1
+            latency = self.latency_ms * (1 + self.latency_jitter * self._random.uniform(-1, 1)) / 1000
+            roll = self._random.random()
+            if method in self.spared_methods:
+                return latency, None
+            if roll < self.throttle_rate:
+                self.stats["injected_throttles"] += 1
+                return latency, exceptions.TooManyRequests(f"Injected quota error for {method}.")
+            if roll < self.throttle_rate + self.error_rate:
+                self.stats["injected_errors"] += 1
+                return latency, exceptions.ServiceUnavailable(f"Injected transient error for {method}.")
+            return latency, None
+
+    def request(self, method: str):
+        latency, error = self._draw(method)
+        if latency > 0:
+            time.sleep(latency)
+        if error:
+            raise error
+
+    async def request_async(self, method: str):
+        latency, error = self._draw(method)
+        if latency > 0:
+            await asyncio.sleep(latency)
+        if error:
+            raise error
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, by_method=dict(self.requests_by_method))
+
+
+class FakeGcp:
+    """
+    The fixture's organization as seen through the APIs: answers a call from its recorded
+    response, decoding each message once. Calls without a recorded response return no items
+    (or raise NotFound for a get), except get_effective_policy, which is evaluated from the
+    recorded list_policies responses along the project's hierarchy.
+    """
+
+    def __init__(self, fixture: Fixture, faults: FaultInjector = None, page_size: int = DEFAULT_PAGE_SIZE):
+        self.fixture = fixture
+        self.faults = faults or FaultInjector()
+        self.page_size = page_size
+        self._decoded = {}
+        self._parents = None
+
+    def response(self, method_name: str, key: str):
+        """Returns the decoded items (paged methods) or message of a call, or raises its recorded error."""
+        cache_key = (method_name, key)
+        decoded = self._decoded.get(cache_key)
+        if decoded is None:
+            decoded = self._decoded[cache_key] = self._decode(method_name, key)
+        if isinstance(decoded, Exception):
+            raise decoded
+        return decoded
+
+    def _decode(self, method_name: str, key: str):
+        method = RECORDED_METHODS[method_name]
+        response = self.fixture.get(method_name, key)
+        if response is None:
+            if method.paged:
+                return []
+            if method_name == "get_effective_policy":
+                return self._effective_policy(key)
+            return exceptions.NotFound(f"{key} not found in the benchmark fixture.")
+        if "error" in response:
+            return error_from_json(response["error"])
+        from_json = method.message_type.from_json
+        if method.paged:
+            return [from_json(json.dumps(item), ignore_unknown_fields=True) for item in response["items"]]
+        return from_json(json.dumps(response["item"]), ignore_unknown_fields=True)
+
+    def _parent_of(self, name: str):
+        if self._parents is None:
+            parents = {}
+            for method_name, name_of in (("search_projects", lambda item: f"projects/{item.get('projectId')}"),
+                                         ("list_folders", lambda item: item.get("name"))):
+                for response in self.fixture.responses.get(method_name, {}).values():
+                    for item in response.get("items", []):
+                        parents[name_of(item)] = item.get("parent")
+            self._parents = parents
+        return self._parents.get(name)
+
+    def _effective_policy(self, name: str):
+        from ..org_policies import _evaluate_effective_rules
+        resource, constraint = name.split("/policies/")
+        nodes = [resource]
+        parent = self._parent_of(resource)
+        while parent:
+            nodes.append(parent)
+            parent = self._parent_of(parent)
+        ancestry_policies = [
+            {policy.name.split("/")[-1]: policy for policy in self.response("list_policies", node)}
+            for node in reversed(nodes)
+        ]
+        return orgpolicy_v2.Policy(
+            name=name, spec=orgpolicy_v2.PolicySpec(rules=_evaluate_effective_rules(constraint, ancestry_policies)),
+        )
+
+    def pages(self, items: list):
+        return [items[start:start + self.page_size] for start in range(0, len(items), self.page_size)] or [[]]
+
+
+class FakePage:
+    """A page of a fake listing; like a list response, it carries the token of the next page, if any."""
+
+    def __init__(self, items: list, next_page_token: str):
+        self.items = items
+        self.next_page_token = next_page_token
+
+
+class FakePager:
+    """Iterates a listing page by page, like the generated clients' pagers; later pages cost a request each."""
+
+    def __init__(self, gcp: FakeGcp, method_name: str, items: list):
+        self._gcp = gcp
+        self._method_name = method_name
+        self._pages = gcp.pages(items)
+        self._response = None
+
+    def __iter__(self):
+        for index, page in enumerate(self._pages):
+            if index:
+                self._gcp.faults.request(self._method_name)
+            self._response = FakePage(page, str(index + 1) if index + 1 < len(self._pages) else "")
+            yield from page
+
+
+class FakeAsyncPager:
+    def __init__(self, gcp: FakeGcp, method_name: str, items: list):
+        self._gcp = gcp
+        self._method_name = method_name
+        self._pages = gcp.pages(items)
+        self._response = None
+
+    async def _iterate(self):
+        for index, page in enumerate(self._pages):
+            if index:
+                await self._gcp.faults.request_async(self._method_name)
+            self._response = FakePage(page, str(index + 1) if index + 1 < len(self._pages) else "")
+            for item in page:
+                yield item
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class _FakeTransport:
+    def close(self):
+        pass
+
+
+class _FakeAsyncTransport:
+    async def close(self):
+        pass
+
+
+class FakeClient:
+    """A fake of one of the generated sync clients registered in clients._CLIENT_FACTORIES."""
+
+    def __init__(self, gcp: FakeGcp, name: str):
+        self._gcp = gcp
+        self._name = name
+        self.transport = _FakeTransport()
+
+    def __getattr__(self, attr):
+        method = RECORDED_METHODS.get(attr)
+        if method is None or method.client != self._name:
+            raise AttributeError(f"{self._name} fake client has no method {attr}")
+
+        def call(*args, **kwargs):
+            self._gcp.faults.request(attr)
+            result = self._gcp.response(attr, call_key(method, args, kwargs))
+            return FakePager(self._gcp, attr, result) if method.paged else result
+
+        return call
+
+
+class FakeAsyncClient:
+    """A fake of one of the generated async clients registered in clients._ASYNC_CLIENT_FACTORIES."""
+
+    def __init__(self, gcp: FakeGcp, name: str):
+        self._gcp = gcp
+        self._name = name
+        self.transport = _FakeAsyncTransport()
+
+    def __getattr__(self, attr):
+        method = RECORDED_METHODS.get(attr)
+        if method is None or method.client != self._name:
+            raise AttributeError(f"{self._name} fake async client has no method {attr}")
+
+        async def call(*args, **kwargs):
+            await self._gcp.faults.request_async(attr)
+            result = self._gcp.response(attr, call_key(method, args, kwargs))
+            return FakeAsyncPager(self._gcp, attr, result) if method.paged else result
+
+        return call
+
+
+class _FakeDiscoveryRequest:
+    def __init__(self, gcp: FakeGcp, method: str, parent: str):
+        self._gcp = gcp
+        self._method = method
+        self._parent = parent
+
+    def execute(self):
+        self._gcp.faults.request(self._method)
+        response = self._gcp.fixture.get(self._method, self._parent) or {"items": []}
+        if "error" in response:
+            raise error_from_json(response["error"])
+        return {DISCOVERY_ITEMS_FIELDS[self._method]: response["items"]}
+
+
+class _FakeDiscoveryCollection:
+    def __init__(self, gcp: FakeGcp, method: str):
+        self._gcp = gcp
+        self._method = method
+
+    def list(self, parent, **kwargs):
+        return _FakeDiscoveryRequest(self._gcp, self._method, parent)
+
+    def list_next(self, previous_request, previous_response):
+        return None
+
+    def servicePerimeters(self):
+        return _FakeDiscoveryCollection(self._gcp, SERVICE_PERIMETERS_METHOD)
+
+
+class FakeAccessContextManager:
+    """A fake of the Access Context Manager discovery client, answering every listing in one page."""
+
+    def __init__(self, gcp: FakeGcp):
+        self._gcp = gcp
+
+    def accessPolicies(self):
+        return _FakeDiscoveryCollection(self._gcp, ACCESS_POLICIES_METHOD)
+
+
+def fake_client_overrides(gcp: FakeGcp) -> dict:
+    """Returns the keyword arguments for clients.client_overrides that make every client a fake of gcp."""
+    names = {method.client for method in RECORDED_METHODS.values()}
+    return {
+        "factories": {name: (lambda credentials, name=name: FakeClient(gcp, name)) for name in names},
+        "async_factories": {name: (lambda credentials, name=name: FakeAsyncClient(gcp, name)) for name in names},
+        "access_context_manager": lambda credentials: FakeAccessContextManager(gcp),
+        "credentials": AnonymousCredentials(),
+    }
@@ -0,0 +1,248 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import httplib2
+from collections import namedtuple
+from google.api_core import exceptions
+from google.cloud import compute_v1, orgpolicy_v2, resourcemanager_v3, securitycentermanagement_v1
+from googleapiclient.errors import HttpError
+
+# A fixture holds the API responses the sync job needs for one organization, keyed by method
+# and by the request field that identifies the call (a parent, a name, a query or a project):
+#
+#   {"version": 1, "org_id": "...",
+#    "responses": {method: {key: {"items": [...]} | {"item": {...}} | {"error": {...}}}}}
+#
+# Proto messages are stored in their JSON form. Fixtures are recorded from a real organization
+# with record_fixture or generated with synthetic_org.generate_org, and replayed by the fake
+# clients in fake_clients.
+
+FIXTURE_VERSION = 1
+
+RecordedMethod = namedtuple("RecordedMethod", ["client", "key_field", "message_type", "paged"])
+
+# Every client method the collectors and the project listing call, by method name.
+RECORDED_METHODS = {
+    "search_projects": RecordedMethod("resourcemanager.projects", "query", resourcemanager_v3.Project, True),
+    "get_project": RecordedMethod("resourcemanager.projects", "name", resourcemanager_v3.Project, False),
+    "list_folders": RecordedMethod("resourcemanager.folders", "parent", resourcemanager_v3.Folder, True),
+    "search_folders": RecordedMethod("resourcemanager.folders", "query", resourcemanager_v3.Folder, True),
+    "get_folder": RecordedMethod("resourcemanager.folders", "name", resourcemanager_v3.Folder, False),
+    "list_policies": RecordedMethod("orgpolicy", "parent", orgpolicy_v2.Policy, True),
+    "get_effective_policy": RecordedMethod("orgpolicy", "name", orgpolicy_v2.Policy, False),
+    "list": RecordedMethod("compute.firewalls", "project", compute_v1.Firewall, True),
+    "list_security_center_services": RecordedMethod(
+        "securitycentermanagement", "parent", securitycentermanagement_v1.SecurityCenterService, True),
+    "list_effective_security_health_analytics_custom_modules": RecordedMethod(
+        "securitycentermanagement", "parent", securitycentermanagement_v1.EffectiveSecurityHealthAnalyticsCustomModule, True),
+}
+
+# The Access Context Manager discovery client returns plain dicts, one page per response.
+ACCESS_POLICIES_METHOD = "accessPolicies.list"
+SERVICE_PERIMETERS_METHOD = "servicePerimeters.list"
+DISCOVERY_ITEMS_FIELDS = {
+    ACCESS_POLICIES_METHOD: "accessPolicies",
+    SERVICE_PERIMETERS_METHOD: "servicePerimeters",
+}
+
+
+def call_key(method: RecordedMethod, args, kwargs) -> str:
+    """Returns the key of a call, read from its request object or from its keyword arguments."""
+    request = kwargs.get("request", args[0] if args else None)
+    if request is not None:
+        return getattr(request, method.key_field)
+    return kwargs[method.key_field]
+
+
+def message_to_json(message) -> dict:
+    return json.loads(type(message).to_json(message, indent=None, always_print_fields_with_no_presence=False))
+
+
+def error_to_json(error: Exception) -> dict:
+    if isinstance(error, HttpError):
+        return {"class": "HttpError", "status": error.resp.status, "message": str(error)}
+    return {"class": type(error).__name__, "message": getattr(error, "message", None) or str(error)}
+
+
+def error_from_json(error: dict) -> Exception:
+    """Rebuilds a recorded error as the exception the real client raised."""
+    if error["class"] == "HttpError":
+        return HttpError(httplib2.Response({"status": error["status"]}), error["message"].encode("utf-8"))
+    klass = getattr(exceptions, error["class"], None)
+    if not (isinstance(klass, type) and issubclass(klass, exceptions.GoogleAPICallError)):
+        klass = exceptions.Unknown
+    return klass(error["message"])
+
+
+class Fixture:
+    """The recorded (or generated) API responses of one organization."""
+
+    def __init__(self, org_id: str, responses: dict = None):
+        self.org_id = org_id
+        self.responses = responses or {}
+        self._lock = threading.Lock()
+
+    def get(self, method: str, key: str):
+        """Returns the response stored for a call, or None."""
+        return self.responses.get(method, {}).get(key)
+
+    def set(self, method: str, key: str, response: dict):
+        with self._lock:
+            self.responses.setdefault(method, {})[key] = response
+
+    def extend(self, method: str, key: str, items: list):
+        """Appends the items of one more page of a paged response."""
+        with self._lock:
+            response = self.responses.setdefault(method, {}).setdefault(key, {"items": []})
+            response.setdefault("items", []).extend(items)
+
+    def count(self, method: str) -> int:
+        return len(self.responses.get(method, {}))
+
+    def to_dict(self) -> dict:
+        return {"version": FIXTURE_VERSION, "org_id": self.org_id, "responses": self.responses}
+
+    def save(self, path: str):
+        """Writes the fixture as JSON, gzip-compressed if path ends with .gz."""
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        logging.info(f"Saved fixture with {sum(len(v) for v in self.responses.values())} responses to {path}.")
+
+    @classmethod
+    def load(cls, path: str):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != FIXTURE_VERSION:
+            raise ValueError(f"Unsupported fixture version {data.get('version')} in {path}.")
+        return cls(data["org_id"], data["responses"])
+
+
+class RecordingClient:
+    """Wraps a real client and stores the response (or the error) of every recorded method call."""
+
+    def __init__(self, client, name: str, fixture: Fixture):
+        self._client = client
+        self._name = name
+        self._fixture = fixture
+        self.transport = client.transport
+
+    def __getattr__(self, attr):
+        target = getattr(self._client, attr)
+        method = RECORDED_METHODS.get(attr)
+        if method is None or method.client != self._name:
+            return target
+
+        def call(*args, **kwargs):
+            key = call_key(method, args, kwargs)
+            try:
+                result = target(*args, **kwargs)
+                # Pages are fetched here, so the listing is recorded whole; the caller iterates a list.
+                if method.paged:
+                    result = list(result)
+            except Exception as e:
+                self._fixture.set(attr, key, {"error": error_to_json(e)})
+                raise
+            if method.paged:
+                self._fixture.set(attr, key, {"items": [message_to_json(item) for item in result]})
+            else:
+                self._fixture.set(attr, key, {"item": message_to_json(result)})
+            return result
+
+        return call
+
+
+class _RecordingRequest:
+    def __init__(self, request, method: str, key: str, fixture: Fixture):
+        self.request = request
+        self.method = method
+        self.key = key
+        self.fixture = fixture
+
+    def execute(self):
+        try:
+            response = self.request.execute()
+        except Exception as e:
+            self.fixture.set(self.method, self.key, {"error": error_to_json(e)})
+            raise
+        self.fixture.extend(self.method, self.key, response.get(DISCOVERY_ITEMS_FIELDS[self.method], []))
+        return response
+
+
+class _RecordingCollection:
+    def __init__(self, collection, method: str, fixture: Fixture):
+        self._collection = collection
+        self._method = method
+        self._fixture = fixture
+
+    def list(self, parent, **kwargs):
+        return _RecordingRequest(self._collection.list(parent=parent, **kwargs), self._method, parent, self._fixture)
+
+    def list_next(self, previous_request, previous_response):
+        request = self._collection.list_next(previous_request.request, previous_response)
+        if request is None:
+            return None
+        return _RecordingRequest(request, self._method, previous_request.key, self._fixture)
+
+    def servicePerimeters(self):
+        return _RecordingCollection(self._collection.servicePerimeters(), SERVICE_PERIMETERS_METHOD, self._fixture)
+
+
+class RecordingAccessContextManager:
+    """Wraps the Access Context Manager discovery client, recording every page it lists."""
+
+    def __init__(self, client, fixture: Fixture):
+        self._client = client
+        self._fixture = fixture
+
+    def accessPolicies(self):
+        return _RecordingCollection(self._client.accessPolicies(), ACCESS_POLICIES_METHOD, self._fixture)
+
+
+def record_fixture(path: str, max_projects: int = None) -> Fixture:
+    """
+    Runs the project listing and every collector against the real organization (ORGANIZATION_ID,
+    with application default credentials) and saves every response they got to path. Nothing is
+    written to Datastore. With max_projects, only the first max_projects projects are collected
+    and kept in the recorded project listing.
+    """
+    # Imported here: these modules need the sync job's environment, which the CLI sets up first.
+    from .. import clients
+    from ..folder_graph import FOLDER_SWEEP_QUERY
+    from ..projects import get_projects_in_org
+    from ..run_cache import clear_run_cache
+    from ..tasks import collect_single_project_data
+    from ..vpc_sc import reset_perimeter_index
+
+    fixture = Fixture(os.getenv("ORGANIZATION_ID"))
+    real_factories = dict(clients._CLIENT_FACTORIES)
+    real_acm_factory = clients._access_context_manager_factory
+
+    def recording(name):
+        return lambda credentials: RecordingClient(real_factories[name](credentials=credentials), name, fixture)
+
+    with clients.client_overrides(
+        factories={name: recording(name) for name in real_factories},
+        access_context_manager=lambda credentials: RecordingAccessContextManager(real_acm_factory(credentials=credentials), fixture),
+    ):
+        reset_perimeter_index()
+        clear_run_cache()
+        projects = get_projects_in_org()
+        if fixture.get("search_folders", FOLDER_SWEEP_QUERY) is None:
+            # Only runs with a cached folder graph search the folders; record it for the later runs.
+            request = resourcemanager_v3.SearchFoldersRequest(query=FOLDER_SWEEP_QUERY)
+            clients.get_folders_client().search_folders(request=request)
+        logging.info(f"Recording collector responses for {min(len(projects), max_projects or len(projects))} of {len(projects)} projects...")
+        for project in projects[:max_projects]:
+            collect_single_project_data(project)
+
+    if max_projects is not None:
+        kept = {project["project_id"] for project in projects[:max_projects]}
+        for response in fixture.responses.get("search_projects", {}).values():
+            if "items" in response:
+                response["items"] = [item for item in response["items"] if item.get("projectId") in kept]
+    fixture.save(path)
+    return fixture
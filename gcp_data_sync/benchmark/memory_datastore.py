@@ -0,0 +1,164 @@
+import copy
+import operator
+import threading
+import time
+from google.api_core import exceptions
+from google.cloud import datastore
+from google.cloud.datastore import helpers
+from google.cloud.datastore_v1.types import entity as entity_pb2
+
+# Datastore's per-entity and per-call limits, enforced so the benchmark fails where Datastore would.
+MAX_ENTITY_BYTES = 1048572
+MAX_ENTITIES_PER_COMMIT = 500
+MAX_KEYS_PER_LOOKUP = 1000
+
+_FILTER_OPERATORS = {
+    "=": operator.eq, "==": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+
+
+class InMemoryDatastore:
+    """
+    A stand-in for datastore.Client with the calls the sync job makes: key, entity, get,
+    get_multi, put, put_multi, delete, delete_multi and queries with equality or range
+    filters, projections and keys_only.
+
+    Entities are stored as protobufs, so every write and read pays the real serialization cost
+    and gets the real value conversions, and oversized entities or commits are rejected like
+    Datastore rejects them. Every call counts as one RPC and sleeps latency_ms.
+    """
+
+    def __init__(self, project: str = "benchmark", latency_ms: float = 0.0):
+        self.project = project
+        self.latency_ms = latency_ms
+        # key.flat_path -> (key, serialized entity protobuf, exclude_from_indexes, indexed property values)
+        self._entities = {}
+        self._lock = threading.Lock()
+        self.stats = {"rpcs": 0, "entities_written": 0, "entities_read": 0, "entities_deleted": 0,
+                      "bytes_written": 0, "queries": 0, "rejected": 0}
+
+    def key(self, *path_args, **kwargs):
+        kwargs.setdefault("project", self.project)
+        return datastore.Key(*path_args, **kwargs)
+
+    def entity(self, key=None, exclude_from_indexes=()):
+        return datastore.Entity(key=key, exclude_from_indexes=exclude_from_indexes)
+
+    def _rpc(self, **counts):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        with self._lock:
+            self.stats["rpcs"] += 1
+            for stat, amount in counts.items():
+                self.stats[stat] += amount
+
+    def put(self, entity):
+        self.put_multi([entity])
+
+    def put_multi(self, entities):
+        entities = list(entities)
+        if len(entities) > MAX_ENTITIES_PER_COMMIT:
+            self._reject(f"A commit can have at most {MAX_ENTITIES_PER_COMMIT} mutations, got {len(entities)}.")
+        encoded = []
+        for entity in entities:
+            pb = helpers.entity_to_protobuf(entity)._pb
+            size = pb.ByteSize()
+            if size > MAX_ENTITY_BYTES:
+                self._reject(f"Entity {entity.key.flat_path} is {size} bytes, larger than the maximum {MAX_ENTITY_BYTES}.")
+            excluded = set(entity.exclude_from_indexes)
+            indexed = copy.deepcopy({name: value for name, value in entity.items() if name not in excluded})
+            encoded.append((entity.key, pb.SerializeToString(), excluded, indexed, size))
+        self._rpc(entities_written=len(encoded), bytes_written=sum(item[-1] for item in encoded))
+        with self._lock:
+            for key, *stored, _ in encoded:
+                self._entities[key.flat_path] = (key, *stored)
+
+    def _reject(self, message: str):
+        with self._lock:
+            self.stats["rejected"] += 1
+        raise exceptions.InvalidArgument(message)
+
+    def _decode(self, stored):
+        _, data, excluded, _ = stored
+        pb = entity_pb2.Entity.pb()()
+        pb.ParseFromString(data)
+        entity = helpers.entity_from_protobuf(pb)
+        entity.exclude_from_indexes = set(excluded)
+        return entity
+
+    def get(self, key, **kwargs):
+        found = self.get_multi([key])
+        return found[0] if found else None
+
+    def get_multi(self, keys, missing=None, **kwargs):
+        keys = list(keys)
+        if len(keys) > MAX_KEYS_PER_LOOKUP:
+            self._reject(f"A lookup can have at most {MAX_KEYS_PER_LOOKUP} keys, got {len(keys)}.")
+        with self._lock:
+            stored = [(key, self._entities.get(key.flat_path)) for key in keys]
+        found = [self._decode(item) for _, item in stored if item is not None]
+        if missing is not None:
+            missing.extend(self.entity(key) for key, item in stored if item is None)
+        self._rpc(entities_read=len(found))
+        return found
+
+    def delete(self, key):
+        self.delete_multi([key])
+
+    def delete_multi(self, keys):
+        keys = list(keys)
+        if len(keys) > MAX_ENTITIES_PER_COMMIT:
+            self._reject(f"A commit can have at most {MAX_ENTITIES_PER_COMMIT} mutations, got {len(keys)}.")
+        with self._lock:
+            deleted = sum(self._entities.pop(key.flat_path, None) is not None for key in keys)
+        self._rpc(entities_deleted=deleted)
+
+    def query(self, kind: str = None, **kwargs):
+        return _InMemoryQuery(self, kind, **kwargs)
+
+    def _run_query(self, query, limit=None):
+        with self._lock:
+            stored = [item for path, item in self._entities.items() if path[0] == query.kind]
+        results = []
+        # Like Datastore, filters and projections are answered from the indexed values alone.
+        for item in stored:
+            key, _, _, indexed = item
+            if not all(name in indexed and op(indexed[name], value) for name, op, value in query.filters):
+                continue
+            if query.projection:
+                # Projection queries only see entities with an indexed value for every projected property.
+                if any(name not in indexed for name in query.projection):
+                    continue
+                entity = self.entity(key)
+                entity.update({name: indexed[name] for name in query.projection})
+            elif query.is_keys_only:
+                entity = self.entity(key)
+            else:
+                entity = self._decode(item)
+            results.append(entity)
+            if limit is not None and len(results) >= limit:
+                break
+        self._rpc(queries=1, entities_read=len(results))
+        return results
+
+
+class _InMemoryQuery:
+    def __init__(self, client: InMemoryDatastore, kind: str, projection=(), filters=(), **kwargs):
+        self._client = client
+        self.kind = kind
+        self.projection = list(projection)
+        self.filters = [(name, _FILTER_OPERATORS[op], value) for name, op, value in filters]
+        self.is_keys_only = False
+
+    def add_filter(self, property_name=None, operator=None, value=None, *, filter=None):
+        if filter is not None:
+            property_name, operator, value = filter.property_name, filter.operator, filter.value
+        self.filters.append((property_name, _FILTER_OPERATORS[operator], value))
+        return self
+
+    def keys_only(self):
+        self.is_keys_only = True
+
+    def fetch(self, limit=None, **kwargs):
+        return iter(self._client._run_query(self, limit))
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import time
+from .fake_clients import DEFAULT_PAGE_SIZE, FakeGcp, FaultInjector, fake_client_overrides
+from .fixtures import Fixture
+from .memory_datastore import InMemoryDatastore
+
+
+def _settings(sync_main) -> dict:
+    """The settings that shape a run's performance, recorded with its results so runs can be compared."""
+    from ..async_pipeline import ASYNC_COLLECTORS, ASYNC_MAX_IN_FLIGHT, ASYNC_MAX_PROJECTS
+    from ..executor import SYNC_EXECUTOR
+    from ..incremental import INCREMENTAL_SYNC
+    from ..org_policies import ORG_POLICY_EVALUATION
+    from ..sharding import TASK_COUNT
+    return {
+        "executor": "asyncio pipeline" if ASYNC_COLLECTORS else SYNC_EXECUTOR,
+        "max_workers": sync_main.MAX_WORKERS,
+        "async_max_projects": ASYNC_MAX_PROJECTS,
+        "async_max_in_flight": ASYNC_MAX_IN_FLIGHT,
+        "incremental_sync": INCREMENTAL_SYNC,
+        "org_policy_evaluation": ORG_POLICY_EVALUATION,
+        "deferred_retry_rounds": sync_main.DEFERRED_RETRY_ROUNDS,
+        "task_count": TASK_COUNT,
+    }
+
+
+def _stats_delta(before: dict, after: dict) -> dict:
+    """Returns the counters of after minus those of before, recursing into nested counters."""
+    return {
+        name: _stats_delta(before.get(name, {}), value) if isinstance(value, dict) else value - before.get(name, 0)
+        for name, value in after.items()
+    }
+
+
+def run_benchmark(fixture: Fixture, faults: FaultInjector = None, datastore_latency_ms: float = 0.0,
+                  page_size: int = DEFAULT_PAGE_SIZE, runs: int = 1) -> dict:
+    """
+    Runs the whole sync job (main.main) against fake GCP clients replaying fixture and an
+    in-memory Datastore, and returns its results.
+
+    With runs > 1 the job runs again against the same Datastore, so later runs start from the
+    stored content hashes, incremental sync state and negative cache, like a scheduled job does.
+
+    Returns:
+        A dict with the settings, the fixture's size, and per run the wall time, the job's run
+        report (see run_metrics.build_run_report), the fake API request counts and the
+        Datastore call counts.
+    """
+    # The job takes its org from the environment and must not run in single-project debug mode.
+    os.environ["ORGANIZATION_ID"] = fixture.org_id
+    os.environ["DEBUG_DATASYNC_PROJECT"] = ""
+    from .. import main as sync_main
+    from ..clients import client_overrides
+    from ..datastore_client import datastore_client_override
+    from ..run_metrics import RUN_REPORT_KIND
+
+    faults = faults or FaultInjector()
+    datastore = InMemoryDatastore(latency_ms=datastore_latency_ms)
+    results = {
+        "settings": _settings(sync_main),
+        "fixture": {
+            "org_id": fixture.org_id,
+            "folders": sum(len(r.get("items", [])) for r in fixture.responses.get("list_folders", {}).values()),
+            "projects": sum(len(r.get("items", [])) for r in fixture.responses.get("search_projects", {}).values()),
+        },
+        "runs": [],
+    }
+    for run in range(runs):
+        gcp = FakeGcp(fixture, faults, page_size)
+        fault_stats = faults.snapshot()
+        datastore_stats = dict(datastore.stats)
+        started = time.monotonic()
+        with client_overrides(**fake_client_overrides(gcp)), datastore_client_override(datastore):
+            sync_main.main()
+        wall_seconds = time.monotonic() - started
+
+        reports = sorted(
+            (json.loads(entity["report"]) for entity in datastore.query(kind=RUN_REPORT_KIND).fetch()),
+            key=lambda report: report["started_at"],
+        )
+        results["runs"].append({
+            "run": run + 1,
+            "wall_seconds": round(wall_seconds, 3),
+            "report": reports[-1] if reports else None,
+            "fake_api": _stats_delta(fault_stats, faults.snapshot()),
+            "datastore": _stats_delta(datastore_stats, datastore.stats),
+        })
+        logging.info(f"Benchmark run {run + 1}/{runs} finished in {wall_seconds:.1f}s.")
+    return results
@@ -0,0 +1,186 @@
+import logging
+import random
+from ..folder_graph import FOLDER_SWEEP_QUERY
+from .fixtures import ACCESS_POLICIES_METHOD, SERVICE_PERIMETERS_METHOD, Fixture
+
+# Generates fixtures for synthetic organizations of any size, with the same shape as recorded
+# ones: a folder tree, projects spread across it, org policies set at every level, firewall
+# rules, Security Center services and SHA custom modules per project, and VPC SC perimeters.
+
+# The collectors' hard-coded org ID (vpc_sc.HARDCODED_ORG_ID), so perimeters are found.
+DEFAULT_ORG_ID = "922071633244"
+
+CONSTRAINTS = (
+    "compute.vmExternalIpAccess",
+    "iam.managed.disableServiceAccountKeyCreation",
+    "iam.managed.disableServiceAccountCreation",
+    "storage.restrictAuthTypes",
+    "run.allowedIngress",
+    "container.managed.enablePrivateNodes",
+    "essentialcontacts.managed.allowedContactDomains",
+    "compute.managed.blockPreviewFeatures",
+)
+SCC_SERVICES = (
+    "SECURITY_HEALTH_ANALYTICS",
+    "EVENT_THREAT_DETECTION",
+    "CONTAINER_THREAT_DETECTION",
+    "VM_THREAT_DETECTION",
+    "WEB_SECURITY_SCANNER",
+)
+SHA_MODULES = ("PUBLIC_BUCKET_ACL", "OPEN_FIREWALL", "SQL_NO_ROOT_PASSWORD", "MFA_NOT_ENFORCED")
+ENVIRONMENTS = ("prod", "staging", "dev", "sandbox")
+ENABLEMENT_STATES = ("ENABLED", "DISABLED", "INHERITED")
+
+
+def _policy(node: str, constraint: str, rng: random.Random, inherit: bool = False):
+    spec = {"rules": [{"enforce": rng.random() < 0.7}]}
+    if inherit:
+        spec["inheritFromParent"] = True
+    return {"name": f"{node}/policies/{constraint}", "spec": spec}
+
+
+def generate_org(projects: int = 10000, folder_depth: int = 5, folder_fanout: int = 5, seed: int = 0,
+                 org_id: str = DEFAULT_ORG_ID, perimeter_coverage: float = 0.6,
+                 permission_denied_rate: float = 0.02, api_disabled_rate: float = 0.02) -> Fixture:
+    """
+    Generates a fixture for an organization with the given number of projects under a folder
+    tree folder_depth levels deep, where each folder has up to folder_fanout subfolders.
+    Projects are spread over the org node and every folder, mostly in the leaf folders.
+
+    perimeter_coverage is the share of projects inside a VPC SC perimeter. permission_denied_rate
+    and api_disabled_rate are the shares of projects whose Security Center calls fail with
+    PermissionDenied and with a SERVICE_DISABLED error, the failures the negative cache remembers.
+    The same arguments always produce the same fixture.
+    """
+    rng = random.Random(seed)
+    fixture = Fixture(org_id)
+    org = f"organizations/{org_id}"
+
+    # Folder tree, level by level.
+    nodes = [org]
+    level = [org]
+    next_folder_id = 100000
+    for depth in range(folder_depth):
+        next_level = []
+        for parent in level:
+            children = []
+            for _ in range(rng.randint(1, folder_fanout) if depth else folder_fanout):
+                name = f"folders/{next_folder_id}"
+                children.append({"name": name, "displayName": f"folder-{depth + 1}-{next_folder_id}", "parent": parent})
+                next_folder_id += 1
+            fixture.set("list_folders", parent, {"items": children})
+            next_level.extend(child["name"] for child in children)
+        nodes.extend(next_level)
+        level = next_level
+    for leaf in level:
+        fixture.set("list_folders", leaf, {"items": []})
+    folder_count = len(nodes) - 1
+    # The folder graph's org-wide search returns every folder at once.
+    fixture.set("search_folders", FOLDER_SWEEP_QUERY, {
+        "items": [folder for response in fixture.responses["list_folders"].values() for folder in response["items"]],
+    })
+
+    # Org policies: every constraint at the org, a few per folder near the top, rare project overrides.
+    fixture.set("list_policies", org, {"items": [_policy(org, c, rng) for c in CONSTRAINTS]})
+    for node in nodes[1:]:
+        chosen = rng.sample(CONSTRAINTS, rng.randint(0, 2))
+        fixture.set("list_policies", node, {"items": [_policy(node, c, rng, inherit=rng.random() < 0.3) for c in chosen]})
+
+    # Projects, three times as likely to sit in a leaf folder as anywhere else.
+    leaves = set(level)
+    weights = [3 if node in leaves else 1 for node in nodes]
+    placements = {node: [] for node in nodes}
+    for i in range(projects):
+        placements[rng.choices(nodes, weights)[0]].append(i)
+
+    covered_numbers = []
+    for node, indexes in placements.items():
+        items = []
+        for i in indexes:
+            project_id = f"bench-project-{i:06d}"
+            number = str(100000000000 + i)
+            items.append({
+                "name": f"projects/{number}",
+                "projectId": project_id,
+                "parent": node,
+                "displayName": f"Benchmark project {i}",
+                "state": "ACTIVE",
+                "labels": {"environment": rng.choice(ENVIRONMENTS)},
+                "etag": f"W/\"{rng.getrandbits(32):08x}\"",
+                "updateTime": "2026-01-01T00:00:00Z",
+            })
+            _generate_project_resources(fixture, project_id, rng, permission_denied_rate, api_disabled_rate)
+            if rng.random() < perimeter_coverage:
+                covered_numbers.append(number)
+        fixture.set("search_projects", f"parent:{node}", {"items": items})
+
+    # One access policy; perimeters of up to 100 projects each, a fifth of them dry-run only.
+    policy_name = "accessPolicies/1000"
+    fixture.set(ACCESS_POLICIES_METHOD, org, {"items": [{"name": policy_name, "title": "Benchmark policy"}]})
+    perimeters = []
+    for start in range(0, len(covered_numbers), 100):
+        resources = [f"projects/{number}" for number in covered_numbers[start:start + 100]]
+        config = "spec" if rng.random() < 0.2 else "status"
+        perimeters.append({
+            "name": f"{policy_name}/servicePerimeters/perimeter_{start // 100}",
+            "title": f"perimeter-{start // 100}",
+            config: {"resources": resources},
+        })
+    fixture.set(SERVICE_PERIMETERS_METHOD, policy_name, {"items": perimeters})
+
+    logging.info(f"Generated a synthetic organization with {projects} projects, {folder_count} folders and {len(perimeters)} perimeters.")
+    return fixture
+
+
+def _generate_project_resources(fixture: Fixture, project_id: str, rng: random.Random,
+                                permission_denied_rate: float, api_disabled_rate: float):
+    """Generates one project's own policies, firewall rules, Security Center services and custom modules."""
+    node = f"projects/{project_id}"
+    overrides = [_policy(node, c, rng) for c in rng.sample(CONSTRAINTS, 1)] if rng.random() < 0.05 else []
+    fixture.set("list_policies", node, {"items": overrides})
+
+    firewalls = []
+    for n in range(rng.randint(0, 6)):
+        rule = {"name": f"fw-{n}", "direction": rng.choice(("INGRESS", "EGRESS")), "sourceRanges": ["10.0.0.0/8"]}
+        if rng.random() < 0.3:
+            rule.update(denied=[{"IPProtocol": "all"}], sourceRanges=["0.0.0.0/0"])
+        else:
+            rule["allowed"] = [{"IPProtocol": "tcp", "ports": ["443"]}]
+        firewalls.append(rule)
+    fixture.set("list", project_id, {"items": firewalls})
+
+    parent = f"projects/{project_id}/locations/global"
+    roll = rng.random()
+    if roll < permission_denied_rate:
+        error = {"class": "PermissionDenied", "message": f"Permission denied on resource project {project_id}."}
+    elif roll < permission_denied_rate + api_disabled_rate:
+        error = {"class": "PermissionDenied", "message": (
+            f"Security Center Management API has not been used in project {project_id} before or it is disabled. "
+            "SERVICE_DISABLED")}
+    else:
+        error = None
+    if error:
+        fixture.set("list_security_center_services", parent, {"error": error})
+        fixture.set("list_effective_security_health_analytics_custom_modules", parent, {"error": error})
+        return
+
+    services = []
+    for service in SCC_SERVICES:
+        entry = {
+            "name": f"{parent}/securityCenterServices/{service}",
+            "effectiveEnablementState": rng.choice(ENABLEMENT_STATES[:2]),
+        }
+        if service == "SECURITY_HEALTH_ANALYTICS":
+            entry["modules"] = {module: {"effectiveEnablementState": rng.choice(ENABLEMENT_STATES[:2])} for module in SHA_MODULES}
+        services.append(entry)
+    fixture.set("list_security_center_services", parent, {"items": services})
+
+    custom_modules = [
+        {
+            "name": f"{parent}/effectiveSecurityHealthAnalyticsCustomModules/{rng.getrandbits(40)}",
+            "displayName": f"custom_module_{n}",
+            "enablementState": rng.choice(ENABLEMENT_STATES[:2]),
+        }
+        for n in range(rng.randint(0, 2))
+    ]
+    fixture.set("list_effective_security_health_analytics_custom_modules", parent, {"items": custom_modules})
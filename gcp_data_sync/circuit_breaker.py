@@ -0,0 +1,177 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from googleapiclient.errors import HttpError
+
+load_dotenv()
+
+# --- Configuration ---
+# A breaker opens after this many consecutive failures of the same class from one API, with
+# no success from that API in between. While open, calls to the API are skipped. After the
+# cooldown one probe call is let through; if it succeeds the breaker closes again, and if it
+# fails, with any error, the breaker reopens for another cooldown.
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", 20))
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN_SECONDS", 600))
+
+# Errors that repeat identically for every project when an API is disabled org-wide or the
+# service account lacks a permission. Only these trip breakers.
+PERSISTENT_ERROR_CLASSES = {
+    "PermissionDenied", "Forbidden", "Unauthenticated", "Unauthorized", "FailedPrecondition",
+    "HttpError401", "HttpError403",
+}
+# Of those, the errors that a project-scoped call gets when the API is disabled on that project
+# or a permission is missing there. The negative cache skips them per project, so in
+# project-scoped calls they do not count against the API's breakers.
+PROJECT_LEVEL_ERROR_CLASSES = {"PermissionDenied", "Forbidden", "FailedPrecondition", "HttpError403"}
+# Errors worth retrying later in the run, in the deferred pass.
+TRANSIENT_ERROR_CLASSES = {
+    "DeadlineExceeded", "ServiceUnavailable", "InternalServerError", "Aborted", "Unknown",
+    "BadGateway", "GatewayTimeout", "ResourceExhausted", "TooManyRequests", "RetryError",
+    "HttpError429", "HttpError500", "HttpError502", "HttpError503", "HttpError504",
+}
+
+
+class CallSkippedError(Exception):
+    """Base class for API calls that were not made because they are known to fail."""
+
+
+class CircuitOpenError(CallSkippedError):
+    """Raised instead of calling an API whose circuit breaker is open."""
+
+    def __init__(self, api: str, error_class: str):
+        super().__init__(f"Skipped: {api} calls are suspended after repeated {error_class} errors.")
+        self.api = api
+        self.error_class = error_class
+
+
+def error_class(error: Exception) -> str:
+    """Classifies an error, e.g. 'PermissionDenied' or 'HttpError403' for discovery clients."""
+    if isinstance(error, HttpError):
+        return f"HttpError{getattr(error.resp, 'status', '')}"
+    return type(error).__name__
+
+
+def is_transient(error: Exception) -> bool:
+    return error_class(error) in TRANSIENT_ERROR_CLASSES
+
+
+class _Breaker:
+    def __init__(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.skipped = 0
+
+
+_lock = threading.Lock()
+_breakers = {}  # (api, error class) -> _Breaker
+
+
+def check_circuit(api: str):
+    """Raises CircuitOpenError if a breaker for api is open. Lets one probe through after the cooldown."""
+    with _lock:
+        for (breaker_api, breaker_class), breaker in _breakers.items():
+            if breaker_api != api or breaker.opened_at is None:
+                continue
+            if not breaker.probing and time.monotonic() - breaker.opened_at >= CIRCUIT_BREAKER_COOLDOWN_SECONDS:
+                breaker.probing = True
+                return
+            breaker.skipped += 1
+            raise CircuitOpenError(api, breaker_class)
+
+
+def record_success(api: str):
+    """Closes and resets every breaker for api."""
+    with _lock:
+        for (breaker_api, breaker_class), breaker in _breakers.items():
+            if breaker_api != api:
+                continue
+            if breaker.opened_at is not None:
+                logging.info(f"Circuit for {api} ({breaker_class}) closed after a successful probe.")
+            breaker.consecutive_failures = 0
+            breaker.opened_at = None
+            breaker.probing = False
+
+
+# Set while a project-scoped call (negative_cache.call_project_api) runs.
+_project_scoped = contextvars.ContextVar("project_scoped", default=False)
+
+
+@contextmanager
+def project_scoped_calls():
+    """Marks the API calls inside the block as scoped to a single project."""
+    token = _project_scoped.set(True)
+    try:
+        yield
+    finally:
+        _project_scoped.reset(token)
+
+
+def record_failure(api: str, error: Exception):
+    """
+    Reopens api's breakers whose probe was let through, whatever the error, and counts a
+    persistent-class failure for api, opening its breaker at the threshold. Project-level
+    errors of project-scoped calls are not counted.
+    """
+    klass = error_class(error)
+    with _lock:
+        for (breaker_api, breaker_class), breaker in _breakers.items():
+            if breaker_api == api and breaker.probing:
+                breaker.opened_at = time.monotonic()
+                breaker.probing = False
+                logging.warning(f"Circuit for {api} ({breaker_class}) reopened after its probe failed with {klass}.")
+    if klass not in PERSISTENT_ERROR_CLASSES or (_project_scoped.get() and klass in PROJECT_LEVEL_ERROR_CLASSES):
+        return
+    with _lock:
+        breaker = _breakers.setdefault((api, klass), _Breaker())
+        breaker.consecutive_failures += 1
+        if breaker.opened_at is None and breaker.consecutive_failures >= CIRCUIT_BREAKER_THRESHOLD:
+            breaker.opened_at = time.monotonic()
+            logging.warning(
+                f"Circuit for {api} ({klass}) opened after {breaker.consecutive_failures} consecutive failures. "
+                f"Remaining calls are skipped for {CIRCUIT_BREAKER_COOLDOWN_SECONDS}s."
+            )
+
+
+def get_circuit_breaker_stats():
+    """Returns {'api:error class': {...}} for every breaker that has seen a failure."""
+    with _lock:
+        return {
+            f"{api}:{klass}": {
+                "open": breaker.opened_at is not None,
+                "consecutive_failures": breaker.consecutive_failures,
+                "skipped_calls": breaker.skipped,
+            }
+            for (api, klass), breaker in _breakers.items()
+        }
+
+
+def reset_circuit_breakers():
+    with _lock:
+        _breakers.clear()
+
+
+# Transient failures are collected per project so the project can be retried in the deferred
+# pass. The sink is a context variable, so each collector thread reports to its own project.
+_transient_failures = contextvars.ContextVar("transient_failures", default=None)
+
+
+@contextmanager
+def track_transient_failures():
+    """Collects (api, error class, message) for every transient failure inside the block."""
+    failures = []
+    token = _transient_failures.set(failures)
+    try:
+        yield failures
+    finally:
+        _transient_failures.reset(token)
+
+
+def note_transient_failure(api: str, error: Exception):
+    failures = _transient_failures.get()
+    if failures is not None:
+        failures.append((api, error_class(error), str(error)))
@@ -0,0 +1,173 @@
+import logging
+import threading
+from contextlib import contextmanager
+import google.auth
+from google.cloud import compute_v1, orgpolicy_v2, resourcemanager_v3, securitycentermanagement_v1
+from googleapiclient import discovery
+
+# Process-wide registry of GCP API clients.
+# Each client type is created once, with one shared set of credentials, and reused by every
+# collector and every worker thread. The generated google-cloud clients are thread-safe, so a
+# single instance (and therefore a single channel) serves all concurrent callers. The
+# discovery-based Access Context Manager client is not thread-safe (httplib2), so it is cached
+# per thread instead.
+#
+# The async clients used by the async collection pipeline are bound to the event loop they are
+# created on, so they are not registered here; each pipeline run creates and closes its own.
+
+_lock = threading.Lock()
+_thread_local = threading.local()
+_credentials = None
+_clients = {}
+# Every per-thread discovery client still open, so close_all can close them. close_all also bumps
+# the generation, which makes each thread build a new client on its next call.
+_discovery_clients = []
+_discovery_generation = 0
+
+_CLIENT_FACTORIES = {
+    "compute.firewalls": compute_v1.FirewallsClient,
+    "orgpolicy": orgpolicy_v2.OrgPolicyClient,
+    "resourcemanager.projects": resourcemanager_v3.ProjectsClient,
+    "resourcemanager.folders": resourcemanager_v3.FoldersClient,
+    "securitycentermanagement": securitycentermanagement_v1.SecurityCenterManagementClient,
+}
+
+_ASYNC_CLIENT_FACTORIES = {
+    "orgpolicy": orgpolicy_v2.OrgPolicyAsyncClient,
+    "resourcemanager.projects": resourcemanager_v3.ProjectsAsyncClient,
+    "resourcemanager.folders": resourcemanager_v3.FoldersAsyncClient,
+    "securitycentermanagement": securitycentermanagement_v1.SecurityCenterManagementAsyncClient,
+}
+
+
+def _build_access_context_manager_client(credentials):
+    return discovery.build('accesscontextmanager', 'v1', credentials=credentials, cache_discovery=False)
+
+
+_access_context_manager_factory = _build_access_context_manager_client
+
+
+def get_credentials():
+    """Returns the application default credentials, resolving them only once per process."""
+    global _credentials
+    if _credentials is None:
+        with _lock:
+            if _credentials is None:
+                _credentials, _ = google.auth.default()
+    return _credentials
+
+
+def get_client(name: str):
+    """Returns the shared client registered under name, creating it on first use."""
+    client = _clients.get(name)
+    if client is None:
+        credentials = get_credentials()
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                logging.info(f"Creating shared GCP client: {name}")
+                client = _CLIENT_FACTORIES[name](credentials=credentials)
+                _clients[name] = client
+    return client
+
+
+def create_async_client(name: str):
+    """Creates an async client of the type registered under name. Must be called on a running event loop."""
+    logging.info(f"Creating async GCP client: {name}")
+    return _ASYNC_CLIENT_FACTORIES[name](credentials=get_credentials())
+
+
+def get_firewalls_client():
+    return get_client("compute.firewalls")
+
+
+def get_org_policy_client():
+    return get_client("orgpolicy")
+
+
+def get_projects_client():
+    return get_client("resourcemanager.projects")
+
+
+def get_folders_client():
+    return get_client("resourcemanager.folders")
+
+
+def get_security_center_management_client():
+    return get_client("securitycentermanagement")
+
+
+def get_access_context_manager_client():
+    """Returns this thread's Access Context Manager discovery client."""
+    client = getattr(_thread_local, "acm_client", None)
+    if client is None or _thread_local.acm_generation != _discovery_generation:
+        client = _access_context_manager_factory(credentials=get_credentials())
+        with _lock:
+            _discovery_clients.append(client)
+            _thread_local.acm_generation = _discovery_generation
+        _thread_local.acm_client = client
+    return client
+
+
+def get_client_stats():
+    """Reports how many clients, and therefore channels, are currently open."""
+    with _lock:
+        clients = sorted(_clients)
+        discovery_clients = len(_discovery_clients)
+    return {
+        "clients": clients,
+        "discovery_clients": discovery_clients,
+        "open_channels": len(clients) + discovery_clients,
+    }
+
+
+def close_all():
+    """Closes every shared gRPC/REST client and every discovery client. They are recreated on next use."""
+    global _discovery_generation
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+        discovery_clients = list(_discovery_clients)
+        _discovery_clients.clear()
+        _discovery_generation += 1
+    for name, client in clients:
+        try:
+            client.transport.close()
+        except Exception as e:
+            logging.warning(f"Failed to close GCP client {name}: {e}")
+    for client in discovery_clients:
+        close = getattr(client, "close", None)
+        if close is None:
+            continue
+        try:
+            close()
+        except Exception as e:
+            logging.warning(f"Failed to close an Access Context Manager client: {e}")
+
+
+@contextmanager
+def client_overrides(factories: dict = None, async_factories: dict = None, access_context_manager=None, credentials=None):
+    """
+    Creates clients with other factories for the duration of the block, e.g. the benchmark's
+    fake or recording clients. Each factory is called like the client classes, as
+    factory(credentials=...). Shared clients created before the block, and during it, are
+    closed on the way in and out, so no client outlives the factory that made it.
+    """
+    global _access_context_manager_factory, _credentials
+    saved = (dict(_CLIENT_FACTORIES), dict(_ASYNC_CLIENT_FACTORIES), _access_context_manager_factory, _credentials)
+    close_all()
+    _CLIENT_FACTORIES.update(factories or {})
+    _ASYNC_CLIENT_FACTORIES.update(async_factories or {})
+    if access_context_manager is not None:
+        _access_context_manager_factory = access_context_manager
+    if credentials is not None:
+        _credentials = credentials
+    try:
+        yield
+    finally:
+        close_all()
+        _CLIENT_FACTORIES.clear()
+        _CLIENT_FACTORIES.update(saved[0])
+        _ASYNC_CLIENT_FACTORIES.clear()
+        _ASYNC_CLIENT_FACTORIES.update(saved[1])
+        _access_context_manager_factory, _credentials = saved[2], saved[3]
@@ -1,6 +1,14 @@
 from google.cloud import datastore
+import hashlib
+import json
 import logging
 import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,18 +21,65 @@ DASHBOARD_GCP_PROJECT_ID = os.getenv("DASHBOARD_GCP_PROJECT_ID")
 if not DASHBOARD_GCP_PROJECT_ID or DASHBOARD_GCP_PROJECT_ID == "YOUR_DATASTORE_PROJECT_ID_HERE":
     raise RuntimeError("DASHBOARD_GCP_PROJECT_ID is not set in the .env file.")
 
+# Set by datastore_client_override, e.g. to the benchmark's in-memory stand-in.
+_client_override = None
+
 def get_datastore_client():
     """Initializes and returns a Datastore client."""
+    if _client_override is not None:
+        return _client_override
     return datastore.Client(project=DASHBOARD_GCP_PROJECT_ID)
 
+@contextmanager
+def datastore_client_override(client):
+    """Makes get_datastore_client return client for the duration of the block."""
+    global _client_override
+    saved = _client_override
+    _client_override = client
+    try:
+        yield client
+    finally:
+        _client_override = saved
+
+# Stored alongside the data; left out of the hash so it only changes when the data does. The
+# incremental sync's input fingerprint and per-section collection times are metadata too.
+CONTENT_HASH_FIELD = "content_hash"
+FINGERPRINT_FIELD = "sync_fingerprint"
+COLLECTED_AT_FIELD = "sections_collected_at"
+METADATA_FIELDS = (CONTENT_HASH_FIELD, "last_updated", FINGERPRINT_FIELD, COLLECTED_AT_FIELD)
+
+def content_hash(data: dict) -> str:
+    """Returns a stable SHA-256 hash of data, ignoring the stored metadata fields."""
+    content = {k: v for k, v in data.items() if k not in METADATA_FIELDS}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def with_content_hash(data: dict) -> dict:
+    """Returns a copy of data with its content hash and write time added."""
+    return dict(data, **{CONTENT_HASH_FIELD: content_hash(data), "last_updated": datetime.now(timezone.utc)})
+
+def load_content_hashes(kind: str = DATASTORE_KIND, client=None) -> dict:
+    """
+    Returns {entity name: content hash} for every entity of kind that has one, using a single
+    projection query on the indexed content_hash property.
+    """
+    client = client or get_datastore_client()
+    query = client.query(kind=kind)
+    query.projection = [CONTENT_HASH_FIELD]
+    return {entity.key.name: entity[CONTENT_HASH_FIELD] for entity in query.fetch()}
+
+def _build_entity(client, kind: str, name: str, data: dict):
+    """Builds an entity holding data under kind/name. Only the content hash is indexed."""
+    key = client.key(kind, name)
+    entity = datastore.Entity(key=key)
+    entity.update(data)
+    entity.exclude_from_indexes = set(data.keys()) - {CONTENT_HASH_FIELD}
+    return entity
+
 def save_dashboard_data(project_id: str, data: dict):
     """Saves the aggregated dashboard data to Datastore."""
     try:
         client = get_datastore_client()
-        key = client.key(DATASTORE_KIND, project_id)
-        entity = datastore.Entity(key=key)
-        entity.update(data)
-        entity.exclude_from_indexes = set(data.keys())
+        entity = _build_entity(client, DATASTORE_KIND, project_id, with_content_hash(data))
 
         client.put(entity)
         logging.info(f"Successfully saved data for project {project_id} to Datastore.")
@@ -49,36 +104,334 @@ def get_dashboard_data(project_id: str):
         logging.error(f"Failed to retrieve data for project {project_id} from Datastore: {e}")
         return None
 
+# Datastore allows up to 1000 keys per lookup.
+READ_BATCH_SIZE = int(os.getenv("READ_BATCH_SIZE", 100))
+
+class DashboardDataLoader:
+    """
+    Reads the stored dashboard data of a list of projects with get_multi, READ_BATCH_SIZE
+    projects at a time, through a single client. A batch is read when the first of its
+    projects is asked for, and each project's data is handed out once and then dropped, so
+    only the batches in use are held in memory. Projects outside the list, or asked for
+    again, are read on their own with get_dashboard_data. Safe to use from multiple threads.
+    """
+
+    def __init__(self, project_ids: list, kind: str = DATASTORE_KIND, client=None):
+        self.kind = kind
+        self.client = client or get_datastore_client()
+        self._batches = [project_ids[i:i + READ_BATCH_SIZE] for i in range(0, len(project_ids), READ_BATCH_SIZE)]
+        self._batch_of = {project_id: i // READ_BATCH_SIZE for i, project_id in enumerate(project_ids)}
+        self._loaded = [None] * len(self._batches)
+        self._locks = [threading.Lock() for _ in self._batches]
+
+    def get(self, project_id: str):
+        """Returns the project's stored data, or None if there is none or it could not be read."""
+        index = self._batch_of.get(project_id)
+        if index is not None:
+            with self._locks[index]:
+                if self._loaded[index] is None:
+                    self._loaded[index] = self._load(self._batches[index])
+                if project_id in self._loaded[index]:
+                    return self._loaded[index].pop(project_id)
+        return get_dashboard_data(project_id)
+
+    def _load(self, project_ids: list) -> dict:
+        try:
+            entities = self.client.get_multi([self.client.key(self.kind, project_id) for project_id in project_ids])
+        except Exception as e:
+            # Like get_dashboard_data, treat the projects as having no stored data.
+            logging.error(f"Failed to retrieve data for {len(project_ids)} projects from Datastore: {e}")
+            return dict.fromkeys(project_ids)
+        found = {entity.key.name: dict(entity) for entity in entities}
+        return {project_id: found.get(project_id) for project_id in project_ids}
+
+# Datastore limits a commit to 500 mutations and 10 MiB; stay safely below the size limit.
+WRITE_BATCH_MAX_ENTITIES = int(os.getenv("WRITE_BATCH_MAX_ENTITIES", 500))
+WRITE_BATCH_MAX_BYTES = int(os.getenv("WRITE_BATCH_MAX_BYTES", 8 * 1024 * 1024))
+WRITE_FLUSH_INTERVAL_SECONDS = float(os.getenv("WRITE_FLUSH_INTERVAL_SECONDS", 30))
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", 3))
+
+class DatastoreBatchWriter:
+    """
+    Buffers entities from the sync pipeline and writes them with put_multi.
+
+    A flush happens when the buffer reaches WRITE_BATCH_MAX_ENTITIES entities or
+    WRITE_BATCH_MAX_BYTES of (estimated) payload, when WRITE_FLUSH_INTERVAL_SECONDS have
+    passed since the last flush, and on close(). Flushes triggered by add() run on a
+    background thread, so the caller (the pipeline's result callback) does not wait for
+    Datastore or its retry backoff. A chunk that fails is retried with backoff; if it still
+    fails, its entities are written one by one so that each failure is reported against the
+    entity that caused it. Safe to use from multiple threads.
+
+    When known_hashes ({entity name: content hash} from load_content_hashes) is given, data
+    whose hash matches what is already stored is not written at all, unless it is added with
+    always_write (e.g. to store new metadata, which the hash leaves out).
+    """
+
+    def __init__(self, kind: str = DATASTORE_KIND, client=None, known_hashes: dict = None):
+        self.kind = kind
+        self.client = client or get_datastore_client()
+        self.known_hashes = known_hashes or {}
+        self.failures = {}  # entity name -> error message
+        self.changed = set()
+        self.unchanged = set()
+        self.stats = {"entities": 0, "rpcs": 0, "flushes": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._buffer = []  # (name, data, estimated size)
+        self._buffer_bytes = 0
+        self._last_flush = time.monotonic()
+        self._flusher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="datastore-writer")
+        self._background_flush = None  # Future of the flush queued or running on _flusher
+
+    def add(self, name: str, data: dict, always_write: bool = False):
+        """
+        Queues data to be written under name, flushing if a threshold is reached.
+        Returns False if the data is unchanged since the last write and was skipped.
+        """
+        data = with_content_hash(data)
+        with self._lock:
+            if not always_write and self.known_hashes.get(name) == data[CONTENT_HASH_FIELD]:
+                self.unchanged.add(name)
+                return False
+            self.changed.add(name)
+
+        size = len(json.dumps(data, default=str))
+        with self._lock:
+            self._buffer.append((name, data, size))
+            self._buffer_bytes += size
+            should_flush = (
+                len(self._buffer) >= WRITE_BATCH_MAX_ENTITIES
+                or self._buffer_bytes >= WRITE_BATCH_MAX_BYTES
+                or time.monotonic() - self._last_flush >= WRITE_FLUSH_INTERVAL_SECONDS
+            )
+        if should_flush:
+            self._flush_in_background()
+        return True
+
+    def _flush_in_background(self):
+        with self._lock:
+            # A queued or running flush picks up the buffer; entities added after it started
+            # are written by the next one.
+            if self._background_flush is not None and not self._background_flush.done():
+                return
+            self._background_flush = self._flusher.submit(self._write_buffer)
+
+    def flush(self):
+        """Writes everything currently buffered, after any background flush in progress."""
+        with self._lock:
+            background_flush = self._background_flush
+        if background_flush is not None:
+            background_flush.result()
+        self._write_buffer()
+
+    def _write_buffer(self):
+        with self._lock:
+            pending, self._buffer, self._buffer_bytes = self._buffer, [], 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        chunk, chunk_bytes = [], 0
+        for item in pending:
+            if chunk and (len(chunk) >= WRITE_BATCH_MAX_ENTITIES or chunk_bytes + item[2] > WRITE_BATCH_MAX_BYTES):
+                self._write_chunk(chunk)
+                chunk, chunk_bytes = [], 0
+            chunk.append(item)
+            chunk_bytes += item[2]
+        self._write_chunk(chunk)
+
+        with self._lock:
+            self.stats["flushes"] += 1
+
+    def close(self):
+        """Flushes the remaining buffer, stops the background thread and logs the write summary."""
+        self.flush()
+        self._flusher.shutdown()
+        logging.info(
+            f"Datastore writer for {self.kind}: {self.stats['entities']} entities written in "
+            f"{self.stats['rpcs']} RPCs ({self.stats['failed']} failed, {len(self.unchanged)} unchanged and skipped)."
+        )
+
+    def _write_chunk(self, chunk):
+        entities = [_build_entity(self.client, self.kind, name, data) for name, data, _ in chunk]
+        for attempt in range(WRITE_MAX_RETRIES + 1):
+            try:
+                self._count("rpcs")
+                self.client.put_multi(entities)
+                self._count("entities", len(entities))
+                return
+            except Exception as e:
+                if attempt < WRITE_MAX_RETRIES:
+                    logging.warning(f"put_multi of {len(entities)} {self.kind} entities failed (attempt {attempt + 1}): {e}")
+                    time.sleep(2 ** attempt)
+                    continue
+                logging.error(f"put_multi of {len(entities)} {self.kind} entities failed after {WRITE_MAX_RETRIES} retries: {e}. Writing them one by one.")
+
+        for (name, _, _), entity in zip(chunk, entities):
+            try:
+                self._count("rpcs")
+                self.client.put(entity)
+                self._count("entities")
+            except Exception as e:
+                logging.error(f"Failed to save data for {name} to Datastore: {e}")
+                with self._lock:
+                    self.failures[name] = str(e)
+                self._count("failed")
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self.stats[stat] += amount
+
+# Entities are limited to 1 MiB, so larger payloads are split across several chunk entities.
+BLOB_CHUNK_BYTES = 900 * 1024
+
+def _blob_chunk_names(name: str, manifest) -> list:
+    # Manifests written before chunks had generations name them "name:<i>".
+    prefix = f"{name}:{manifest['generation']}" if manifest.get("generation") else name
+    return [f"{prefix}:{i}" for i in range(manifest["chunks"])]
+
+def save_chunked_blob(kind: str, name: str, payload: bytes, client=None):
+    """
+    Stores payload as a manifest entity (kind/name) plus as many chunk entities as needed
+    (kind/"name:<generation>:<i>"), written with put_multi. The manifest records when it was
+    saved. Like the project list, the chunks are named after a hash of the payload and the
+    manifest is switched to them last, so an interrupted save leaves the previous payload
+    readable; the previous chunks are deleted afterwards.
+    """
+    client = client or get_datastore_client()
+    generation = hashlib.sha256(payload).hexdigest()[:16]
+    chunks = [payload[i:i + BLOB_CHUNK_BYTES] for i in range(0, len(payload), BLOB_CHUNK_BYTES)] or [b""]
+    manifest = {"chunks": len(chunks), "size": len(payload), "generation": generation, "saved_at": datetime.now(timezone.utc)}
+    entities = [_build_entity(client, kind, chunk_name, {"data": chunk}) for chunk_name, chunk in zip(_blob_chunk_names(name, manifest), chunks)]
+    for start in range(0, len(entities), WRITE_BATCH_MAX_ENTITIES):
+        client.put_multi(entities[start:start + WRITE_BATCH_MAX_ENTITIES])
+
+    previous = client.get(client.key(kind, name))
+    client.put(_build_entity(client, kind, name, manifest))
+    if previous and previous.get("generation") != generation:
+        stale = [client.key(kind, chunk_name) for chunk_name in _blob_chunk_names(name, previous)]
+        for start in range(0, len(stale), WRITE_BATCH_MAX_ENTITIES):
+            client.delete_multi(stale[start:start + WRITE_BATCH_MAX_ENTITIES])
+
+def delete_chunked_blob(kind: str, name: str, client=None):
+    """Deletes a blob stored by save_chunked_blob: its manifest first, then its chunks."""
+    client = client or get_datastore_client()
+    manifest = client.get(client.key(kind, name))
+    client.delete(client.key(kind, name))
+    if manifest and "chunks" in manifest:
+        keys = [client.key(kind, chunk_name) for chunk_name in _blob_chunk_names(name, manifest)]
+        for start in range(0, len(keys), WRITE_BATCH_MAX_ENTITIES):
+            client.delete_multi(keys[start:start + WRITE_BATCH_MAX_ENTITIES])
+
+def load_chunked_blob(kind: str, name: str, client=None):
+    """Returns the payload stored by save_chunked_blob, or None if there is none."""
+    client = client or get_datastore_client()
+    manifest = client.get(client.key(kind, name))
+    if not manifest:
+        return None
+    keys = [client.key(kind, chunk_name) for chunk_name in _blob_chunk_names(name, manifest)]
+    found = {entity.key.name: entity["data"] for entity in client.get_multi(keys)}
+    missing = [key.name for key in keys if key.name not in found]
+    if missing:
+        raise RuntimeError(f"Chunked blob {kind}/{name} is missing chunks: {missing}")
+    return b"".join(found[key.name] for key in keys)
+
+# Written at the end of every run; the backend drops its cached reads when the generation changes.
+SYNC_GENERATION_KIND = "GcpSyncGeneration"
+SYNC_GENERATION_NAME = "current"
+
+def save_sync_generation(generation: str, client=None):
+    """Records generation as the latest finished sync run."""
+    client = client or get_datastore_client()
+    client.put(_build_entity(client, SYNC_GENERATION_KIND, SYNC_GENERATION_NAME, {
+        "generation": generation,
+        "updated_at": datetime.now(timezone.utc),
+    }))
+
 PROJECTS_KIND = "OrganizationProjects"
+# The project list is stored as a manifest entity (PROJECTS_KIND/<org id>) plus shards of up to
+# PROJECTS_SHARD_SIZE projects (PROJECTS_KIND/"<org id>:<generation>:<i>"), each holding its
+# projects as zlib-compressed JSON. The manifest maps every folder name to the shards holding its
+# projects, so readers can load only the shards a folder needs.
+PROJECTS_SHARD_SIZE = int(os.getenv("PROJECTS_SHARD_SIZE", 1000))
+
+def _project_shard_names(org_id: str, manifest) -> list:
+    return [f"{org_id}:{manifest['generation']}:{i}" for i in range(manifest["shards"])]
+
+def _put_in_batches(client, entities: list, sizes: list):
+    """Writes entities with put_multi, keeping each commit within the mutation and size limits."""
+    batch, batch_bytes = [], 0
+    for entity, size in zip(entities, sizes):
+        if batch and (len(batch) >= WRITE_BATCH_MAX_ENTITIES or batch_bytes + size > WRITE_BATCH_MAX_BYTES):
+            client.put_multi(batch)
+            batch, batch_bytes = [], 0
+        batch.append(entity)
+        batch_bytes += size
+    if batch:
+        client.put_multi(batch)
 
 def save_projects_data(org_id: str, projects_data: dict):
-    """Saves the organization's project structure to Datastore."""
+    """
+    Saves the organization's project structure to Datastore: the shards of projects_data["projects"]
+    first, with put_multi, then the manifest holding every other field of projects_data. Shards
+    are named after a hash of the list, so the shards of the previous list stay readable until the
+    new manifest replaces it; they are deleted afterwards.
+    """
     try:
         client = get_datastore_client()
-        key = client.key(PROJECTS_KIND, org_id)
-        entity = datastore.Entity(key=key)
-        entity.update(projects_data)
-        # Since the data can be large and we don't need to query on it, exclude from indexes.
-        entity.exclude_from_indexes = set(projects_data.keys())
-        client.put(entity)
-        logging.info(f"Successfully saved project data for organization {org_id}.")
+        projects = projects_data.get("projects", [])
+        digest = hashlib.sha256(json.dumps(projects, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        generation = digest[:16]
+        shards = [projects[i:i + PROJECTS_SHARD_SIZE] for i in range(0, len(projects), PROJECTS_SHARD_SIZE)]
+        # Projects are listed depth-first, so a folder's projects sit in one or a few consecutive shards.
+        folder_shards = {}
+        for i, shard in enumerate(shards):
+            for project in shard:
+                indexes = folder_shards.setdefault(project.get("folder_name", ""), [])
+                if not indexes or indexes[-1] != i:
+                    indexes.append(i)
+        manifest = {k: v for k, v in projects_data.items() if k != "projects"}
+        manifest.update(shards=len(shards), count=len(projects), generation=generation, folder_shards=json.dumps(folder_shards))
+        # Indexed, so the backend can answer conditional requests without loading the list.
+        manifest[CONTENT_HASH_FIELD] = digest
+
+        payloads = [zlib.compress(json.dumps(shard, default=str).encode("utf-8")) for shard in shards]
+        entities = [
+            _build_entity(client, PROJECTS_KIND, name, {"data": payload})
+            for name, payload in zip(_project_shard_names(org_id, manifest), payloads)
+        ]
+        _put_in_batches(client, entities, [len(payload) for payload in payloads])
+
+        previous = client.get(client.key(PROJECTS_KIND, org_id))
+        client.put(_build_entity(client, PROJECTS_KIND, org_id, manifest))
+        if previous and previous.get("generation") and previous["generation"] != generation:
+            stale = [client.key(PROJECTS_KIND, name) for name in _project_shard_names(org_id, previous)]
+            for start in range(0, len(stale), WRITE_BATCH_MAX_ENTITIES):
+                client.delete_multi(stale[start:start + WRITE_BATCH_MAX_ENTITIES])
+        logging.info(f"Successfully saved {len(projects)} projects in {len(shards)} shards for organization {org_id}.")
         return True
     except Exception as e:
         logging.error(f"Failed to save project data for organization {org_id}: {e}")
         return False
 
 def get_projects_data(org_id: str):
-    """Retrieves the organization's project structure from Datastore."""
+    """Retrieves the organization's project structure from Datastore, reassembled from its shards."""
     try:
         client = get_datastore_client()
-        key = client.key(PROJECTS_KIND, org_id)
-        entity = client.get(key)
-        if entity:
-            logging.info(f"Successfully retrieved project data for organization {org_id}.")
-            return dict(entity)
-        else:
+        manifest = client.get(client.key(PROJECTS_KIND, org_id))
+        if not manifest:
             logging.warning(f"No project data found for organization {org_id}.")
             return None
+        data = dict(manifest)
+        if "generation" in data:
+            keys = [client.key(PROJECTS_KIND, name) for name in _project_shard_names(org_id, data)]
+            found = {entity.key.name: entity["data"] for entity in client.get_multi(keys)}
+            missing = [key.name for key in keys if key.name not in found]
+            if missing:
+                raise RuntimeError(f"Project list of organization {org_id} is missing shards: {missing}")
+            data["projects"] = [project for key in keys for project in json.loads(zlib.decompress(found[key.name]))]
+        logging.info(f"Successfully retrieved project data for organization {org_id}.")
+        return data
     except Exception as e:
         logging.error(f"Failed to retrieve project data for organization {org_id}: {e}")
         return None
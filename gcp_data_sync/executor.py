@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# SYNC_EXECUTOR selects how work items are run: "thread" (default), "process" or "asyncio".
+EXECUTION_MODES = ("thread", "process", "asyncio")
+SYNC_EXECUTOR = os.getenv("SYNC_EXECUTOR", "thread").lower()
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", 5))
+# Threads of the long-lived pool that runs the collectors of every project (see get_collector_pool).
+COLLECTOR_POOL_WORKERS = int(os.getenv("COLLECTOR_POOL_WORKERS", MAX_WORKERS * MAX_WORKERS))
+
+_pool_lock = threading.Lock()
+_collector_pool = None
+
+
+class TaskTimeoutError(Exception):
+    """Raised when a single work item runs longer than its allowed timeout."""
+
+
+def get_collector_pool() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide thread pool for the per-project collector fan-out. Its threads live
+    across projects, so per-thread state such as the discovery clients is reused, not rebuilt.
+    """
+    global _collector_pool
+    with _pool_lock:
+        if _collector_pool is None:
+            _collector_pool = ThreadPoolExecutor(max_workers=COLLECTOR_POOL_WORKERS, thread_name_prefix="collector")
+        return _collector_pool
+
+
+def shutdown_collector_pool():
+    """Stops the collector pool's threads. A new pool is created on next use."""
+    global _collector_pool
+    with _pool_lock:
+        pool, _collector_pool = _collector_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_ordered(func, items, max_workers: int = None, timeout: float = None, mode: str = None,
+                on_error=None, on_result=None, executor: ThreadPoolExecutor = None):
+    """
+    Runs func(item) for every item with at most max_workers items in flight at once.
+
+    Args:
+        func: The callable to run for each item. Must be picklable in "process" mode.
+        items: The work items.
+        max_workers: Upper bound on concurrently running items. Defaults to MAX_WORKERS.
+        timeout: Per-item timeout in seconds, measured from when the item starts running.
+        mode: "thread", "process" or "asyncio". Defaults to the SYNC_EXECUTOR env var.
+        on_error: Called as on_error(item, exc) when an item fails or times out; its return
+            value is used as that item's result. If not given, the first failure is re-raised.
+        on_result: Called as on_result(index, item, result) as soon as each item finishes. If it
+            returns anything other than None, that value is kept in place of the result, which
+            lets callers hand off large results instead of holding them until the end.
+        executor: A long-lived thread pool to run on (in "thread" mode) instead of a new one.
+            It is left running afterwards.
+
+    Returns:
+        A list of results in the same order as items.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    mode = (mode or SYNC_EXECUTOR).lower()
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode '{mode}'. Expected one of {EXECUTION_MODES}.")
+    max_workers = max(1, min(max_workers or MAX_WORKERS, len(items)))
+
+    if mode == "asyncio":
+        return asyncio.run(_run_async(func, items, max_workers, timeout, on_error, on_result))
+
+    if executor is not None and mode == "thread":
+        return _run_pool(executor, func, items, max_workers, timeout, on_error, on_result, owned=False)
+    if mode == "process":
+        # gRPC channels do not survive fork(), so worker processes are always spawned fresh.
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sync-worker")
+    return _run_pool(executor, func, items, max_workers, timeout, on_error, on_result)
+
+
+def _resolve(items, results, index, outcome, error, on_error, on_result):
+    """Stores the outcome for a finished item, routing failures through on_error."""
+    if error is not None:
+        if on_error is None:
+            raise error
+        outcome = on_error(items[index], error)
+    if on_result:
+        replacement = on_result(index, items[index], outcome)
+        if replacement is not None:
+            outcome = replacement
+    results[index] = outcome
+
+
+def _run_pool(executor, func, items, max_workers, timeout, on_error, on_result, owned=True):
+    results = [None] * len(items)
+    running = {}  # future -> (index, start time)
+    abandoned = set()  # timed-out futures that still occupy a worker
+    next_index = 0
+
+    try:
+        while next_index < len(items) or running:
+            # Only hand the pool as many items as it has free workers, so that an item's start
+            # time is the moment it actually starts running rather than when it was queued.
+            abandoned = {f for f in abandoned if not f.done()}
+            while next_index < len(items) and len(running) + len(abandoned) < max_workers:
+                running[executor.submit(func, items[next_index])] = (next_index, time.monotonic())
+                next_index += 1
+
+            wait_for = None
+            if timeout is not None and running:
+                oldest_start = min(start for _, start in running.values())
+                wait_for = max(0.0, oldest_start + timeout - time.monotonic())
+            done, _ = wait(set(running) | abandoned, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future in abandoned:
+                    continue
+                index, _ = running.pop(future)
+                error = future.exception()
+                _resolve(items, results, index, None if error else future.result(), error, on_error, on_result)
+
+            if timeout is not None:
+                now = time.monotonic()
+                for future, (index, start) in list(running.items()):
+                    if now - start >= timeout:
+                        del running[future]
+                        if not future.cancel():
+                            abandoned.add(future)
+                        logging.warning(f"Work item {items[index]} exceeded its {timeout}s timeout and was abandoned.")
+                        error = TaskTimeoutError(f"Timed out after {timeout}s")
+                        _resolve(items, results, index, None, error, on_error, on_result)
+    finally:
+        # Never block on abandoned work; it finishes (or fails) in the background.
+        if owned:
+            executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            for future in running:
+                future.cancel()
+
+    return results
+
+
+async def run_ordered_async(func, items, max_workers: int = None, timeout: float = None,
+                            on_error=None, on_result=None):
+    """
+    Like run_ordered in "asyncio" mode, for callers already running on an event loop: awaits
+    func(item) (or runs it on a worker thread if func is not a coroutine function) for every
+    item, with at most max_workers items in flight at once.
+    """
+    items = list(items)
+    if not items:
+        return []
+    max_workers = max(1, min(max_workers or MAX_WORKERS, len(items)))
+    return await _run_async(func, items, max_workers, timeout, on_error, on_result)
+
+
+async def _run_async(func, items, max_workers, timeout, on_error, on_result):
+    results = [None] * len(items)
+    semaphore = asyncio.Semaphore(max_workers)
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sync-worker")
+    # on_error and on_result may block (e.g. on Datastore writes), so they run off the event
+    # loop, on a single thread so that callers still see them called one at a time.
+    callback_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sync-results")
+
+    async def run_one(index, item):
+        async with semaphore:
+            if asyncio.iscoroutinefunction(func):
+                call = func(item)
+            else:
+                call = loop.run_in_executor(executor, func, item)
+            try:
+                outcome, error = await asyncio.wait_for(call, timeout), None
+            except asyncio.TimeoutError:
+                logging.warning(f"Work item {item} exceeded its {timeout}s timeout and was abandoned.")
+                outcome, error = None, TaskTimeoutError(f"Timed out after {timeout}s")
+            except Exception as e:
+                outcome, error = None, e
+        await loop.run_in_executor(callback_executor, _resolve, items, results, index, outcome, error, on_error, on_result)
+
+    try:
+        await asyncio.gather(*(run_one(index, item) for index, item in enumerate(items)))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        callback_executor.shutdown(wait=False, cancel_futures=True)
+    return results
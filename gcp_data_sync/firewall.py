@@ -1,5 +1,9 @@
 import logging
 from google.cloud import compute_v1
+from .circuit_breaker import CallSkippedError
+from .clients import get_firewalls_client
+from .negative_cache import call_project_api
+from .rate_limiter import list_pages
 
 def get_denied_internet_ingress_rules(project_id: str) -> list:
     """
@@ -13,9 +17,9 @@ def get_denied_internet_ingress_rules(project_id: str) -> list:
     """
     logging.info(f"Fetching firewall rules for project {project_id}.")
     try:
-        client = compute_v1.FirewallsClient()
+        client = get_firewalls_client()
         request = compute_v1.ListFirewallsRequest(project=project_id)
-        firewalls = client.list(request=request)
+        firewalls = call_project_api(project_id, "compute", lambda: list_pages(client.list(request=request)))
 
         denied_rules = []
         for rule in firewalls:
@@ -39,6 +43,15 @@ def get_denied_internet_ingress_rules(project_id: str) -> list:
         
         return denied_rules
 
+    except CallSkippedError as e:
+        logging.warning(f"Skipping firewall rules for project {project_id}: {e}")
+        return [{
+            'name': 'Firewall Rules',
+            'status': 'Skipped',
+            'controlType': 'Firewall',
+            'details': str(e),
+            'ControlObjective': 'Restrict Ingress Traffic'
+        }]
     except Exception as e:
         logging.error(f"Error fetching firewall rules for project {project_id}: {e}")
         return []
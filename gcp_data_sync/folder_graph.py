@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from google.cloud import resourcemanager_v3
+from dotenv import load_dotenv
+from .clients import get_folders_client
+from .datastore_client import load_chunked_blob, save_chunked_blob
+from .executor import MAX_WORKERS, run_ordered
+from .rate_limiter import call_api, list_pages
+
+load_dotenv()
+
+# --- Configuration ---
+# The organization's folder hierarchy is kept in Datastore (kind FolderGraph, one compressed,
+# chunked blob per org) and reused across runs. A run fetches every active folder with one
+# paged search and compares it with the cached graph; only the parents of new, moved, changed
+# or vanished folders are listed again, instead of every folder in the hierarchy.
+FOLDER_GRAPH_KIND = "FolderGraph"
+FOLDER_GRAPH_CACHE = os.getenv("FOLDER_GRAPH_CACHE", "true").lower() == "true"
+# Search results can lag behind changes for a while, so the whole hierarchy is listed again
+# once the last full listing is this old.
+FOLDER_GRAPH_MAX_AGE_HOURS = float(os.getenv("FOLDER_GRAPH_MAX_AGE_HOURS", 24))
+FOLDER_SWEEP_QUERY = "state=ACTIVE"
+
+
+def _folder_record(folder) -> dict:
+    return {
+        "display_name": folder.display_name,
+        "parent": folder.parent,
+        "etag": folder.etag,
+        "update_time": folder.update_time.isoformat() if folder.update_time else None,
+    }
+
+
+def children_by_parent(folders: dict) -> dict:
+    """Returns {parent name: [child folder names]} for a graph's folders, in listing order."""
+    children = {}
+    for name, folder in folders.items():
+        children.setdefault(folder["parent"], []).append(name)
+    return children
+
+
+def load_folder_graph(org_id: str, client=None):
+    """Returns the stored folder graph of the organization, or None if there is none."""
+    payload = load_chunked_blob(FOLDER_GRAPH_KIND, org_id, client)
+    return json.loads(zlib.decompress(payload).decode("utf-8")) if payload else None
+
+
+def save_folder_graph(org_id: str, graph: dict, client=None):
+    save_chunked_blob(FOLDER_GRAPH_KIND, org_id, zlib.compress(json.dumps(graph).encode("utf-8")), client)
+
+
+def _assemble(root: str, children: dict, records: dict) -> dict:
+    """Returns the records of the folders below root, level by level in each parent's child order."""
+    folders = {}
+    level = [root]
+    while level:
+        next_level = []
+        for parent in level:
+            for name in children.get(parent, []):
+                if name in records and name not in folders:
+                    folders[name] = records[name]
+                    next_level.append(name)
+        level = next_level
+    return folders
+
+
+def refresh_folder_graph(org_id: str, now: datetime = None) -> dict:
+    """
+    Returns the organization's folder graph, refreshed from the cached one and saved again:
+    {"root": "organizations/<id>", "refreshed_at", "full_refresh_at", "folders": {folder name:
+    {"display_name", "parent", "etag", "update_time"}}}.
+
+    Every active folder is fetched with one paged search and compared with the cached graph.
+    The parents of folders that are new, moved, changed or gone are listed again, as are the
+    subtrees of listed folders the search does not return yet; every other folder keeps the
+    record the search returned. Without a usable cached graph (missing, FOLDER_GRAPH_CACHE
+    off, or its last full listing older than FOLDER_GRAPH_MAX_AGE_HOURS), or if the search
+    fails, the hierarchy is listed level by level.
+    """
+    now = now or datetime.now(timezone.utc)
+    root = f"organizations/{org_id}"
+    cached = None
+    if FOLDER_GRAPH_CACHE:
+        try:
+            cached = load_folder_graph(org_id)
+        except Exception as e:
+            logging.warning(f"Could not load the cached folder graph, listing every folder: {e}")
+    if cached and now - datetime.fromisoformat(cached["full_refresh_at"]) > timedelta(hours=FOLDER_GRAPH_MAX_AGE_HOURS):
+        logging.info(f"The cached folder graph is older than {FOLDER_GRAPH_MAX_AGE_HOURS}h, listing every folder.")
+        cached = None
+
+    folders_client = get_folders_client()
+
+    def list_child_folders(parent):
+        request = resourcemanager_v3.ListFoldersRequest(parent=parent)
+        return call_api("cloudresourcemanager", lambda: list_pages(folders_client.list_folders(request=request)))
+
+    records = {}
+    children = {}
+    listed = 0
+
+    def list_subtrees(parents):
+        # Lists the children of parents and everything below them, level by level.
+        nonlocal listed
+        level = list(parents)
+        while level:
+            results = run_ordered(list_child_folders, level, max_workers=MAX_WORKERS, mode="thread")
+            listed += len(level)
+            next_level = []
+            for parent, listing in zip(level, results):
+                children[parent] = [folder.name for folder in listing]
+                for folder in listing:
+                    records[folder.name] = _folder_record(folder)
+                    next_level.append(folder.name)
+            level = next_level
+
+    swept = None
+    if cached:
+        try:
+            request = resourcemanager_v3.SearchFoldersRequest(query=FOLDER_SWEEP_QUERY)
+            swept = call_api("cloudresourcemanager", lambda: list_pages(folders_client.search_folders(request=request)))
+        except Exception as e:
+            logging.warning(f"Could not search the organization's folders, listing every folder: {e}")
+
+    if swept is None:
+        list_subtrees([root])
+    else:
+        cached_folders = cached["folders"]
+        # The search returns every folder the caller can see; keep the ones below this org.
+        swept_records = {folder.name: _folder_record(folder) for folder in swept}
+        records.update(_assemble(root, children_by_parent(swept_records), swept_records))
+        children = children_by_parent(records)
+        stale = set()
+        for name in set(records) | set(cached_folders):
+            if records.get(name) != cached_folders.get(name):
+                stale.update(folder["parent"] for folder in (records.get(name), cached_folders.get(name)) if folder)
+        stale = [parent for parent in stale if parent == root or parent in records]
+        if stale:
+            results = run_ordered(list_child_folders, stale, max_workers=MAX_WORKERS, mode="thread")
+            listed += len(stale)
+            unseen = []
+            for parent, listing in zip(stale, results):
+                children[parent] = [folder.name for folder in listing]
+                for folder in listing:
+                    if folder.name not in records:
+                        unseen.append(folder.name)
+                    records[folder.name] = _folder_record(folder)
+            list_subtrees(unseen)
+    folders = _assemble(root, children, records)
+
+    graph = {
+        "root": root,
+        "refreshed_at": now.isoformat(),
+        "full_refresh_at": cached["full_refresh_at"] if swept is not None else now.isoformat(),
+        "folders": folders,
+    }
+    logging.info(f"Folder graph: {len(folders)} folders, children of {listed} nodes listed{'' if swept is None else ' after one search'}.")
+    try:
+        save_folder_graph(org_id, graph)
+    except Exception as e:
+        logging.warning(f"Could not save the folder graph: {e}")
+    return graph
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from .clients import get_org_policy_client
+from .datastore_client import COLLECTED_AT_FIELD, FINGERPRINT_FIELD, get_dashboard_data
+from .org_policies import EFFECTIVE_ORG_POLICIES_TO_CHECK, list_policies_at
+from .tasks import SECTIONS, collect_single_project_data, collect_single_project_data_async
+from .vpc_sc import get_perimeter_index
+
+load_dotenv()
+
+# --- Configuration ---
+# INCREMENTAL_SYNC only re-collects projects whose inputs changed or whose data is stale.
+# FULL_RESYNC forces every project to be fully re-collected even in incremental mode.
+INCREMENTAL_SYNC = os.getenv("INCREMENTAL_SYNC", "false").lower() == "true"
+FULL_RESYNC = os.getenv("FULL_RESYNC", "false").lower() == "true"
+# No section of a project's data is ever older than this.
+MAX_STALENESS_HOURS = float(os.getenv("MAX_STALENESS_HOURS", 72))
+# Per-section staleness budgets for projects whose fingerprint has not changed. Sections
+# whose inputs are not covered by the fingerprint (project-level policies, firewall rules,
+# Security Center settings) get shorter budgets. Override with STALENESS_HOURS_<SECTION>.
+DEFAULT_SECTION_STALENESS_HOURS = {
+    "org_policies": 24,
+    "vpc_sc_status": 24,
+    "sha_modules": 24,
+    "security_services": 24,
+    "firewall_rules": 6,
+}
+SECTION_STALENESS_HOURS = {
+    section: float(os.getenv(f"STALENESS_HOURS_{section.upper()}", DEFAULT_SECTION_STALENESS_HOURS[section]))
+    for section in SECTIONS
+}
+
+def compute_fingerprint(project: dict) -> str:
+    """
+    Hashes the inputs that determine a project's controls and are cheap to observe without
+    collecting them: the project's update time and etag, its folder ancestry, the etags of
+    the checked policies set on its org and folders (memoized once per run), and its
+    VPC-SC perimeter membership (from the run's perimeter index).
+    """
+    org_policy_client = get_org_policy_client()
+    ancestry = project.get("ancestry") or []
+    ancestor_policies = {}
+    for node in ancestry:
+        policies = list_policies_at(org_policy_client, node)
+        ancestor_policies[node] = sorted(
+            (constraint, policy.etag or str(policy.spec.update_time))
+            for constraint, policy in policies.items()
+            if constraint in EFFECTIVE_ORG_POLICIES_TO_CHECK
+        )
+
+    perimeters = []
+    if project.get("project_number"):
+        perimeters = get_perimeter_index()["resources"].get(f"projects/{project['project_number']}", [])
+
+    inputs = {
+        "update_time": project.get("update_time"),
+        "etag": project.get("etag"),
+        "ancestry": ancestry,
+        "ancestor_policies": ancestor_policies,
+        "perimeters": perimeters,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def plan_sections(previous: dict, fingerprint: str, now: datetime, full_resync: bool = FULL_RESYNC):
+    """
+    Decides which sections of a project's data to re-collect.
+
+    Returns:
+        A (sections, reason) tuple. An empty list means the stored data is still current.
+    """
+    if full_resync:
+        return list(SECTIONS), "full resync requested"
+    if not previous:
+        return list(SECTIONS), "no stored data"
+    if not fingerprint or previous.get(FINGERPRINT_FIELD) != fingerprint:
+        return list(SECTIONS), "inputs changed"
+
+    collected_at = previous.get(COLLECTED_AT_FIELD) or {}
+    if any(section not in collected_at for section in SECTIONS):
+        return list(SECTIONS), "missing collection times"
+    ages = {section: now - datetime.fromisoformat(collected_at[section]) for section in SECTIONS}
+    if max(ages.values()) > timedelta(hours=MAX_STALENESS_HOURS):
+        return list(SECTIONS), "max staleness exceeded"
+
+    stale = [section for section in SECTIONS if ages[section] > timedelta(hours=SECTION_STALENESS_HOURS[section])]
+    return stale, "stale sections" if stale else "current"
+
+def _plan_project(project: dict, now: datetime, stored_data=None):
+    """
+    Loads a project's stored data, from the stored_data DashboardDataLoader if given, and
+    decides which sections to re-collect.
+
+    Returns:
+        A (previous, fingerprint, sections) tuple; sections is empty when the data is current.
+    """
+    project_id = project["project_id"]
+    previous = stored_data.get(project_id) if stored_data else get_dashboard_data(project_id)
+    try:
+        fingerprint = compute_fingerprint(project)
+    except Exception as e:
+        logging.warning(f"Could not fingerprint project {project_id}, re-collecting it: {e}")
+        fingerprint = None
+
+    sections, reason = plan_sections(previous, fingerprint, now)
+    if not sections:
+        logging.info(f"Project {project_id} is unchanged and current; skipping collection.")
+    else:
+        logging.info(f"Re-collecting {sections} for project {project_id} ({reason}).")
+    return previous, fingerprint, sections
+
+def _record_collection(security_data: dict, previous: dict, fingerprint: str, sections: list, now: datetime):
+    """
+    Stores the fingerprint and per-section collection times alongside freshly collected data.
+    Both are metadata, left out of the data's content hash.
+    """
+    full = len(sections) == len(SECTIONS)
+    collected_at = {} if full else dict(previous.get(COLLECTED_AT_FIELD) or {})
+    collected_at.update({section: now.isoformat() for section in sections})
+    security_data[FINGERPRINT_FIELD] = fingerprint
+    security_data[COLLECTED_AT_FIELD] = collected_at
+    return security_data
+
+def collect_project_incrementally(project, defer_transient=False, stored_data=None):
+    """
+    Re-collects only what changed or went stale for a project. defer_transient is passed to
+    collect_single_project_data. stored_data is a DashboardDataLoader for the run's projects,
+    so their stored data is read in batches.
+
+    Returns:
+        A (project_id, security_data, error_msg) tuple like collect_single_project_data.
+        security_data is None with no error when the stored data is still current.
+    """
+    project_id = project["project_id"]
+    now = datetime.now(timezone.utc)
+    try:
+        previous, fingerprint, sections = _plan_project(project, now, stored_data)
+    except Exception as e:
+        logging.error(f"Error planning incremental refresh for project {project_id}: {e}")
+        return project_id, None, str(e)
+    if not sections:
+        return project_id, None, None
+
+    full = len(sections) == len(SECTIONS)
+    project_id, security_data, error_msg = collect_single_project_data(
+        project, sections=sections, previous=None if full else previous, defer_transient=defer_transient
+    )
+    if error_msg:
+        return project_id, None, error_msg
+    return project_id, _record_collection(security_data, previous, fingerprint, sections, now), None
+
+async def collect_project_incrementally_async(ctx, project, defer_transient=False, stored_data=None):
+    """
+    The async counterpart of collect_project_incrementally. Planning reads Datastore with
+    blocking calls, so it runs on a worker thread.
+    """
+    project_id = project["project_id"]
+    now = datetime.now(timezone.utc)
+    try:
+        previous, fingerprint, sections = await asyncio.to_thread(_plan_project, project, now, stored_data)
+    except Exception as e:
+        logging.error(f"Error planning incremental refresh for project {project_id}: {e}")
+        return project_id, None, str(e)
+    if not sections:
+        return project_id, None, None
+
+    full = len(sections) == len(SECTIONS)
+    project_id, security_data, error_msg = await collect_single_project_data_async(
+        ctx, project, sections=sections, previous=None if full else previous, defer_transient=defer_transient
+    )
+    if error_msg:
+        return project_id, None, error_msg
+    return project_id, _record_collection(security_data, previous, fingerprint, sections, now), None
@@ -3,11 +3,26 @@ import os
 os.environ["GRPC_POLL_STRATEGY"] = "poll"
 
 import logging
+import random
+import time
 from datetime import datetime
-from celery import group
-from .tasks import refresh_single_project_data_task
+from functools import partial
+from .async_pipeline import ASYNC_COLLECTORS, ASYNC_MAX_PROJECTS, run_async_pipeline
+from .circuit_breaker import get_circuit_breaker_stats, is_transient, reset_circuit_breakers
+from .clients import close_all, get_client_stats
+from .executor import SYNC_EXECUTOR, run_ordered, shutdown_collector_pool
+from .negative_cache import get_negative_cache_stats, invalidate_negative_cache, reset_negative_cache
+from .incremental import FULL_RESYNC, INCREMENTAL_SYNC, collect_project_incrementally, collect_project_incrementally_async
+from .rate_limiter import get_rate_limiter_stats
+from .tasks import TransientFailuresError, collect_single_project_data, collect_single_project_data_async
 from .projects import get_projects_in_org
-from .datastore_client import save_dashboard_data
+from .rollups import COMPLIANCE_ROLLUPS, control_statuses, update_compliance_rollups
+from .run_cache import clear_run_cache, drop_failures
+from .run_metrics import build_run_report, reset_run_metrics, save_run_report, timed_stage
+from .run_journal import SYNC_JOURNAL_ENABLED, ProgressReporter, RunJournal
+from .sharding import RUN_ID, TASK_COUNT, TASK_INDEX, apply_org_state, get_shared_org_state, save_shard_report, select_shard
+from .vpc_sc import reset_perimeter_index
+from .datastore_client import DashboardDataLoader, DatastoreBatchWriter, load_content_hashes, save_dashboard_data, save_projects_data, save_sync_generation
 from dotenv import load_dotenv
 
 # --- Configuration ---
@@ -19,6 +34,13 @@ logging.basicConfig(
 
 ORGANIZATION_ID = os.getenv("ORGANIZATION_ID")
 MAX_WORKERS = int(os.getenv("MAX_WORKERS", 5))
+PROJECT_TIMEOUT_SECONDS = float(os.getenv("PROJECT_TIMEOUT_SECONDS", 900))
+# Projects that hit transient API failures are retried after the main pass, in up to this many
+# deferred rounds. Round n starts after a random delay of up to DEFERRED_RETRY_BACKOFF_SECONDS * 2**(n-1).
+DEFERRED_RETRY_ROUNDS = int(os.getenv("DEFERRED_RETRY_ROUNDS", 2))
+DEFERRED_RETRY_BACKOFF_SECONDS = float(os.getenv("DEFERRED_RETRY_BACKOFF_SECONDS", 30))
+# "all", or a comma-separated list of project IDs whose cached API failures are dropped before the run.
+NEGATIVE_CACHE_INVALIDATE = os.getenv("NEGATIVE_CACHE_INVALIDATE", "")
 
 def refresh_and_cache_project_list():
     """Fetches all active projects and caches the list in Datastore."""
@@ -27,8 +49,9 @@ def refresh_and_cache_project_list():
         # The get_projects_in_org function reads the org ID from the environment
         projects = get_projects_in_org()
         
-        # Cache the full project list with a specific key
-        save_dashboard_data('all_projects', {'projects': projects})
+        # Cache the full project list, sharded, for the backend's project listing
+        if not save_projects_data(ORGANIZATION_ID, {'projects': projects}):
+            logging.warning("The project list could not be cached; the backend keeps serving the previous one.")
         
         logging.info(f"Successfully fetched and cached {len(projects)} projects.")
         return projects
@@ -66,45 +89,208 @@ def main():
         logging.critical("ORGANIZATION_ID environment variable not set. Halting job.")
         return
 
-    # Step 1: Determine which projects to run on (Debug vs. Full)
+    # Org-wide indexes are rebuilt once per run and shared by every project.
+    reset_perimeter_index()
+    clear_run_cache()
+    reset_circuit_breakers()
+    reset_negative_cache()
+    reset_run_metrics()
+    if NEGATIVE_CACHE_INVALIDATE:
+        targets = [None] if NEGATIVE_CACHE_INVALIDATE == "all" else [p.strip() for p in NEGATIVE_CACHE_INVALIDATE.split(",") if p.strip()]
+        for target in targets:
+            try:
+                invalidate_negative_cache(target)
+            except Exception as e:
+                logging.warning(f"Could not invalidate the negative cache for {target or 'all projects'}: {e}")
+
+    # Step 1: Determine which projects to run on (Debug vs. Full vs. one shard of a multi-task job)
     debug_project_id = os.getenv("DEBUG_DATASYNC_PROJECT")
 
-    if debug_project_id:
-        logging.warning(f"--- DEBUG MODE: Running for single project: {debug_project_id} ---")
-        project_ids = [debug_project_id]
+    with timed_stage("list_projects"):
+        if debug_project_id:
+            logging.warning(f"--- DEBUG MODE: Running for single project: {debug_project_id} ---")
+            projects = [{"project_id": debug_project_id}]
+            all_projects = projects
+        elif TASK_COUNT > 1:
+            # Task 0 lists the projects and builds the org-level indexes once; the other tasks reuse them.
+            logging.info(f"Step 1: Running as shard {TASK_INDEX} of {TASK_COUNT}. Loading shared org state...")
+            org_state = get_shared_org_state(refresh_and_cache_project_list)
+            if not org_state["projects"]:
+                logging.info("No projects found or an error occurred. Exiting.")
+                return
+            apply_org_state(org_state)
+            all_projects = org_state["projects"]
+            projects = select_shard(all_projects)
+            logging.info(f"Shard {TASK_INDEX} owns {len(projects)} of {len(org_state['projects'])} projects.")
+        else:
+            logging.info("Step 1: Fetching master project list from GCP...")
+            projects_data = refresh_and_cache_project_list()
+            if not projects_data:
+                logging.info("No projects found or an error occurred. Exiting.")
+                return
+            projects = projects_data
+            all_projects = projects
+
+    # This task's projects, including those a resumed run already finished.
+    shard_projects = projects
+
+    # Resume the previous run if it did not finish, instead of starting again from project zero.
+    journal = None
+    if SYNC_JOURNAL_ENABLED and not debug_project_id:
+        try:
+            journal = RunJournal(f"shard-{TASK_INDEX}-of-{TASK_COUNT}")
+            projects = journal.resume_or_start(f"{RUN_ID}@{start_time.isoformat()}", projects)
+        except Exception as e:
+            logging.warning(f"Run journal unavailable, this run cannot be resumed if interrupted: {e}")
+            journal = None
+
+    if ASYNC_COLLECTORS:
+        logging.info(f"Step 2: Starting data refresh for {len(projects)} projects on one event loop, up to {ASYNC_MAX_PROJECTS} at a time...")
     else:
-        logging.info("Step 1: Fetching master project list from GCP...")
-        projects_data = refresh_and_cache_project_list()
-        if not projects_data:
-            logging.info("No projects found or an error occurred. Exiting.")
-            return
-        project_ids = [p['project_id'] for p in projects_data]
-    logging.info(f"Step 2: Starting data refresh for {len(project_ids)} projects with {MAX_WORKERS} parallel workers...")
+        logging.info(f"Step 2: Starting data refresh for {len(projects)} projects with {MAX_WORKERS} parallel {SYNC_EXECUTOR} workers...")
 
     successful_refreshes = []
     failed_refreshes = []
+    current_projects = []
 
-    # Step 2: Refresh each project's security data in parallel using Celery.
-    job = group(refresh_single_project_data_task.s(pid) for pid in project_ids)
-    result = job.apply_async()
+    # In incremental mode only projects whose inputs changed or whose data went stale are collected.
+    collect_project = collect_single_project_data
+    collect_project_async = collect_single_project_data_async
+    if INCREMENTAL_SYNC:
+        logging.info(f"Incremental sync enabled{' (full resync requested)' if FULL_RESYNC else ''}.")
+        collect_project = collect_project_incrementally
+        collect_project_async = collect_project_incrementally_async
 
-    logging.info(f"Submitted Celery group task {result.id}. Waiting for results...")
+    # Step 2: Refresh each project's security data in parallel. Results come back in project order.
+    # Finished projects are handed to a batch writer right away and only their status is kept.
+    # Projects whose content hash matches the stored one are not rewritten.
+    with timed_stage("load_content_hashes"):
+        try:
+            known_hashes = load_content_hashes()
+        except Exception as e:
+            logging.warning(f"Could not load stored content hashes, every project will be written: {e}")
+            known_hashes = {}
+    writer = DatastoreBatchWriter(known_hashes=known_hashes)
+    progress = ProgressReporter(len(projects))
 
-    # Wait for the tasks to complete and get the results
-    task_results = result.get()
+    # Projects whose collection hit transient failures are parked here and retried after the main pass.
+    deferred = []
+    awaiting_retry = set()
+    # The control statuses of the projects collected in this run, for the compliance rollups.
+    collected_statuses = {}
 
-    for res in task_results:
-        project_id, success, error_msg = res
-        if success:
-            successful_refreshes.append(project_id)
-        else:
+    def handle_error(project, e):
+        if isinstance(e, TransientFailuresError):
+            deferred.append(project)
+            awaiting_retry.add(project["project_id"])
+        return project["project_id"], None, str(e)
+
+    def save_result(index, project, result):
+        project_id, security_data, error_msg = result
+        if project_id in awaiting_retry:
+            # Recorded once its deferred retry finishes.
+            return project_id, error_msg
+        if security_data is not None:
+            # Incremental runs always store the new collection times, even if the data is unchanged.
+            writer.add(project_id, security_data, always_write=INCREMENTAL_SYNC)
+            collected_statuses[project_id] = control_statuses(security_data)
+        elif not error_msg:
+            current_projects.append(project_id)
+        progress.update()
+        if journal:
+            journal.mark(project_id, error_msg)
+            if journal.checkpoint_due():
+                # Only checkpoint projects as done once their data is actually in Datastore.
+                writer.flush()
+                journal.checkpoint(writer.failures)
+        return project_id, error_msg
+
+    def run_pass(pass_projects, defer_transient):
+        options = {"defer_transient": defer_transient}
+        if INCREMENTAL_SYNC:
+            # The stored data the incremental plans start from, read in batches.
+            options["stored_data"] = DashboardDataLoader([project["project_id"] for project in pass_projects])
+        if ASYNC_COLLECTORS:
+            return run_async_pipeline(
+                partial(collect_project_async, **options),
+                pass_projects,
+                timeout=PROJECT_TIMEOUT_SECONDS,
+                on_error=handle_error,
+                on_result=save_result,
+            )
+        return run_ordered(
+            partial(collect_project, **options),
+            pass_projects,
+            max_workers=MAX_WORKERS,
+            timeout=PROJECT_TIMEOUT_SECONDS,
+            on_error=handle_error,
+            on_result=save_result,
+        )
+
+    with timed_stage("collect"):
+        task_results = run_pass(projects, defer_transient=DEFERRED_RETRY_ROUNDS > 0)
+
+    # Step 3: Retry projects with transient failures, with jittered backoff between rounds. The
+    # last round keeps whatever it collects, marking the failed controls as errors.
+    retried_results = {}
+    for retry_round in range(1, DEFERRED_RETRY_ROUNDS + 1):
+        if not deferred:
+            break
+        retry_projects = list(deferred)
+        deferred.clear()
+        awaiting_retry.clear()
+        delay = random.uniform(0, DEFERRED_RETRY_BACKOFF_SECONDS * 2 ** (retry_round - 1))
+        logging.info(f"Step 3: Retrying {len(retry_projects)} projects with transient failures in {delay:.1f}s (round {retry_round}/{DEFERRED_RETRY_ROUNDS})...")
+        time.sleep(delay)
+        # Shared org-level results that failed transiently are fetched again as well.
+        drop_failures(is_transient)
+        with timed_stage("deferred_retries"):
+            retried = run_pass(retry_projects, defer_transient=retry_round < DEFERRED_RETRY_ROUNDS)
+        retried_results.update(retried)
+    task_results = [(project_id, retried_results.get(project_id, error_msg)) for project_id, error_msg in task_results]
+
+    with timed_stage("write"):
+        writer.close()
+        if journal:
+            journal.finish(writer.failures)
+
+    for project_id, error_msg in task_results:
+        if not error_msg and project_id in writer.failures:
+            error_msg = f"Failed to save to Datastore: {writer.failures[project_id]}"
+        if error_msg:
             failed_refreshes.append((project_id, error_msg))
+        else:
+            successful_refreshes.append(project_id)
+
+    # Org-wide control x status counts, so the backend does not read every project's data.
+    # Projects whose data could not be written still count with their stored statuses.
+    if COMPLIANCE_ROLLUPS and not debug_project_id:
+        with timed_stage("rollups"):
+            try:
+                written_statuses = {pid: statuses for pid, statuses in collected_statuses.items() if pid not in writer.failures}
+                update_compliance_rollups(ORGANIZATION_ID, all_projects, shard_projects, written_statuses, TASK_INDEX, TASK_COUNT)
+            except Exception as e:
+                logging.warning(f"Could not update the compliance rollups: {e}")
 
     end_time = datetime.now()
     duration = end_time - start_time
     logging.info(f"--- Data Synchronization Job Finished at {end_time.strftime('%Y-%m-%d %H:%M:%S')} ---")
     logging.info(f"--- Total execution time: {duration} ---")
-    logging.info(f"Successfully refreshed {len(successful_refreshes)} projects.")
+    client_stats = get_client_stats()
+    logging.info(f"Shared GCP clients: {client_stats['clients']} ({client_stats['open_channels']} open channels, {client_stats['discovery_clients']} of them discovery clients).")
+    close_all()
+    shutdown_collector_pool()
+    for api, stats in get_rate_limiter_stats().items():
+        logging.info(f"API {api}: {stats['calls']} calls, {stats['pages']} further pages, {stats['throttles']} throttles, {stats['retries']} retries, {stats['failures']} failures (concurrency limit {stats['concurrency_limit']}).")
+    for breaker, stats in get_circuit_breaker_stats().items():
+        if stats["skipped_calls"] or stats["open"]:
+            logging.warning(f"Circuit {breaker}: {'open' if stats['open'] else 'closed'}, {stats['skipped_calls']} calls skipped.")
+    negative_cache_stats = get_negative_cache_stats()
+    logging.info(f"Negative cache: {negative_cache_stats['hits']} calls skipped, {negative_cache_stats['recorded']} new failures cached, {negative_cache_stats['entries']} entries.")
+    logging.info(f"Successfully refreshed {len(successful_refreshes)} projects ({progress.throughput():.1f} projects/min).")
+    logging.info(f"Changed projects written: {len(writer.changed)}, unchanged projects skipped: {len(writer.unchanged)}.")
+    if INCREMENTAL_SYNC:
+        logging.info(f"Projects not re-collected because their data is current: {len(current_projects)}.")
     if failed_refreshes:
         logging.warning(f"Failed to refresh {len(failed_refreshes)} projects:")
         for pid, error in failed_refreshes:
@@ -112,5 +298,38 @@ def main():
     else:
         logging.info("All projects were refreshed successfully.")
 
+    # Machine-readable run report, stored so runs can be compared over time.
+    report = build_run_report(
+        RUN_ID if TASK_COUNT > 1 else f"{RUN_ID}@{start_time.isoformat()}",
+        start_time, end_time,
+        {
+            "projects": len(projects),
+            "successful": len(successful_refreshes),
+            "changed": len(writer.changed),
+            "unchanged": len(writer.unchanged),
+            "current": len(current_projects),
+            "datastore_writes": dict(writer.stats),
+        },
+        [{"project_id": pid, "error": error} for pid, error in failed_refreshes],
+    )
+    for name, stats in report["collectors"].items():
+        logging.info(f"Collector {name}: p50 {stats['p50']}s, p95 {stats['p95']}s, p99 {stats['p99']}s over {stats['count']} runs.")
+    if report["slowest_projects"]:
+        slowest = report["slowest_projects"][0]
+        logging.info(f"Slowest project: {slowest['project_id']} ({slowest['seconds']}s).")
+    try:
+        if TASK_COUNT > 1:
+            save_shard_report(report)
+        else:
+            save_run_report(report["run_id"], report)
+    except Exception as e:
+        logging.warning(f"Could not save the run report: {e}")
+
+    # Tell the backend that the stored data changed, so it stops serving its cached reads.
+    try:
+        save_sync_generation(f"{report['run_id']}:{TASK_INDEX}:{end_time.isoformat()}")
+    except Exception as e:
+        logging.warning(f"Could not save the sync generation: {e}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from .circuit_breaker import CallSkippedError, error_class, project_scoped_calls
+from .datastore_client import get_datastore_client
+from .rate_limiter import call_api, call_api_async
+
+load_dotenv()
+
+# --- Configuration ---
+# Project-scoped calls that failed because an API is not enabled or a permission is missing are
+# remembered across runs and not made again until the entry expires. Override the TTL per error
+# kind with NEGATIVE_CACHE_TTL_HOURS_<KIND>, e.g. NEGATIVE_CACHE_TTL_HOURS_PERMISSION_DENIED=12.
+# There is one entity per project and API ("<project id>|<api>"), with an indexed expires_at
+# timestamp; it is deleted once it has expired or a call to the API succeeds again.
+NEGATIVE_CACHE_ENABLED = os.getenv("NEGATIVE_CACHE_ENABLED", "true").lower() == "true"
+NEGATIVE_CACHE_KIND = "GcpNegativeCache"
+DEFAULT_NEGATIVE_CACHE_TTL_HOURS = {
+    "api_disabled": 72,
+    "not_activated": 72,
+    "permission_denied": 24,
+}
+NEGATIVE_CACHE_TTL_HOURS = {
+    kind: float(os.getenv(f"NEGATIVE_CACHE_TTL_HOURS_{kind.upper()}", hours))
+    for kind, hours in DEFAULT_NEGATIVE_CACHE_TTL_HOURS.items()
+}
+
+# Stored in each project's dashboard entity: the cached failures that caused skipped controls.
+CACHED_FAILURES_FIELD = "cached_failures"
+
+# Error messages that mean the API is not enabled on the project.
+API_DISABLED_MARKERS = ("SERVICE_DISABLED", "accessNotConfigured", "has not been used in project", "it is disabled")
+
+
+class CachedFailureError(CallSkippedError):
+    """Raised instead of making a call that is cached as failing for the project."""
+
+    def __init__(self, entry: dict):
+        super().__init__(
+            f"Skipped: {entry['api']} failed for this project with {entry['error_kind']} "
+            f"(cached until {entry['expires_at']}). Last error: {entry['error']}"
+        )
+        self.entry = entry
+
+
+def negative_error_kind(error: Exception):
+    """Returns the kind of a failure worth caching across runs, or None for any other error."""
+    if isinstance(error, CallSkippedError):
+        return None
+    message = str(error)
+    if any(marker in message for marker in API_DISABLED_MARKERS):
+        return "api_disabled"
+    klass = error_class(error)
+    if klass in ("PermissionDenied", "Forbidden", "HttpError403"):
+        return "permission_denied"
+    if klass == "FailedPrecondition":
+        return "not_activated"
+    return None
+
+
+_lock = threading.Lock()
+_entries = None  # (project_id, api) -> entry dict, loaded from Datastore on first use
+_stats = {"hits": 0, "recorded": 0}
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _entry_key(client, project_id: str, api: str):
+    return client.key(NEGATIVE_CACHE_KIND, f"{project_id}|{api}")
+
+
+def _delete_expired(client, now: datetime):
+    """Deletes the entries that have expired, found with a keys-only query on expires_at."""
+    query = client.query(kind=NEGATIVE_CACHE_KIND)
+    query.add_filter("expires_at", "<=", now)
+    query.keys_only()
+    keys = [entity.key for entity in query.fetch()]
+    for start in range(0, len(keys), 500):
+        client.delete_multi(keys[start:start + 500])
+    if keys:
+        logging.info(f"Deleted {len(keys)} expired negative cache entries.")
+
+
+def _get_entries():
+    """Loads the unexpired entries with one query, once per process, and deletes the expired ones."""
+    global _entries
+    with _lock:
+        if _entries is None:
+            entries = {}
+            try:
+                now = _now()
+                client = get_datastore_client()
+                query = client.query(kind=NEGATIVE_CACHE_KIND)
+                query.add_filter("expires_at", ">", now)
+                for entity in query.fetch():
+                    entry = dict(entity)
+                    entry["expires_at"] = entry["expires_at"].isoformat()
+                    entries[(entry["project_id"], entry["api"])] = entry
+                logging.info(f"Loaded {len(entries)} negative cache entries.")
+                _delete_expired(client, now)
+            except Exception as e:
+                logging.warning(f"Could not load the negative cache, every call will be made: {e}")
+            _entries = entries
+        return _entries
+
+
+def get_cached_failure(project_id: str, api: str):
+    """Returns the unexpired cached failure for (project_id, api), or None."""
+    entry = _get_entries().get((project_id, api))
+    if entry and datetime.fromisoformat(entry["expires_at"]) > _now():
+        return entry
+    return None
+
+
+def get_cached_failures(project_id: str) -> list:
+    """Returns the project's unexpired cached failures, sorted by API."""
+    entries = _get_entries()
+    now = _now()
+    with _lock:
+        return sorted(
+            (dict(entry) for (pid, _), entry in entries.items()
+             if pid == project_id and datetime.fromisoformat(entry["expires_at"]) > now),
+            key=lambda entry: entry["api"],
+        )
+
+
+def record_failure(project_id: str, api: str, error: Exception):
+    """Caches a failure for (project_id, api) if it is an API-disabled or permission error."""
+    kind = negative_error_kind(error)
+    if kind is None:
+        return
+    now = _now()
+    expires_at = now + timedelta(hours=NEGATIVE_CACHE_TTL_HOURS[kind])
+    entry = {
+        "project_id": project_id,
+        "api": api,
+        "error_kind": kind,
+        "error": str(error)[:1500],
+        "cached_at": now.isoformat(),
+        "expires_at": expires_at.isoformat(),
+    }
+    entries = _get_entries()
+    with _lock:
+        entries[(project_id, api)] = entry
+        _stats["recorded"] += 1
+    # Written through right away, since worker processes do not share this module's state. A
+    # failure of another kind replaces the project's entry for the API.
+    try:
+        client = get_datastore_client()
+        entity = client.entity(_entry_key(client, project_id, api), exclude_from_indexes=("error", "cached_at"))
+        entity.update(dict(entry, expires_at=expires_at))
+        client.put(entity)
+    except Exception as e:
+        logging.warning(f"Could not save negative cache entry for {project_id} {api}: {e}")
+
+
+def _has_entry(project_id: str, api: str) -> bool:
+    with _lock:
+        return _entries is not None and (project_id, api) in _entries
+
+
+def forget_failure(project_id: str, api: str):
+    """Deletes the (expired) cached failure of (project_id, api) after a call to it succeeded."""
+    with _lock:
+        if _entries is None or _entries.pop((project_id, api), None) is None:
+            return
+    try:
+        client = get_datastore_client()
+        client.delete(_entry_key(client, project_id, api))
+    except Exception as e:
+        logging.warning(f"Could not delete negative cache entry for {project_id} {api}: {e}")
+
+
+def call_project_api(project_id: str, api: str, func, *args, **kwargs):
+    """
+    Like call_api for a call scoped to one project, but raises CachedFailureError instead of
+    calling an API that is cached as not enabled or not permitted for the project, and caches
+    new failures of that kind. Those failures concern only the project, so they do not count
+    against the API's circuit breakers. A success deletes the project's expired entry for the API.
+    """
+    if not NEGATIVE_CACHE_ENABLED:
+        with project_scoped_calls():
+            return call_api(api, func, *args, **kwargs)
+
+    entry = get_cached_failure(project_id, api)
+    if entry:
+        with _lock:
+            _stats["hits"] += 1
+        raise CachedFailureError(entry)
+    try:
+        with project_scoped_calls():
+            result = call_api(api, func, *args, **kwargs)
+    except Exception as e:
+        record_failure(project_id, api, e)
+        raise
+    forget_failure(project_id, api)
+    return result
+
+
+async def call_project_api_async(project_id: str, api: str, func, *args, **kwargs):
+    """The async counterpart of call_project_api. Call load_negative_cache first, off the event loop."""
+    if not NEGATIVE_CACHE_ENABLED:
+        with project_scoped_calls():
+            return await call_api_async(api, func, *args, **kwargs)
+
+    entry = get_cached_failure(project_id, api)
+    if entry:
+        with _lock:
+            _stats["hits"] += 1
+        raise CachedFailureError(entry)
+    try:
+        with project_scoped_calls():
+            result = await call_api_async(api, func, *args, **kwargs)
+    except Exception as e:
+        if negative_error_kind(e):
+            await asyncio.to_thread(record_failure, project_id, api, e)
+        raise
+    if _has_entry(project_id, api):
+        await asyncio.to_thread(forget_failure, project_id, api)
+    return result
+
+
+def load_negative_cache():
+    """Loads the cached failures from Datastore if they are not loaded yet."""
+    _get_entries()
+
+
+def invalidate_negative_cache(project_id: str = None) -> int:
+    """
+    Drops the cached failures of one project, or of all projects when project_id is None, so
+    their calls are made again. Returns the number of entries deleted from Datastore.
+    """
+    client = get_datastore_client()
+    query = client.query(kind=NEGATIVE_CACHE_KIND)
+    if project_id:
+        query.add_filter("project_id", "=", project_id)
+    query.keys_only()
+    keys = [entity.key for entity in query.fetch()]
+    for start in range(0, len(keys), 500):
+        client.delete_multi(keys[start:start + 500])
+
+    with _lock:
+        if _entries is not None:
+            for key in [k for k in _entries if project_id is None or k[0] == project_id]:
+                del _entries[key]
+    logging.info(f"Invalidated {len(keys)} negative cache entries for {project_id or 'all projects'}.")
+    return len(keys)
+
+
+def reset_negative_cache():
+    """Forgets the loaded entries, so the next lookup reloads them. Called at the start of every run."""
+    global _entries
+    with _lock:
+        _entries = None
+        _stats.update(hits=0, recorded=0)
+
+
+def get_negative_cache_stats():
+    with _lock:
+        return dict(_stats, entries=len(_entries or {}))
@@ -1,7 +1,26 @@
 import logging
 import asyncio
+import contextvars
+import json
+import os
+import zlib
 from concurrent.futures import ThreadPoolExecutor
 from google.cloud import orgpolicy_v2
+from google.protobuf import json_format
+from .circuit_breaker import CallSkippedError
+from .clients import get_folders_client, get_org_policy_client, get_projects_client
+from .executor import MAX_WORKERS
+from .rate_limiter import call_api, collect_pages, list_pages
+from .run_cache import memoize_call, memoize_call_async
+
+# "hierarchy" evaluates policies locally from cached org/folder policies plus one
+# list_policies call per project (and, once per run, the default of each constraint not set
+# anywhere); "effective" calls get_effective_policy per constraint.
+ORG_POLICY_EVALUATION = os.getenv("ORG_POLICY_EVALUATION", "hierarchy").lower()
+
+# Dashboard data field holding the full policies behind a project's org_policies entries, as
+# zlib-compressed JSON keyed by constraint. The entries themselves only keep a compact summary.
+ORG_POLICY_DETAILS_FIELD = "org_policy_details"
 
 # List of organization policy constraints to check
 EFFECTIVE_ORG_POLICIES_TO_CHECK = [
@@ -57,48 +76,342 @@ EFFECTIVE_ORG_POLICIES_TO_CHECK = [
     "compute.vmExternalIpAccess",
 ]
 
+def _rule_summary(rule):
+    """Returns what a policy rule does: its enforcement or values, and its condition if any."""
+    summary = {}
+    kind = rule._pb.WhichOneof("kind")
+    if kind == "values":
+        if rule.values.allowed_values:
+            summary["allowed_values"] = list(rule.values.allowed_values)
+        if rule.values.denied_values:
+            summary["denied_values"] = list(rule.values.denied_values)
+    elif kind:
+        summary[kind] = getattr(rule, kind)
+    if rule.condition and rule.condition.expression:
+        summary["condition"] = rule.condition.expression
+    if rule._pb.HasField("parameters"):
+        summary["parameters"] = json_format.MessageToDict(rule._pb.parameters)
+    return summary
+
+def _policy_summary(policy, sources=None):
+    """
+    Returns the compact details of an effective policy: its rules, whether it inherits from or
+    resets its parent's policy, and when it was last updated. For a policy evaluated from the
+    hierarchy, sources are the policies it was evaluated from, and set_on lists their nodes.
+    """
+    spec = policy.spec
+    summary = {"rules": [_rule_summary(rule) for rule in spec.rules] if spec else []}
+    if spec and spec.inherit_from_parent:
+        summary["inherit_from_parent"] = True
+    if spec and spec.reset:
+        summary["reset"] = True
+    update_times = [p.spec.update_time for p in (sources if sources is not None else [policy]) if p.spec and p.spec.update_time]
+    if update_times:
+        summary["update_time"] = max(update_times).isoformat()
+    if sources:
+        summary["set_on"] = [p.name.split("/policies/")[0] for p in sources]
+    return summary
+
+def _policy_json(policy):
+    return json_format.MessageToDict(policy._pb)
+
+def _policy_result(constraint, policy, sources=None):
+    """
+    Builds the dashboard entry for an effective policy. The full policy (and the policies it
+    was evaluated from) is kept under "payload" until pack_policy_details moves it out.
+    """
+    status = "Disabled"
+
+    # A policy is "Enabled" if its spec has at least one rule that is enforced.
+    if policy.spec and policy.spec.rules:
+        if any(rule.enforce for rule in policy.spec.rules):
+            status = "Enabled"
+
+    payload = {"policy": _policy_json(policy)}
+    if sources is not None:
+        payload["sources"] = [_policy_json(source) for source in sources]
+    return {
+        "name": constraint,
+        "status": status,
+        "controlType": "Org Policy",
+        "details": _policy_summary(policy, sources),
+        "ControlObjective": "Enforce Organizational Standards",
+        "payload": payload,
+    }
+
+def pack_policy_details(entries):
+    """
+    Moves the full policies out of a project's org_policies entries into one zlib-compressed
+    JSON blob keyed by constraint, stored in ORG_POLICY_DETAILS_FIELD and only decoded when
+    a policy's details are requested.
+
+    Returns:
+        An (entries, blob) tuple; blob is None when no entry has a policy.
+    """
+    packed, payloads = [], {}
+    for entry in entries:
+        entry = dict(entry)
+        payload = entry.pop("payload", None)
+        if payload is not None:
+            payloads[entry["name"]] = payload
+        packed.append(entry)
+    if not payloads:
+        return packed, None
+    return packed, zlib.compress(json.dumps(payloads, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+def _error_result(constraint, e):
+    return {
+        "name": constraint,
+        "status": "Skipped" if isinstance(e, CallSkippedError) else "Error",
+        "controlType": "Org Policy",
+        "details": str(e),
+        "ControlObjective": "Enforce Organizational Standards"
+    }
+
 def _fetch_single_policy(org_policy_client, project_id, constraint):
     """Fetches a single effective organization policy and determines its status."""
     policy_name = f"projects/{project_id}/policies/{constraint}"
     try:
         #logging.info(f"Fetching effective policy for: {constraint}")
-        policy = org_policy_client.get_effective_policy(name=policy_name)
-        status = "Disabled"
-
-        # A policy is "Enabled" if its spec has at least one rule that is enforced.
-        if policy.spec and policy.spec.rules:
-            if any(rule.enforce for rule in policy.spec.rules):
-                status = "Enabled"
-                
-        return {
-            "name": constraint, 
-            "status": status, 
-            "controlType": "Org Policy",
-            "details": str(policy),
-            "ControlObjective": "Enforce Organizational Standards"
-        }
+        policy = call_api("orgpolicy", org_policy_client.get_effective_policy, name=policy_name)
+        return _policy_result(constraint, policy)
     except Exception as e:
         logging.error(f"Failed to fetch effective policy for {constraint}: {e}")
-        return {
-            "name": constraint, 
-            "status": "Error", 
-            "controlType": "Org Policy",
-            "details": str(e),
-            "ControlObjective": "Enforce Organizational Standards"
-        }
+        return _error_result(constraint, e)
+
+def list_policies_at(org_policy_client, node):
+    """
+    Returns the policies set directly on an ancestry node ('organizations/..', 'folders/..'
+    or 'projects/..') as a dict of constraint -> Policy. Org and folder results are memoized
+    for the whole run, so they are fetched once no matter how many projects share them.
+    """
+    def fetch():
+        policies = {}
+        for policy in call_api("orgpolicy", lambda: list_pages(org_policy_client.list_policies(parent=node))):
+            policies[policy.name.split('/')[-1]] = policy
+        return policies
+
+    return memoize_call("orgpolicy.list_policies", node, fetch)
+
+async def list_policies_at_async(ctx, node):
+    """The async counterpart of list_policies_at, sharing its memoized results."""
+    async def fetch():
+        client = ctx.client("orgpolicy")
+        policies = {}
+        for policy in await ctx.call("orgpolicy", lambda: collect_pages(client.list_policies(parent=node))):
+            policies[policy.name.split('/')[-1]] = policy
+        return policies
+
+    return await memoize_call_async("orgpolicy.list_policies", node, fetch)
+
+def _resolve_ancestry(project):
+    """
+    Returns the project's ancestors, top-down, e.g. ['organizations/1', 'folders/2'].
+    Uses the ancestry recorded by the project listing when present.
+    """
+    if project.get("ancestry"):
+        return list(project["ancestry"])
+
+    parent = project.get("parent")
+    if not parent:
+        parent = call_api("cloudresourcemanager", get_projects_client().get_project, name=f"projects/{project['project_id']}").parent
+
+    folders_client = get_folders_client()
+    ancestors = []
+    while parent.startswith("folders/"):
+        ancestors.append(parent)
+        folder = memoize_call(
+            "resourcemanager.get_folder", parent,
+            lambda name=parent: call_api("cloudresourcemanager", folders_client.get_folder, name=name),
+        )
+        parent = folder.parent
+    ancestors.append(parent)
+    return list(reversed(ancestors))
+
+async def _resolve_ancestry_async(ctx, project):
+    """The async counterpart of _resolve_ancestry."""
+    if project.get("ancestry"):
+        return list(project["ancestry"])
+
+    parent = project.get("parent")
+    if not parent:
+        projects_client = ctx.client("resourcemanager.projects")
+        parent = (await ctx.call("cloudresourcemanager", projects_client.get_project, name=f"projects/{project['project_id']}")).parent
+
+    folders_client = ctx.client("resourcemanager.folders")
+    ancestors = []
+    while parent.startswith("folders/"):
+        ancestors.append(parent)
+        folder = await memoize_call_async(
+            "resourcemanager.get_folder", parent,
+            lambda name=parent: ctx.call("cloudresourcemanager", folders_client.get_folder, name=name),
+        )
+        parent = folder.parent
+    ancestors.append(parent)
+    return list(reversed(ancestors))
+
+def _evaluate_effective_policy(constraint, ancestry_policies):
+    """
+    Computes a constraint's effective rules from the policies set along the hierarchy
+    (top-down), following the Org Policy v2 inheritance rules: a child policy replaces its
+    parent's rules unless it sets inherit_from_parent (rules are merged), and reset restores
+    the constraint's default behavior.
+
+    Returns:
+        A (rules, sources) tuple; sources are the policies the rules were evaluated from.
+    """
+    effective_rules, sources = [], []
+    for policies in ancestry_policies:
+        policy = policies.get(constraint)
+        if not policy or not policy.spec:
+            continue
+        if policy.spec.reset:
+            effective_rules, sources = [], [policy]
+        elif policy.spec.inherit_from_parent:
+            effective_rules, sources = effective_rules + list(policy.spec.rules), sources + [policy]
+        else:
+            effective_rules, sources = list(policy.spec.rules), [policy]
+    return effective_rules, sources
+
+def _evaluate_effective_rules(constraint, ancestry_policies):
+    """Returns only the effective rules computed by _evaluate_effective_policy."""
+    return _evaluate_effective_policy(constraint, ancestry_policies)[0]
+
+def get_default_policy(org_policy_client, project_id, constraint):
+    """
+    Returns a constraint's default policy, i.e. its effective policy on a project with no
+    explicit policy for it in its hierarchy. Some constraints are enforced by default, which
+    the policies set along the hierarchy do not show. Memoized per constraint for the whole run.
+    """
+    return memoize_call(
+        "orgpolicy.default_policy", constraint,
+        lambda: call_api("orgpolicy", org_policy_client.get_effective_policy, name=f"projects/{project_id}/policies/{constraint}"),
+    )
+
+async def get_default_policy_async(ctx, project_id, constraint):
+    """The async counterpart of get_default_policy, sharing its memoized results."""
+    client = ctx.client("orgpolicy")
+    return await memoize_call_async(
+        "orgpolicy.default_policy", constraint,
+        lambda: ctx.call("orgpolicy", client.get_effective_policy, name=f"projects/{project_id}/policies/{constraint}"),
+    )
+
+def get_all_policies_by_hierarchy(project_id: str, project: dict = None):
+    """
+    Evaluates all checked organization policies for a project from the policies set along
+    its resource hierarchy. Org and folder policies are cached across projects, so a project
+    without overrides costs a single list_policies call. Constraints left at their default
+    use get_default_policy.
+
+    Returns the same entries as _fetch_single_policy.
+    """
+    org_policy_client = get_org_policy_client()
+    project = project or {"project_id": project_id}
+    try:
+        nodes = _resolve_ancestry(project) + [f"projects/{project_id}"]
+        ancestry_policies = [list_policies_at(org_policy_client, node) for node in nodes]
+    except Exception as e:
+        logging.error(f"Failed to list organization policies for project {project_id}: {e}")
+        return [_error_result(constraint, e) for constraint in EFFECTIVE_ORG_POLICIES_TO_CHECK]
+
+    evaluated = _evaluate_hierarchy(ancestry_policies)
+    defaults = {}
+    for constraint in _defaulted_constraints(evaluated):
+        try:
+            defaults[constraint] = get_default_policy(org_policy_client, project_id, constraint)
+        except Exception as e:
+            logging.error(f"Failed to fetch the default policy for {constraint}: {e}")
+            defaults[constraint] = e
+    return _hierarchy_results(project_id, evaluated, defaults)
+
+def _evaluate_hierarchy(ancestry_policies):
+    """Returns {constraint: (rules, sources)} for every checked constraint."""
+    return {
+        constraint: _evaluate_effective_policy(constraint, ancestry_policies)
+        for constraint in EFFECTIVE_ORG_POLICIES_TO_CHECK
+    }
+
+def _defaulted_constraints(evaluated):
+    """Returns the constraints without effective rules, which behave as their defaults."""
+    return [constraint for constraint, (rules, _) in evaluated.items() if not rules]
+
+def _hierarchy_results(project_id, evaluated, defaults):
+    """
+    Builds the entries for every checked constraint from its evaluated rules, or from its
+    default policy (or the error fetching it) in defaults if it has none.
+    """
+    results = []
+    for constraint, (rules, sources) in evaluated.items():
+        spec = orgpolicy_v2.PolicySpec(rules=rules)
+        if not rules:
+            default = defaults[constraint]
+            if isinstance(default, Exception):
+                results.append(_error_result(constraint, default))
+                continue
+            spec = default.spec
+        policy = orgpolicy_v2.Policy(name=f"projects/{project_id}/policies/{constraint}", spec=spec)
+        results.append(_policy_result(constraint, policy, sources))
+    return results
 
-async def get_all_effective_policies(project_id: str):
+async def get_all_effective_policies(project_id: str, project: dict = None):
     """
-    Fetches all effective organization policies for a given project concurrently.
+    Fetches all effective organization policies for a given project.
+
+    With ORG_POLICY_EVALUATION=hierarchy (the default) the policies are evaluated locally from
+    the cached hierarchy; with ORG_POLICY_EVALUATION=effective every constraint is fetched
+    with its own get_effective_policy call, concurrently.
     """
-    org_policy_client = orgpolicy_v2.OrgPolicyClient()
-    
+    if ORG_POLICY_EVALUATION == "hierarchy":
+        return get_all_policies_by_hierarchy(project_id, project)
+
+    org_policy_client = get_org_policy_client()
+
     loop = asyncio.get_running_loop()
-    with ThreadPoolExecutor() as pool:
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        # Each call runs in a copy of the caller's context so transient failures are tracked for this project.
         tasks = [
-            loop.run_in_executor(pool, _fetch_single_policy, org_policy_client, project_id, constraint)
+            loop.run_in_executor(pool, contextvars.copy_context().run, _fetch_single_policy, org_policy_client, project_id, constraint)
             for constraint in EFFECTIVE_ORG_POLICIES_TO_CHECK
         ]
         results = await asyncio.gather(*tasks)
-    
-    return results
\ No newline at end of file
+
+    return results
+
+async def _fetch_single_policy_async(ctx, project_id, constraint):
+    """The async counterpart of _fetch_single_policy."""
+    policy_name = f"projects/{project_id}/policies/{constraint}"
+    try:
+        client = ctx.client("orgpolicy")
+        policy = await ctx.call("orgpolicy", client.get_effective_policy, name=policy_name)
+        return _policy_result(constraint, policy)
+    except Exception as e:
+        logging.error(f"Failed to fetch effective policy for {constraint}: {e}")
+        return _error_result(constraint, e)
+
+async def get_all_effective_policies_async(ctx, project_id: str, project: dict = None):
+    """
+    Like get_all_effective_policies, but makes every call on the pipeline's event loop with
+    the async Org Policy and Resource Manager clients.
+    """
+    if ORG_POLICY_EVALUATION != "hierarchy":
+        return list(await asyncio.gather(*(
+            _fetch_single_policy_async(ctx, project_id, constraint) for constraint in EFFECTIVE_ORG_POLICIES_TO_CHECK
+        )))
+
+    project = project or {"project_id": project_id}
+    try:
+        nodes = await _resolve_ancestry_async(ctx, project) + [f"projects/{project_id}"]
+        ancestry_policies = [await list_policies_at_async(ctx, node) for node in nodes]
+    except Exception as e:
+        logging.error(f"Failed to list organization policies for project {project_id}: {e}")
+        return [_error_result(constraint, e) for constraint in EFFECTIVE_ORG_POLICIES_TO_CHECK]
+
+    evaluated = _evaluate_hierarchy(ancestry_policies)
+    constraints = _defaulted_constraints(evaluated)
+    fetched = await asyncio.gather(
+        *(get_default_policy_async(ctx, project_id, constraint) for constraint in constraints), return_exceptions=True,
+    )
+    for constraint, default in zip(constraints, fetched):
+        if isinstance(default, Exception):
+            logging.error(f"Failed to fetch the default policy for {constraint}: {default}")
+    return _hierarchy_results(project_id, evaluated, dict(zip(constraints, fetched)))
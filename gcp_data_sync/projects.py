@@ -1,8 +1,12 @@
 from fastapi import HTTPException
-from google.cloud import resourcemanager_v3, compute_v1
+from google.cloud import resourcemanager_v3
 from google.api_core import exceptions
 import logging
 import os
+from .clients import get_folders_client, get_projects_client
+from .executor import MAX_WORKERS, run_ordered
+from .folder_graph import children_by_parent, refresh_folder_graph
+from .rate_limiter import call_api, list_pages
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,7 +14,12 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
 def get_projects_in_org(region: str = None, folderName: str = None):
-    """Recursively fetches all projects under an organization, optionally filtered by region or folder."""
+    """
+    Fetches all projects under an organization, optionally filtered by region or folder.
+
+    Each project records its full ancestry ('organizations/..', 'folders/..', top-down) and
+    the display names of its folders in folder_path.
+    """
     organization_id = os.getenv("ORGANIZATION_ID")
     if not organization_id or organization_id == "YOUR_ORGANIZATION_ID_HERE":
         raise HTTPException(
@@ -19,40 +28,25 @@ def get_projects_in_org(region: str = None, folderName: str = None):
         )
 
     try:
-        project_client = resourcemanager_v3.ProjectsClient()
-        folders_client = resourcemanager_v3.FoldersClient()
-        compute_client = compute_v1.InstancesClient()
-        
-        all_projects = {}
+        project_client = get_projects_client()
+        folders_client = get_folders_client()
 
-        def process_projects(query, folder_name=None):
-            request = resourcemanager_v3.SearchProjectsRequest(query=query)
-            for project in project_client.search_projects(request=request):
-                if project.project_id not in all_projects:
-                    project_details = {
-                        "project_id": project.project_id,
-                        "display_name": project.display_name,
-                        "state": project.state.name,
-                        "environment": project.labels.get("environment", "N/A")
-                    }
-                    if folder_name:
-                        project_details["folder_name"] = folder_name
-                    all_projects[project.project_id] = project_details
+        def list_projects(parent):
+            request = resourcemanager_v3.SearchProjectsRequest(query=f"parent:{parent}")
+            return call_api("cloudresourcemanager", lambda: list_pages(project_client.search_projects(request=request)))
 
-        def traverse_folders(parent):
-            request = resourcemanager_v3.ListFoldersRequest(parent=parent)
-            for folder in folders_client.list_folders(request=request):
-                folder_id = folder.name.split('/')[-1]
-                logging.info(f"Scanning folder: {folder.display_name} ({folder_id})")
-                process_projects(query=f"parent:folders/{folder_id}", folder_name=folder.display_name)
-                traverse_folders(parent=folder.name)
+        def scan_node(node):
+            """Lists a node's projects, concurrently with the other nodes."""
+            if node["name"].startswith("folders/"):
+                logging.info(f"Scanning folder: {node['display_name']} ({node['name'].split('/')[-1]})")
+            return list_projects(node["name"])
 
         start_parent = f"organizations/{organization_id}"
         if folderName:
             logging.info(f"Searching for folder with displayName: {folderName}")
             try:
                 search_request = resourcemanager_v3.SearchFoldersRequest(query=f'displayName="{folderName}" AND parent=organizations/{organization_id}')
-                search_results = folders_client.search_folders(request=search_request)
+                search_results = call_api("cloudresourcemanager", lambda: list_pages(folders_client.search_folders(request=search_request)))
                 first_folder = next(iter(search_results), None)
                 if first_folder:
                     start_parent = first_folder.name
@@ -65,22 +59,69 @@ def get_projects_in_org(region: str = None, folderName: str = None):
                 raise HTTPException(status_code=500, detail=f"Error finding folder: {e}")
 
         # Start traversal from the determined parent (org or specific folder)
-        current_folder_name = None
-        if folderName:
+        root = {
+            "name": start_parent,
             # We already found the folder and its name is in the folderName variable.
-            current_folder_name = folderName
-
-        logging.info(f"Scanning projects under parent: {start_parent}")
-        process_projects(query=f"parent:{start_parent}", folder_name=current_folder_name)
+            "display_name": folderName,
+            "ancestry": [f"organizations/{organization_id}"] if folderName else [],
+            "folder_path": [],
+        }
 
+        # The folder hierarchy comes from the folder graph, which only lists the folders whose
+        # children changed since the last run. Every node's projects are then listed in parallel,
+        # bounded by MAX_WORKERS.
         logging.info(f"Starting folder traversal under parent: {start_parent}")
-        traverse_folders(parent=start_parent)
+        graph = refresh_folder_graph(organization_id)
+        child_folders = children_by_parent(graph["folders"])
+        scanned = {}  # node name -> (node, projects, child nodes)
+        nodes = []
+        level = [root]
+        while level:
+            next_level = []
+            for node in level:
+                ancestry = node["ancestry"] + [node["name"]]
+                folder_path = node["folder_path"] + ([node["display_name"]] if node["display_name"] else [])
+                children = [
+                    {"name": name, "display_name": graph["folders"][name]["display_name"], "ancestry": ancestry, "folder_path": folder_path}
+                    for name in child_folders.get(node["name"], [])
+                ]
+                nodes.append((node, children))
+                next_level.extend(children)
+            level = next_level
+        results = run_ordered(scan_node, [node for node, _ in nodes], max_workers=MAX_WORKERS, mode="thread")
+        for (node, children), projects in zip(nodes, results):
+            scanned[node["name"]] = (node, projects, children)
 
-        projects_list = list(all_projects.values())
+        # Assemble the projects in depth-first order (a node's own projects, then each child
+        # folder's subtree), which is the order the serial recursive walk produced.
+        all_projects = {}
+
+        def collect(node_name):
+            node, projects, children = scanned[node_name]
+            for project in projects:
+                if project.project_id not in all_projects:
+                    project_details = {
+                        "project_id": project.project_id,
+                        "project_number": project.name.split('/')[-1],
+                        "parent": project.parent,
+                        "ancestry": node["ancestry"] + [node["name"]],
+                        "folder_path": node["folder_path"] + ([node["display_name"]] if node["display_name"] else []),
+                        "display_name": project.display_name,
+                        "update_time": project.update_time.isoformat() if project.update_time else None,
+                        "etag": project.etag,
+                        "state": project.state.name,
+                        "environment": project.labels.get("environment", "N/A")
+                    }
+                    if node["display_name"]:
+                        project_details["folder_name"] = node["display_name"]
+                    all_projects[project.project_id] = project_details
+            for child in children:
+                collect(child["name"])
 
-       
+        collect(root["name"])
+        projects_list = list(all_projects.values())
 
-        logging.info(f"Successfully fetched a total of {len(projects_list)} unique projects.")
+        logging.info(f"Successfully fetched a total of {len(projects_list)} unique projects across {len(scanned) - 1} folders.")
         return projects_list
 
     except exceptions.PermissionDenied as e:
@@ -0,0 +1,330 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from google.api_core import exceptions
+from googleapiclient.errors import HttpError
+from dotenv import load_dotenv
+from .circuit_breaker import check_circuit, is_transient, note_transient_failure, record_failure, record_success
+from .run_metrics import note_page, track_api_call
+
+load_dotenv()
+
+# --- Configuration ---
+# Default sustained queries per second for each API. Each can be overridden with
+# <API>_QPS and <API>_MAX_CONCURRENCY, e.g. ORGPOLICY_QPS=5.
+DEFAULT_API_QPS = {
+    "orgpolicy": 20,
+    "securitycentermanagement": 10,
+    "compute": 20,
+    "cloudresourcemanager": 10,
+    "accesscontextmanager": 5,
+}
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", 10))
+MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", 5))
+BACKOFF_BASE_SECONDS = float(os.getenv("API_BACKOFF_BASE_SECONDS", 1.0))
+BACKOFF_MAX_SECONDS = float(os.getenv("API_BACKOFF_MAX_SECONDS", 32.0))
+
+# Only quota errors are retried inline. Other transient errors (unavailable, deadline exceeded,
+# internal) are left to the sync job's deferred retry pass.
+RETRYABLE_EXCEPTIONS = (exceptions.ResourceExhausted, exceptions.TooManyRequests)
+RETRYABLE_HTTP_STATUSES = (429,)
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for quota (429) errors from gRPC, REST and discovery clients."""
+    if isinstance(error, RETRYABLE_EXCEPTIONS):
+        return True
+    return isinstance(error, HttpError) and getattr(error.resp, "status", None) in RETRYABLE_HTTP_STATUSES
+
+
+class ApiLimiter:
+    """
+    Token bucket plus an AIMD concurrency limit for a single API.
+
+    The bucket caps the sustained request rate at qps (with up to one second of burst). The
+    concurrency limit grows by roughly one slot per fully used window on success and is halved
+    on every throttle, down to a single in-flight call.
+    """
+
+    def __init__(self, api: str, qps: float, max_concurrency: int):
+        self.api = api
+        self.qps = qps
+        self.capacity = max(1.0, qps)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        # "pages" counts the tokens taken for further pages of listings, on top of "calls".
+        self.stats = {"calls": 0, "pages": 0, "throttles": 0, "retries": 0, "failures": 0}
+        self._cond = threading.Condition()
+        # (loop, event) pairs of acquire_async calls waiting for a concurrency slot.
+        self._async_waiters = []
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.qps)
+        self.updated = now
+
+    def _try_acquire(self):
+        """
+        Takes a concurrency slot and a token if both are available and returns 0. Otherwise
+        returns how long to wait for a token, or None if every concurrency slot is in use.
+        Must be called with the condition held.
+        """
+        if self.in_flight >= int(self.concurrency_limit):
+            return None
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.in_flight += 1
+            self.stats["calls"] += 1
+            return 0
+        return (1 - self.tokens) / self.qps
+
+    def acquire(self):
+        """Blocks until a concurrency slot and a token are both available, then takes them."""
+        with self._cond:
+            while True:
+                wait = self._try_acquire()
+                if wait == 0:
+                    return
+                self._cond.wait(wait)
+
+    async def acquire_async(self):
+        """
+        Like acquire, but yields to the event loop instead of blocking the thread. Waits for a
+        concurrency slot until release signals one, and sleeps only while the bucket refills.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            event = None
+            with self._cond:
+                wait = self._try_acquire()
+                if wait is None:
+                    event = asyncio.Event()
+                    self._async_waiters.append((loop, event))
+            if wait == 0:
+                return
+            if event is not None:
+                await event.wait()
+            else:
+                await asyncio.sleep(wait)
+
+    def _try_take_token(self):
+        """Takes a token and returns 0, or returns how long to wait for one. Must be called with the condition held."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.stats["pages"] += 1
+            return 0
+        return (1 - self.tokens) / self.qps
+
+    def take_token(self):
+        """Blocks until a token is available and takes it, for a further request of a call that holds a slot."""
+        with self._cond:
+            while True:
+                wait = self._try_take_token()
+                if wait == 0:
+                    return
+                self._cond.wait(wait)
+
+    async def take_token_async(self):
+        """Like take_token, but yields to the event loop while the bucket refills."""
+        while True:
+            with self._cond:
+                wait = self._try_take_token()
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, throttled: bool = False):
+        """Returns the concurrency slot and adapts the limit to the call's outcome."""
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.stats["throttles"] += 1
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            else:
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The waiter's event loop has already been closed.
+                pass
+
+    def record(self, stat: str):
+        with self._cond:
+            self.stats[stat] += 1
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, concurrency_limit=round(self.concurrency_limit, 2), in_flight=self.in_flight)
+
+
+_lock = threading.Lock()
+_limiters = {}
+# The limiter of the call_api call running in this thread or task, which list_pages and
+# collect_pages take a token from for every page after the first.
+_current_limiter = contextvars.ContextVar("current_limiter", default=None)
+
+
+def get_limiter(api: str) -> ApiLimiter:
+    """Returns the process-wide limiter for an API, creating it on first use."""
+    with _lock:
+        limiter = _limiters.get(api)
+        if limiter is None:
+            qps = float(os.getenv(f"{api.upper()}_QPS", DEFAULT_API_QPS.get(api, 10)))
+            max_concurrency = int(os.getenv(f"{api.upper()}_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+            limiter = _limiters[api] = ApiLimiter(api, qps, max_concurrency)
+        return limiter
+
+
+def call_api(api: str, func, *args, **kwargs):
+    """
+    Calls func(*args, **kwargs) through the API's limiter.
+
+    Quota errors shrink the API's concurrency limit and are retried with exponential backoff
+    and full jitter, up to MAX_RETRIES times. Any other error, or a throttle on the last
+    attempt, is raised to the caller after being reported to the API's circuit breakers and,
+    if transient, to the current project's deferred retry tracking. While a breaker for the
+    API is open, CircuitOpenError is raised without calling func.
+
+    Paged results should be materialized inside func with list_pages (e.g.
+    lambda: list_pages(client.list(...))) so that the whole listing runs, and is retried, under
+    the limiter: every page after the first takes a token of its own, so the API's QPS limits
+    requests rather than calls. The pages are also counted in the run metrics.
+    """
+    check_circuit(api)
+    limiter = get_limiter(api)
+    with track_api_call(api) as call:
+        for attempt in range(MAX_RETRIES + 1):
+            limiter.acquire()
+            call["rpcs"] += 1
+            token = _current_limiter.set(limiter)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                _current_limiter.reset(token)
+                retryable = is_retryable(e)
+                limiter.release(throttled=retryable)
+                if not retryable or attempt == MAX_RETRIES:
+                    limiter.record("failures")
+                    record_failure(api, e)
+                    if is_transient(e):
+                        note_transient_failure(api, e)
+                    raise
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+                logging.warning(f"[{api}] Throttled ({type(e).__name__}); retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s.")
+                limiter.record("retries")
+                time.sleep(delay)
+            except BaseException:
+                # Cancelled (e.g. by a project timeout) or interrupted: give the slot back.
+                _current_limiter.reset(token)
+                limiter.release()
+                raise
+            else:
+                _current_limiter.reset(token)
+                limiter.release()
+                record_success(api)
+                call["result"] = result
+                return result
+
+
+async def call_api_async(api: str, func, *args, **kwargs):
+    """
+    The async counterpart of call_api: awaits func(*args, **kwargs) through the API's limiter,
+    with the same retries, circuit breakers and transient failure tracking.
+
+    Paged results should be materialized inside func with collect_pages.
+    """
+    check_circuit(api)
+    limiter = get_limiter(api)
+    with track_api_call(api) as call:
+        for attempt in range(MAX_RETRIES + 1):
+            await limiter.acquire_async()
+            call["rpcs"] += 1
+            token = _current_limiter.set(limiter)
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                _current_limiter.reset(token)
+                retryable = is_retryable(e)
+                limiter.release(throttled=retryable)
+                if not retryable or attempt == MAX_RETRIES:
+                    limiter.record("failures")
+                    record_failure(api, e)
+                    if is_transient(e):
+                        note_transient_failure(api, e)
+                    raise
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+                logging.warning(f"[{api}] Throttled ({type(e).__name__}); retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s.")
+                limiter.record("retries")
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled (e.g. by a project timeout) or interrupted: give the slot back.
+                _current_limiter.reset(token)
+                limiter.release()
+                raise
+            else:
+                _current_limiter.reset(token)
+                limiter.release()
+                record_success(api)
+                call["result"] = result
+                return result
+
+
+def list_pages(pager):
+    """
+    Returns every item of a pager across all of its pages, counting the pages fetched. Inside
+    call_api, a page with a next_page_token takes a token from the API's limiter before its
+    items are consumed, i.e. before the pager requests the next page.
+    """
+    limiter = _current_limiter.get()
+    items = []
+    response = None
+    for item in pager:
+        if getattr(pager, "_response", None) is not response:
+            response = pager._response
+            note_page()
+            if limiter is not None and getattr(response, "next_page_token", None):
+                limiter.take_token()
+        items.append(item)
+    if response is None:
+        note_page()
+    return items
+
+
+async def collect_pages(pager_call):
+    """
+    Awaits an async list call and returns every item across all of its pages, counting the
+    pages fetched and taking a token for each page after the first, like list_pages.
+    """
+    limiter = _current_limiter.get()
+    pager = await pager_call
+    items = []
+    response = None
+    async for item in pager:
+        if getattr(pager, "_response", None) is not response:
+            response = pager._response
+            note_page()
+            if limiter is not None and getattr(response, "next_page_token", None):
+                await limiter.take_token_async()
+        items.append(item)
+    if response is None:
+        note_page()
+    return items
+
+
+def get_rate_limiter_stats():
+    """Returns per-API counters for calls, further pages, throttles, retries and failures."""
+    with _lock:
+        limiters = list(_limiters.values())
+    return {limiter.api: limiter.snapshot() for limiter in limiters}
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from .datastore_client import DATASTORE_KIND, get_datastore_client, load_chunked_blob, save_chunked_blob
+
+load_dotenv()
+
+# --- Configuration ---
+# At the end of every run the sync job counts, for every control, the projects in each status,
+# across the org, per folder (every project below it) and per environment label. The counts are
+# stored as one compressed, chunked blob per org (kind ComplianceRollup) that the backend serves
+# as is, so an org-level view never reads the projects' dashboard entities.
+COMPLIANCE_ROLLUPS = os.getenv("COMPLIANCE_ROLLUPS", "true").lower() == "true"
+ROLLUP_KIND = "ComplianceRollup"
+# Every shard keeps its projects' control statuses (kind ComplianceRollupState), so projects a run
+# does not collect (current in incremental mode, failed, or done before a resume) still count.
+ROLLUP_STATE_KIND = "ComplianceRollupState"
+# Projects without a stored state are read from their dashboard entities this many at a time.
+ROLLUP_BOOTSTRAP_LOOKUP_SIZE = int(os.getenv("ROLLUP_BOOTSTRAP_LOOKUP_SIZE", 100))
+
+# Firewall rules are named by each project, so they are counted as one control per project.
+FIREWALL_CONTROL = "firewall_rules/Deny all internet ingress"
+
+
+def control_statuses(security_data: dict) -> dict:
+    """Returns {control: status} for a project's dashboard data, a control being "<section>/<entry name>"."""
+    statuses = {}
+    for section in ("org_policies", "sha_modules", "security_services"):
+        for entry in security_data.get(section) or []:
+            if isinstance(entry, dict) and entry.get("name"):
+                statuses[f"{section}/{entry['name']}"] = entry.get("status") or "Unknown"
+    vpc_sc = security_data.get("vpc_sc_status")
+    if isinstance(vpc_sc, dict) and vpc_sc.get("name"):
+        statuses[f"vpc_sc_status/{vpc_sc['name']}"] = vpc_sc.get("status") or "Unknown"
+    firewall_rules = security_data.get("firewall_rules")
+    if firewall_rules is not None:
+        rule_statuses = {rule.get("status") for rule in firewall_rules if isinstance(rule, dict)}
+        if "Skipped" in rule_statuses:
+            statuses[FIREWALL_CONTROL] = "Skipped"
+        else:
+            statuses[FIREWALL_CONTROL] = "Enabled" if "Enabled" in rule_statuses else "Disabled"
+    return statuses
+
+
+def _state_name(org_id: str, index: int, count: int) -> str:
+    return f"{org_id}:{index}-of-{count}"
+
+
+def _load_json_blob(kind: str, name: str, client=None):
+    payload = load_chunked_blob(kind, name, client)
+    return json.loads(zlib.decompress(payload).decode("utf-8")) if payload else None
+
+
+def _save_json_blob(kind: str, name: str, value, client=None):
+    save_chunked_blob(kind, name, zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8")), client)
+
+
+def _read_statuses(client, project_ids: list) -> dict:
+    """Returns {project id: {control: status}} computed from the stored dashboard entities of project_ids."""
+    statuses = {}
+    for start in range(0, len(project_ids), ROLLUP_BOOTSTRAP_LOOKUP_SIZE):
+        keys = [client.key(DATASTORE_KIND, project_id) for project_id in project_ids[start:start + ROLLUP_BOOTSTRAP_LOOKUP_SIZE]]
+        for entity in client.get_multi(keys):
+            statuses[entity.key.name] = control_statuses(entity)
+    return statuses
+
+
+def build_rollup(org_id: str, projects: list, statuses: dict) -> dict:
+    """
+    Returns the compliance rollup of projects (dicts from get_projects_in_org), given the control
+    statuses of each project id. Counts are flat lists indexed by
+    control index * len(statuses) + status index:
+
+        {"org_id", "generated_at", "projects", "projects_without_data", "controls": [...],
+         "statuses": [...], "totals": {"projects", "counts"}, "folders": {folder name:
+         {"display_name", "projects", "counts"}}, "environments": {environment: {"projects", "counts"}}}
+    """
+    counted = [(project, statuses[project["project_id"]]) for project in projects if statuses.get(project["project_id"])]
+    controls = sorted({control for _, project_statuses in counted for control in project_statuses})
+    status_names = sorted({status for _, project_statuses in counted for status in project_statuses.values()})
+    control_index = {control: i for i, control in enumerate(controls)}
+    status_index = {status: i for i, status in enumerate(status_names)}
+
+    def new_group(**fields):
+        return dict(fields, projects=0, counts=[0] * (len(controls) * len(status_names)))
+
+    totals = new_group()
+    folders = {}
+    environments = {}
+    for project, project_statuses in counted:
+        cells = [control_index[control] * len(status_names) + status_index[status] for control, status in project_statuses.items()]
+        groups = [totals, environments.setdefault(project.get("environment") or "N/A", new_group())]
+        # The folders in the ancestry follow the organization, ordered from the top.
+        folder_ids = [node for node in project.get("ancestry") or [] if node.startswith("folders/")]
+        folder_path = project.get("folder_path") or []
+        for depth, folder_id in enumerate(folder_ids):
+            display_name = folder_path[depth] if depth < len(folder_path) else folder_id
+            groups.append(folders.setdefault(folder_id, new_group(display_name=display_name)))
+        for group in groups:
+            group["projects"] += 1
+            for cell in cells:
+                group["counts"][cell] += 1
+
+    return {
+        "org_id": org_id,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "projects": len(counted),
+        "projects_without_data": len(projects) - len(counted),
+        "controls": controls,
+        "statuses": status_names,
+        "totals": totals,
+        "folders": folders,
+        "environments": environments,
+    }
+
+
+def update_compliance_rollups(org_id: str, all_projects: list, shard_projects: list, collected: dict,
+                              index: int = 0, count: int = 1):
+    """
+    Updates this shard's control statuses and recomputes the org's compliance rollup.
+
+    The statuses of shard_projects are taken from collected ({project id: {control: status}} of
+    the projects collected in this run), else from the shard's stored state, else from their
+    dashboard entities. The rollup then counts every project of all_projects with the states of
+    all count shards; shards still running contribute their previous run's state, and the last
+    shard to finish writes the complete rollup.
+    """
+    client = get_datastore_client()
+    try:
+        previous = _load_json_blob(ROLLUP_STATE_KIND, _state_name(org_id, index, count), client) or {}
+    except Exception as e:
+        logging.warning(f"Could not load the stored control statuses, reading them from the dashboard data: {e}")
+        previous = {}
+    state = {}
+    for project in shard_projects:
+        project_id = project["project_id"]
+        if collected.get(project_id) or previous.get(project_id):
+            state[project_id] = collected.get(project_id) or previous[project_id]
+    missing = [project["project_id"] for project in shard_projects if project["project_id"] not in state]
+    if missing:
+        logging.info(f"Reading the control statuses of {len(missing)} projects from their dashboard data.")
+        state.update(_read_statuses(client, missing))
+    _save_json_blob(ROLLUP_STATE_KIND, _state_name(org_id, index, count), state, client)
+
+    statuses = dict(state)
+    for other in range(count):
+        if other != index:
+            statuses.update(_load_json_blob(ROLLUP_STATE_KIND, _state_name(org_id, other, count), client) or {})
+    rollup = build_rollup(org_id, all_projects, statuses)
+    _save_json_blob(ROLLUP_KIND, org_id, rollup, client)
+    logging.info(
+        f"Compliance rollup: {rollup['projects']} projects, {len(rollup['controls'])} controls, "
+        f"{len(rollup['folders'])} folders, {len(rollup['environments'])} environments."
+    )
+    return rollup
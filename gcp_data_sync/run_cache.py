@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from .circuit_breaker import is_transient, note_transient_failure
+
+# Per-run memoization of GCP API reads, keyed by (API method, parent).
+# Collectors that need the same listing for the same parent share a single RPC. Concurrent
+# callers for a key that is still being fetched wait for that fetch instead of issuing their
+# own. Failures are memoized too, so every caller sees the same error without a second call.
+# A fetch that is cancelled or interrupted instead is forgotten, and its waiters fetch again.
+
+_lock = threading.Lock()
+_entries = {}
+
+
+class _Entry:
+    def __init__(self):
+        self.ready = threading.Event()
+        self.value = None
+        self.error = None
+        # Set when the entry is fetched on an event loop, so async callers can await it.
+        self.loop_ready = None
+        # Set when the owner's fetch was cancelled or interrupted without a result.
+        self.abandoned = False
+
+
+def _abandon(key, entry):
+    """Forgets an entry whose fetch was cancelled, so the next caller for its key fetches again."""
+    with _lock:
+        if _entries.get(key) is entry:
+            del _entries[key]
+        entry.abandoned = True
+
+
+def memoize_call(method: str, parent: str, fetch):
+    """
+    Returns fetch() for (method, parent), calling it at most once per run.
+
+    Args:
+        method: The API method name, e.g. "securitycentermanagement.list_security_center_services".
+        parent: The resource the call is made for, e.g. "projects/my-project/locations/global".
+        fetch: A zero-argument callable that performs the call and returns a fully materialized
+            result (e.g. a list rather than a pager).
+    """
+    key = (method, parent)
+    with _lock:
+        entry = _entries.get(key)
+        owner = entry is None
+        if owner:
+            entry = _entries[key] = _Entry()
+
+    if owner:
+        try:
+            entry.value = fetch()
+        except Exception as e:
+            entry.error = e
+        except BaseException:
+            _abandon(key, entry)
+            raise
+        finally:
+            entry.ready.set()
+    else:
+        entry.ready.wait()
+        if entry.abandoned:
+            return memoize_call(method, parent, fetch)
+
+    if entry.error is not None:
+        if not owner and is_transient(entry.error):
+            # The owner's call already noted it; callers sharing the failure need a retry too.
+            note_transient_failure(method, entry.error)
+        raise entry.error
+    return entry.value
+
+
+async def memoize_call_async(method: str, parent: str, fetch):
+    """
+    The async counterpart of memoize_call, sharing its entries: fetch is a zero-argument
+    coroutine function. Concurrent callers await the owner's fetch without blocking the loop.
+    """
+    key = (method, parent)
+    with _lock:
+        entry = _entries.get(key)
+        owner = entry is None
+        if owner:
+            entry = _entries[key] = _Entry()
+            entry.loop_ready = asyncio.Event()
+
+    if owner:
+        try:
+            entry.value = await fetch()
+        except Exception as e:
+            entry.error = e
+        except BaseException:
+            # E.g. the owning project timed out: the waiters must not take its missing result.
+            _abandon(key, entry)
+            raise
+        finally:
+            entry.ready.set()
+            entry.loop_ready.set()
+    else:
+        if not entry.ready.is_set():
+            if entry.loop_ready is not None:
+                await entry.loop_ready.wait()
+            else:
+                # Being fetched by a thread.
+                await asyncio.to_thread(entry.ready.wait)
+        if entry.abandoned:
+            return await memoize_call_async(method, parent, fetch)
+
+    if entry.error is not None:
+        if not owner and is_transient(entry.error):
+            note_transient_failure(method, entry.error)
+        raise entry.error
+    return entry.value
+
+
+def seed(method: str, parent: str, value):
+    """Stores an already known result for (method, parent), e.g. one shared by another shard."""
+    entry = _Entry()
+    entry.value = value
+    entry.ready.set()
+    with _lock:
+        _entries[(method, parent)] = entry
+
+
+def evict(resource: str):
+    """Drops every memoized result for resource and for any parent nested under it."""
+    with _lock:
+        for key in [k for k in _entries if k[1] == resource or k[1].startswith(f"{resource}/")]:
+            del _entries[key]
+
+
+def drop_failures(predicate):
+    """Drops memoized failures for which predicate(error) is true, so they are fetched again."""
+    with _lock:
+        for key in [k for k, e in _entries.items() if e.ready.is_set() and e.error is not None and predicate(e.error)]:
+            del _entries[key]
+
+
+def clear_run_cache():
+    """Drops all memoized results. Called at the start of every sync run."""
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from .datastore_client import delete_chunked_blob, load_chunked_blob, save_chunked_blob
+
+load_dotenv()
+
+# --- Configuration ---
+# The journal lives in Datastore unless SYNC_JOURNAL_PATH points at a local JSON file.
+SYNC_JOURNAL_ENABLED = os.getenv("SYNC_JOURNAL_ENABLED", "true").lower() == "true"
+SYNC_JOURNAL_PATH = os.getenv("SYNC_JOURNAL_PATH")
+JOURNAL_KIND = "GcpSyncRunJournal"
+JOURNAL_CHECKPOINT_SECONDS = float(os.getenv("JOURNAL_CHECKPOINT_SECONDS", 30))
+PROGRESS_LOG_SECONDS = float(os.getenv("PROGRESS_LOG_SECONDS", 60))
+
+
+class FileJournalStore:
+    """Keeps journals in a local JSON file, for tests and local runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except ValueError as e:
+            logging.warning(f"Journal file {self.path} is unreadable, deleting it: {e}")
+            os.remove(self.path)
+            return {}
+
+    def load(self, name: str):
+        return self._read().get(name)
+
+    def save(self, name: str, journal: dict):
+        journals = self._read()
+        journals[name] = journal
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(journals, f)
+        os.replace(tmp_path, self.path)
+
+
+class DatastoreJournalStore:
+    """
+    Keeps journals in Datastore as compressed, chunked blobs. Each save writes a new
+    generation of chunks and switches the manifest last, so an interrupted save leaves the
+    previous checkpoint readable.
+    """
+
+    def load(self, name: str):
+        try:
+            payload = load_chunked_blob(JOURNAL_KIND, name)
+            return json.loads(zlib.decompress(payload).decode("utf-8")) if payload else None
+        except (RuntimeError, zlib.error, ValueError) as e:
+            # Missing chunks or a corrupt payload: start afresh rather than failing every run.
+            logging.warning(f"Run journal {name} is unreadable, deleting it: {e}")
+            delete_chunked_blob(JOURNAL_KIND, name)
+            return None
+
+    def save(self, name: str, journal: dict):
+        save_chunked_blob(JOURNAL_KIND, name, zlib.compress(json.dumps(journal).encode("utf-8")))
+
+
+def get_journal_store():
+    return FileJournalStore(SYNC_JOURNAL_PATH) if SYNC_JOURNAL_PATH else DatastoreJournalStore()
+
+
+class RunJournal:
+    """
+    Persistent record of a sync run: its id, a snapshot of the projects it covers and each
+    project's done/failed state. A run that did not finish is resumed by the next one, which
+    only processes the projects that are not done yet (including the failed ones).
+
+    Progress is checkpointed every JOURNAL_CHECKPOINT_SECONDS rather than per project. Not
+    thread-safe; it is driven from run_ordered's on_result callback, which runs on one thread.
+    """
+
+    def __init__(self, name: str, store=None):
+        self.name = name
+        self.store = store or get_journal_store()
+        self.state = None
+        self._last_checkpoint = time.monotonic()
+
+    def resume_or_start(self, run_id: str, projects: list) -> list:
+        """
+        Returns the projects this run should process. If the previous run with this journal
+        name did not finish, those are its unfinished projects; otherwise a new run is started
+        for projects.
+        """
+        previous = self.store.load(self.name)
+        if previous and previous.get("status") == "running":
+            self.state = previous
+            results = previous["results"]
+            remaining = [p for p in previous["projects"] if results.get(p["project_id"], {}).get("status") != "done"]
+            failed = sum(1 for r in results.values() if r["status"] == "failed")
+            logging.info(
+                f"Resuming run {previous['run_id']}: {len(previous['projects']) - len(remaining)} projects done, "
+                f"{len(remaining)} remaining ({failed} of them previously failed)."
+            )
+            self.state["resumed_by"] = run_id
+            self.save()
+            return remaining
+
+        self.state = {
+            "run_id": run_id,
+            "status": "running",
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "projects": projects,
+            "results": {},
+        }
+        self.save()
+        return projects
+
+    def mark(self, project_id: str, error_msg: str = None):
+        """Records a project as done, or failed with error_msg."""
+        if error_msg:
+            self.state["results"][project_id] = {"status": "failed", "error": error_msg}
+        else:
+            self.state["results"][project_id] = {"status": "done"}
+
+    def checkpoint_due(self) -> bool:
+        return time.monotonic() - self._last_checkpoint >= JOURNAL_CHECKPOINT_SECONDS
+
+    def checkpoint(self, write_failures: dict = None):
+        """
+        Persists the journal. Call it only once the data of every project marked done has been
+        written, and pass the writer's failures so those projects are retried on resume.
+        """
+        for project_id, error in (write_failures or {}).items():
+            self.mark(project_id, f"Failed to save to Datastore: {error}")
+        self.save()
+
+    def finish(self, write_failures: dict = None):
+        """Marks the run as finished, so the next run starts from a fresh project list."""
+        self.state["status"] = "finished"
+        self.state["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self.checkpoint(write_failures)
+
+    def save(self):
+        self.store.save(self.name, self.state)
+        self._last_checkpoint = time.monotonic()
+
+
+class ProgressReporter:
+    """Logs completed/total, throughput in projects per minute and an ETA while a run progresses."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.completed = 0
+        self.started = time.monotonic()
+        self._last_log = self.started
+
+    def update(self, count: int = 1):
+        self.completed += count
+        now = time.monotonic()
+        if now - self._last_log >= PROGRESS_LOG_SECONDS or self.completed == self.total:
+            self._last_log = now
+            logging.info(self.summary())
+
+    def throughput(self) -> float:
+        """Completed projects per minute so far."""
+        elapsed_minutes = (time.monotonic() - self.started) / 60
+        return self.completed / elapsed_minutes if elapsed_minutes > 0 else 0.0
+
+    def summary(self) -> str:
+        rate = self.throughput()
+        remaining = self.total - self.completed
+        eta = timedelta(minutes=remaining / rate) if rate > 0 else None
+        percent = 100 * self.completed / self.total if self.total else 100
+        eta_text = str(eta).split('.')[0] if eta is not None else "unknown"
+        return f"Progress: {self.completed}/{self.total} projects ({percent:.1f}%), {rate:.1f} projects/min, ETA {eta_text}."
@@ -0,0 +1,208 @@
+import contextvars
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from .datastore_client import get_datastore_client
+
+load_dotenv()
+
+# --- Configuration ---
+RUN_REPORT_KIND = "GcpSyncRunReport"
+SLOWEST_PROJECTS_IN_REPORT = int(os.getenv("SLOWEST_PROJECTS_IN_REPORT", 20))
+# Keeps the report entity well under Datastore's 1 MiB limit; failed_count has the full count.
+FAILURES_IN_REPORT = int(os.getenv("FAILURES_IN_REPORT", 500))
+
+# Metrics are kept per process. In "process" executor mode the collectors run in worker
+# processes, so only the stage timings and project counts of the main process are reported.
+
+
+def percentiles(values) -> dict:
+    """Returns count, p50/p95/p99 (nearest rank), max and total of values, rounded to milliseconds."""
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+
+    def rank(p):
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        "count": len(ordered),
+        "p50": round(rank(50), 3),
+        "p95": round(rank(95), 3),
+        "p99": round(rank(99), 3),
+        "max": round(ordered[-1], 3),
+        "total": round(sum(ordered), 3),
+    }
+
+
+def payload_size(result) -> int:
+    """Approximate serialized size in bytes of an API result: proto messages, discovery dicts or lists of them."""
+    if isinstance(result, (list, tuple)):
+        return sum(payload_size(item) for item in result)
+    if isinstance(result, dict):
+        return len(json.dumps(result, default=str))
+    to_pb = getattr(type(result), "pb", None)
+    if to_pb is not None:
+        try:
+            return to_pb(result).ByteSize()
+        except Exception:
+            return 0
+    return 0
+
+
+class RunMetrics:
+    """Thread-safe accumulator for one sync run's timings and API call counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.collectors = {}  # collector name -> [seconds]
+        self.collector_errors = {}
+        self.project_seconds = {}  # project id -> seconds, summed across attempts
+        self.api_latencies = {}  # api -> [seconds per call, including retries]
+        self.api_counters = {}  # api -> {calls, rpcs, pages, retries, failures, payload_bytes}
+
+    def record_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def record_collector(self, name: str, seconds: float, failed: bool = False):
+        with self._lock:
+            self.collectors.setdefault(name, []).append(seconds)
+            if failed:
+                self.collector_errors[name] = self.collector_errors.get(name, 0) + 1
+
+    def record_project(self, project_id: str, seconds: float):
+        with self._lock:
+            self.project_seconds[project_id] = self.project_seconds.get(project_id, 0.0) + seconds
+
+    def record_api_call(self, api: str, seconds: float, rpcs: int, pages: int, payload_bytes: int, failed: bool):
+        with self._lock:
+            self.api_latencies.setdefault(api, []).append(seconds)
+            counters = self.api_counters.setdefault(
+                api, {"calls": 0, "rpcs": 0, "pages": 0, "retries": 0, "failures": 0, "payload_bytes": 0}
+            )
+            counters["calls"] += 1
+            counters["rpcs"] += rpcs
+            counters["retries"] += rpcs - 1
+            counters["pages"] += pages
+            counters["payload_bytes"] += payload_bytes
+            counters["failures"] += int(failed)
+
+    def snapshot(self) -> dict:
+        """Returns the per-stage, per-collector and per-API summaries and the slowest projects."""
+        with self._lock:
+            slowest = heapq.nlargest(SLOWEST_PROJECTS_IN_REPORT, self.project_seconds.items(), key=lambda item: item[1])
+            return {
+                "stages": {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+                "collectors": {
+                    name: dict(percentiles(seconds), errors=self.collector_errors.get(name, 0))
+                    for name, seconds in self.collectors.items()
+                },
+                "apis": {
+                    api: dict(self.api_counters[api], **percentiles(self.api_latencies[api]))
+                    for api in self.api_counters
+                },
+                "slowest_projects": [{"project_id": pid, "seconds": round(seconds, 3)} for pid, seconds in slowest],
+            }
+
+
+_metrics = RunMetrics()
+
+
+def get_run_metrics() -> RunMetrics:
+    return _metrics
+
+
+def reset_run_metrics():
+    """Starts a fresh set of metrics. Called at the start of every sync run."""
+    global _metrics
+    _metrics = RunMetrics()
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Adds the wall time of the block to the run's stage timings."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        _metrics.record_stage(stage, time.monotonic() - started)
+
+
+# Pages fetched by the API call currently running in this thread or task.
+_call_pages = contextvars.ContextVar("call_pages", default=None)
+
+
+@contextmanager
+def track_api_call(api: str):
+    """
+    Measures one call_api call. Yields a dict the caller fills in with "rpcs" (attempts made)
+    and "result"; pages are counted by list_pages/collect_pages while the block runs.
+    """
+    call = {"rpcs": 0, "pages": [0], "result": None}
+    token = _call_pages.set(call["pages"])
+    started = time.monotonic()
+    failed = True
+    try:
+        yield call
+        failed = False
+    finally:
+        _call_pages.reset(token)
+        pages = call["pages"][0] or (1 if call["rpcs"] else 0)
+        _metrics.record_api_call(
+            api, time.monotonic() - started, call["rpcs"], pages,
+            payload_size(call["result"]) if not failed else 0, failed,
+        )
+
+
+def note_page():
+    pages = _call_pages.get()
+    if pages is not None:
+        pages[0] += 1
+
+
+def build_run_report(run_id: str, started_at: datetime, finished_at: datetime, counts: dict, failed: list) -> dict:
+    """
+    Builds the JSON run report: the run's counts, throughput in projects per minute, the
+    stage timings, per-collector and per-API latency percentiles (in seconds) and call
+    counters, the slowest projects, and the failures.
+    """
+    duration = (finished_at - started_at).total_seconds()
+    report = {
+        "run_id": run_id,
+        "started_at": started_at.isoformat(),
+        "finished_at": finished_at.isoformat(),
+        "duration_seconds": round(duration, 3),
+    }
+    report.update(counts)
+    processed = counts.get("successful", 0) + len(failed)
+    report["throughput_per_minute"] = round(processed / (duration / 60), 2) if duration > 0 else 0.0
+    report.update(_metrics.snapshot())
+    report["failed_count"] = len(failed)
+    report["failed"] = failed[:FAILURES_IN_REPORT]
+    return report
+
+
+def save_run_report(name: str, report: dict, client=None):
+    """
+    Stores a run report under RUN_REPORT_KIND/name. run_id and started_at are indexed so runs
+    can be listed and compared over time; the report itself is stored as JSON.
+    """
+    client = client or get_datastore_client()
+    entity = client.entity(client.key(RUN_REPORT_KIND, name), exclude_from_indexes=("report",))
+    entity.update({
+        "run_id": report.get("run_id", name),
+        "started_at": report.get("started_at") or datetime.now(timezone.utc).isoformat(),
+        "duration_seconds": report.get("duration_seconds"),
+        "report": json.dumps(report),
+    })
+    client.put(entity)
+    logging.info(f"Saved run report {name} ({len(entity['report'])} bytes).")
@@ -2,7 +2,11 @@ from google.cloud import securitycentermanagement_v1
 from google.api_core import exceptions
 import os
 import logging
-from fastapi.responses import JSONResponse
+from .circuit_breaker import CallSkippedError
+from .clients import get_security_center_management_client
+from .negative_cache import call_project_api
+from .rate_limiter import collect_pages, list_pages
+from .run_cache import memoize_call, memoize_call_async
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,63 +15,114 @@ logging.basicConfig(level=logging.INFO)
 if os.environ.get("ENV") == "dev":
     os.environ["GOOGLE_API_USE_CLIENT_CERTIFICATE"] = "false"
 
-def get_security_center_services(project_id: str):
-    """Fetches all Security Center services for a project and their enablement state."""
-    logging.info(f"Attempting to fetch Security Center services for project: {project_id}")
-    services_list = []
-    try:
-        client = securitycentermanagement_v1.SecurityCenterManagementClient()
-        parent = f"projects/{project_id}/locations/global"
-        logging.info(f"Requesting Security Center services with parent: {parent}")
+def list_security_center_services(project_id: str):
+    """
+    Lists the Security Center services for a project, fetching them at most once per run.
+    The result is shared by get_security_center_services and sha_modules.get_sha_modules.
+    """
+    parent = f"projects/{project_id}/locations/global"
 
+    def fetch():
+        client = get_security_center_management_client()
+        logging.info(f"Requesting Security Center services with parent: {parent}")
         request = securitycentermanagement_v1.ListSecurityCenterServicesRequest(
             parent=parent,
         )
-        page_result = client.list_security_center_services(request=request)
-
-        responses = list(page_result)
-        if not responses:
-            logging.warning("API returned no Security Center services.")
-        else:
-            #logging.info(f"Found {len(responses)} Security Center service(s).")
-            for service in responses:
-                #logging.debug(f"Full service object: {service}")
-                # The service name is a long path, let's get the last part.
-                service_id = service.name.split('/')[-1]
-
-                # Exclude Security Health Analytics as it's handled separately
-                if service_id.lower() == 'security_health_analytics':
-                    continue
-
-                service_modules = []
-                if service.modules:
-                    for module_name, module_settings in service.modules.items():
-                        service_modules.append({
-                            "name": module_name.replace('_', ' ').title(),
-                            "status": module_settings.effective_enablement_state.name.capitalize()
-                        })
-
-                services_list.append({
-                    "name": service_id.replace('-', ' ').title(),
-                    "status": service.effective_enablement_state.name.capitalize(),
-                    "controlType": "Security Service",
-                    "details": f"Service ID: {service_id}",
-                    "modules": service_modules,
-                    "ControlObjective": "Detect Security Misconfigurations"
-                })
-
-    except exceptions.PermissionDenied as e:
-        logging.error(f"Permission denied for project {project_id}: {e}")
-        return JSONResponse(
-            status_code=403,
-            content={"error": "Permission Denied", "details": str(e)}
+        return call_project_api(project_id, "securitycentermanagement", lambda: list_pages(client.list_security_center_services(request=request)))
+
+    return memoize_call("securitycentermanagement.list_security_center_services", parent, fetch)
+
+async def list_security_center_services_async(ctx, project_id: str):
+    """The async counterpart of list_security_center_services, sharing its memoized results."""
+    parent = f"projects/{project_id}/locations/global"
+
+    async def fetch():
+        client = ctx.client("securitycentermanagement")
+        logging.info(f"Requesting Security Center services with parent: {parent}")
+        request = securitycentermanagement_v1.ListSecurityCenterServicesRequest(
+            parent=parent,
         )
-    except Exception as e:
-        logging.error(f"An unexpected error occurred for project {project_id}: {e}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": "An unexpected error occurred", "details": str(e)}
+        return await ctx.call_project(
+            project_id, "securitycentermanagement",
+            lambda: collect_pages(client.list_security_center_services(request=request)),
         )
 
+    return await memoize_call_async("securitycentermanagement.list_security_center_services", parent, fetch)
+
+def _service_entries(responses):
+    """Builds the dashboard entries for every Security Center service except SHA."""
+    services_list = []
+    if not responses:
+        logging.warning("API returned no Security Center services.")
+    else:
+        #logging.info(f"Found {len(responses)} Security Center service(s).")
+        for service in responses:
+            #logging.debug(f"Full service object: {service}")
+            # The service name is a long path, let's get the last part.
+            service_id = service.name.split('/')[-1]
+
+            # Exclude Security Health Analytics as it's handled separately
+            if service_id.lower() == 'security_health_analytics':
+                continue
+
+            service_modules = []
+            if service.modules:
+                for module_name, module_settings in service.modules.items():
+                    service_modules.append({
+                        "name": module_name.replace('_', ' ').title(),
+                        "status": module_settings.effective_enablement_state.name.capitalize()
+                    })
+
+            services_list.append({
+                "name": service_id.replace('-', ' ').title(),
+                "status": service.effective_enablement_state.name.capitalize(),
+                "controlType": "Security Service",
+                "details": f"Service ID: {service_id}",
+                "modules": service_modules,
+                "ControlObjective": "Detect Security Misconfigurations"
+            })
+
     logging.info(f"Finished fetching Security Center services. Returning {len(services_list)} service(s).")
-    return services_list
\ No newline at end of file
+    return services_list
+
+def failure_status(project_id: str, e: Exception, what: str):
+    """
+    Logs why a project's Security Center data could not be fetched and returns the status and
+    details of the entries standing in for it: Skipped for calls known to fail, else Error.
+    """
+    if isinstance(e, CallSkippedError):
+        logging.warning(f"Skipping {what} for project {project_id}: {e}")
+        return "Skipped", str(e)
+    if isinstance(e, exceptions.PermissionDenied):
+        logging.error(f"Permission denied for project {project_id}: {e}")
+        return "Error", f"Permission Denied: {e}"
+    logging.error(f"An unexpected error occurred for project {project_id}: {e}")
+    return "Error", f"An unexpected error occurred: {e}"
+
+def _services_error(project_id: str, e: Exception):
+    """Builds what get_security_center_services returns when the services cannot be listed."""
+    status, details = failure_status(project_id, e, "Security Center services")
+    return [{
+        "name": "Security Center Services",
+        "status": status,
+        "controlType": "Security Service",
+        "details": details,
+        "modules": [],
+        "ControlObjective": "Detect Security Misconfigurations"
+    }]
+
+def get_security_center_services(project_id: str):
+    """Fetches all Security Center services for a project and their enablement state."""
+    logging.info(f"Attempting to fetch Security Center services for project: {project_id}")
+    try:
+        return _service_entries(list_security_center_services(project_id))
+    except Exception as e:
+        return _services_error(project_id, e)
+
+async def get_security_center_services_async(ctx, project_id: str):
+    """The async counterpart of get_security_center_services."""
+    logging.info(f"Attempting to fetch Security Center services for project: {project_id}")
+    try:
+        return _service_entries(await list_security_center_services_async(ctx, project_id))
+    except Exception as e:
+        return _services_error(project_id, e)
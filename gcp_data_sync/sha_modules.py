@@ -1,8 +1,10 @@
 from google.cloud import securitycentermanagement_v1
-from google.api_core import exceptions
 import os
 import logging
-from fastapi.responses import JSONResponse
+from .clients import get_security_center_management_client
+from .negative_cache import call_project_api
+from .rate_limiter import collect_pages, list_pages
+from .scc_services import failure_status, list_security_center_services, list_security_center_services_async
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,6 +13,96 @@ logging.basicConfig(level=logging.INFO)
 if os.environ.get("ENV") == "dev":
     os.environ["GOOGLE_API_USE_CLIENT_CERTIFICATE"] = "false"
 
+def _custom_module_entries(responses):
+    """Builds the dashboard entries for a project's effective SHA custom modules."""
+    modules_list = []
+    if not responses:
+        logging.warning("API returned no effective SHA custom modules. This is expected if none are configured.")
+    else:
+        logging.info(f"Found {len(responses)} effective SHA module(s).")
+        for response in responses:
+            logging.info(f"Processing module: {response.display_name}")
+            modules_list.append({
+                "name": response.display_name,
+                "status": response.enablement_state.name.capitalize(),
+                "controlType": "SHA Custom Module",
+                "details": f"Module ID: {response.name.split('/')[-1]}",
+                "ControlObjective": "Detect Security Misconfigurations"
+            })
+
+    logging.info(f"Finished fetching SHA custom modules. Returning {len(modules_list)} module(s).")
+    return modules_list
+
+def _custom_modules_error(project_id: str, e: Exception):
+    """Builds what get_sha_custom_modules returns when the modules cannot be listed."""
+    status, details = failure_status(project_id, e, "SHA custom modules")
+    return [{
+        "name": "SHA Custom Modules",
+        "status": status,
+        "controlType": "SHA Custom Module",
+        "details": details,
+        "ControlObjective": "Detect Security Misconfigurations"
+    }]
+
+def _sha_service_details(responses):
+    """Builds the Security Health Analytics entry, with its modules, from the Security Center services."""
+    if not responses:
+        logging.warning("API returned no Security Center services.")
+        return None
+    #logging.info(f"Found {responses} Security Center service(s). Filtering for SECURITY_HEALTH_ANALYTICS.")
+    for service in responses:
+        service_id = service.name.split('/')[-1]
+        if service_id == 'SECURITY_HEALTH_ANALYTICS':
+            #logging.info(f"Found Security Health Analytics service: {service.display_name}")
+            service_modules = []
+            if service.modules:
+                for module_name, module_settings in service.modules.items():
+                    service_modules.append({
+                        "name": module_name.replace('_', ' ').title(),
+                        "status": module_settings.effective_enablement_state.name.capitalize(),
+                        "controlType": "SHA Module",
+                        "details": f"Service ID: {service_id}",
+                        "ControlObjective": "Detect Security Misconfigurations"
+                    })
+
+            sha_service_details = {
+                "name": service_id.replace('-', ' ').title(),
+                "status": service.effective_enablement_state.name.capitalize(),
+                "controlType": "SHA Module",
+                "details": f"Service ID: {service_id}",
+                "modules": service_modules,
+                "ControlObjective": "Detect Security Misconfigurations"
+            }
+            return sha_service_details
+
+    logging.warning("Security Health Analytics service not found.")
+    return None
+
+def _sha_modules_error(project_id: str, e: Exception):
+    """Builds what get_sha_modules returns when the Security Center services cannot be listed."""
+    status, details = failure_status(project_id, e, "Security Health Analytics service details")
+    return {
+        "name": "Security Health Analytics",
+        "status": status,
+        "controlType": "SHA Module",
+        "details": details,
+        "modules": [{
+            "name": "Security Health Analytics",
+            "status": status,
+            "controlType": "SHA Module",
+            "details": details,
+            "ControlObjective": "Detect Security Misconfigurations"
+        }],
+        "ControlObjective": "Detect Security Misconfigurations"
+    }
+
+def _custom_modules_request(project_id: str):
+    parent = f"projects/{project_id}/locations/global"
+    logging.info(f"Requesting SHA modules with parent: {parent}")
+    return securitycentermanagement_v1.ListEffectiveSecurityHealthAnalyticsCustomModulesRequest(
+        parent=parent,
+    )
+
 def get_sha_custom_modules(project_id: str):
     """Fetches effective Security Health Analytics **custom** modules for a project.
     
@@ -18,105 +110,44 @@ def get_sha_custom_modules(project_id: str):
     This function only covers custom modules created by the user.
     """
     logging.info(f"Attempting to fetch SHA custom modules for project: {project_id}")
-    modules_list = []
     try:
-        client = securitycentermanagement_v1.SecurityCenterManagementClient()
-        parent = f"projects/{project_id}/locations/global"
-        logging.info(f"Requesting SHA modules with parent: {parent}")
-
-        request = securitycentermanagement_v1.ListEffectiveSecurityHealthAnalyticsCustomModulesRequest(
-            parent=parent,
-        )
-        page_result = client.list_effective_security_health_analytics_custom_modules(request=request)
-
+        client = get_security_center_management_client()
+        request = _custom_modules_request(project_id)
         # Convert iterator to a list to check if it's empty
-        responses = list(page_result)
-        if not responses:
-            logging.warning("API returned no effective SHA custom modules. This is expected if none are configured.")
-        else:
-            logging.info(f"Found {len(responses)} effective SHA module(s).")
-            for response in responses:
-                logging.info(f"Processing module: {response.display_name}")
-                modules_list.append({
-                    "name": response.display_name,
-                    "status": response.enablement_state.name.capitalize(),
-                    "controlType": "SHA Custom Module",
-                    "details": f"Module ID: {response.name.split('/')[-1]}",
-                    "ControlObjective": "Detect Security Misconfigurations"
-                })
-
-    except exceptions.PermissionDenied as e:
-        logging.error(f"Permission denied for project {project_id}: {e}")
-        return JSONResponse(
-            status_code=403,
-            content={"error": "Permission Denied", "details": str(e)}
+        responses = call_project_api(
+            project_id, "securitycentermanagement",
+            lambda: list_pages(client.list_effective_security_health_analytics_custom_modules(request=request)),
         )
+        return _custom_module_entries(responses)
     except Exception as e:
-        logging.error(f"An unexpected error occurred for project {project_id}: {e}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": "An unexpected error occurred", "details": str(e)}
-        )
+        return _custom_modules_error(project_id, e)
 
-    logging.info(f"Finished fetching SHA custom modules. Returning {len(modules_list)} module(s).")
-    return modules_list
+async def get_sha_custom_modules_async(ctx, project_id: str):
+    """The async counterpart of get_sha_custom_modules."""
+    logging.info(f"Attempting to fetch SHA custom modules for project: {project_id}")
+    try:
+        client = ctx.client("securitycentermanagement")
+        request = _custom_modules_request(project_id)
+        responses = await ctx.call_project(
+            project_id, "securitycentermanagement",
+            lambda: collect_pages(client.list_effective_security_health_analytics_custom_modules(request=request)),
+        )
+        return _custom_module_entries(responses)
+    except Exception as e:
+        return _custom_modules_error(project_id, e)
 
 def get_sha_modules(project_id: str):
     """Fetches details for the Security Health Analytics service."""
     logging.info(f"Attempting to fetch Security Health Analytics service details for project: {project_id}")
     try:
-        client = securitycentermanagement_v1.SecurityCenterManagementClient()
-        parent = f"projects/{project_id}/locations/global"
-        logging.info(f"Requesting Security Center services with parent: {parent}")
-
-        request = securitycentermanagement_v1.ListSecurityCenterServicesRequest(
-            parent=parent,
-        )
-        page_result = client.list_security_center_services(request=request)
-
-        responses = list(page_result)
-        if not responses:
-            logging.warning("API returned no Security Center services.")
-            return None
-        else:
-            #logging.info(f"Found {responses} Security Center service(s). Filtering for SECURITY_HEALTH_ANALYTICS.")
-            for service in responses:
-                service_id = service.name.split('/')[-1]
-                if service_id == 'SECURITY_HEALTH_ANALYTICS':
-                    #logging.info(f"Found Security Health Analytics service: {service.display_name}")
-                    service_modules = []
-                    if service.modules:
-                        for module_name, module_settings in service.modules.items():
-                            service_modules.append({
-                                "name": module_name.replace('_', ' ').title(),
-                                "status": module_settings.effective_enablement_state.name.capitalize(),
-                                "controlType": "SHA Module",
-                                "details": f"Service ID: {service_id}",
-                                "ControlObjective": "Detect Security Misconfigurations"
-                            })
-
-                    sha_service_details = {
-                        "name": service_id.replace('-', ' ').title(),
-                        "status": service.effective_enablement_state.name.capitalize(),
-                        "controlType": "SHA Module",
-                        "details": f"Service ID: {service_id}",
-                        "modules": service_modules,
-                        "ControlObjective": "Detect Security Misconfigurations"
-                    }
-                    return sha_service_details
-
-    except exceptions.PermissionDenied as e:
-        logging.error(f"Permission denied for project {project_id}: {e}")
-        return JSONResponse(
-            status_code=403,
-            content={"error": "Permission Denied", "details": str(e)}
-        )
+        return _sha_service_details(list_security_center_services(project_id))
     except Exception as e:
-        logging.error(f"An unexpected error occurred for project {project_id}: {e}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": "An unexpected error occurred", "details": str(e)}
-        )
+        return _sha_modules_error(project_id, e)
 
-    logging.warning("Security Health Analytics service not found.")
-    return None
+async def get_sha_modules_async(ctx, project_id: str):
+    """The async counterpart of get_sha_modules."""
+    logging.info(f"Attempting to fetch Security Health Analytics service details for project: {project_id}")
+    try:
+        return _sha_service_details(await list_security_center_services_async(ctx, project_id))
+    except Exception as e:
+        return _sha_modules_error(project_id, e)
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from google.cloud import orgpolicy_v2
+from .clients import get_org_policy_client
+from .datastore_client import WRITE_BATCH_MAX_ENTITIES, get_datastore_client, load_chunked_blob, save_chunked_blob
+from .executor import MAX_WORKERS, run_ordered
+from .org_policies import list_policies_at
+from .run_cache import seed
+from .run_metrics import SLOWEST_PROJECTS_IN_REPORT, save_run_report
+from .vpc_sc import build_perimeter_index, reset_perimeter_index
+
+load_dotenv()
+
+# --- Configuration ---
+# Cloud Run jobs set these for every task of an execution. Locally they default to a single shard.
+TASK_INDEX = int(os.getenv("CLOUD_RUN_TASK_INDEX", 0))
+TASK_COUNT = int(os.getenv("CLOUD_RUN_TASK_COUNT", 1))
+RUN_ID = os.getenv("CLOUD_RUN_EXECUTION", "local")
+SHARED_STATE_WAIT_SECONDS = float(os.getenv("SHARED_STATE_WAIT_SECONDS", 900))
+SHARED_STATE_POLL_SECONDS = float(os.getenv("SHARED_STATE_POLL_SECONDS", 5))
+# A run's shared state and shard reports are deleted once its reports are merged. Those left by
+# other executions (e.g. runs that crashed) are deleted once they are this old, so runs that are
+# still going keep theirs.
+STALE_RUN_STATE_HOURS = float(os.getenv("STALE_RUN_STATE_HOURS", 24))
+
+SHARED_STATE_KIND = "GcpSyncSharedState"
+SHARD_REPORT_KIND = "GcpSyncShardReport"
+
+def shard_for(project_id: str, count: int) -> int:
+    """Returns the shard a project belongs to. Stable across runs, processes and hosts."""
+    digest = hashlib.sha256(project_id.encode("utf-8")).hexdigest()
+    return int(digest[:16], 16) % count
+
+def select_shard(projects: list, index: int = TASK_INDEX, count: int = TASK_COUNT) -> list:
+    """Returns the projects assigned to shard index out of count."""
+    return [p for p in projects if shard_for(p["project_id"], count) == index]
+
+def _encode(obj) -> bytes:
+    return zlib.compress(json.dumps(obj).encode("utf-8"))
+
+def _decode(payload: bytes):
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+def build_org_state(projects: list) -> dict:
+    """
+    Computes the org-level data every shard needs: the project listing, the VPC-SC perimeter
+    index and the checked policies set on every org and folder in the projects' ancestry. The
+    nodes' policies are listed in parallel, bounded by MAX_WORKERS.
+    """
+    org_policy_client = get_org_policy_client()
+    nodes = sorted({node for project in projects for node in project.get("ancestry") or []})
+    results = run_ordered(lambda node: list_policies_at(org_policy_client, node), nodes, max_workers=MAX_WORKERS, mode="thread")
+    ancestor_policies = {
+        node: {constraint: orgpolicy_v2.Policy.to_json(policy) for constraint, policy in policies.items()}
+        for node, policies in zip(nodes, results)
+    }
+    return {
+        "projects": projects,
+        "perimeter_index": build_perimeter_index(),
+        "ancestor_policies": ancestor_policies,
+    }
+
+def apply_org_state(state: dict):
+    """Installs shared org-level data so this process does not recompute it."""
+    reset_perimeter_index(state["perimeter_index"])
+    for node, policies in state["ancestor_policies"].items():
+        seed("orgpolicy.list_policies", node, {
+            constraint: orgpolicy_v2.Policy.from_json(policy) for constraint, policy in policies.items()
+        })
+
+def get_shared_org_state(list_projects, run_id: str = RUN_ID, index: int = TASK_INDEX):
+    """
+    Returns the org-level state for this run. Task 0 builds it (listing projects with
+    list_projects()) and publishes it to Datastore; every other task waits for it to appear.
+    A task that waits longer than SHARED_STATE_WAIT_SECONDS builds it itself.
+    """
+    if index != 0:
+        deadline = time.monotonic() + SHARED_STATE_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            payload = load_chunked_blob(SHARED_STATE_KIND, run_id)
+            if payload is not None:
+                logging.info(f"Loaded shared org state for run {run_id} ({len(payload)} bytes).")
+                return _decode(payload)
+            time.sleep(SHARED_STATE_POLL_SECONDS)
+        logging.warning(f"Shared org state for run {run_id} did not appear within {SHARED_STATE_WAIT_SECONDS}s. Building it locally.")
+        return build_org_state(list_projects())
+
+    state = build_org_state(list_projects())
+    payload = _encode(state)
+    save_chunked_blob(SHARED_STATE_KIND, run_id, payload)
+    logging.info(f"Published shared org state for run {run_id} ({len(payload)} bytes).")
+    return state
+
+def save_shard_report(report: dict, run_id: str = RUN_ID, index: int = TASK_INDEX, count: int = TASK_COUNT):
+    """
+    Stores this shard's run report and, once every shard has reported, the merged run report.
+    The shard that merges the reports then deletes the run's shared state and shard reports.
+    """
+    client = get_datastore_client()
+    entity = client.entity(client.key(SHARD_REPORT_KIND, f"{run_id}:{index}"), exclude_from_indexes=("report",))
+    entity.update({"run_id": run_id, "shard": index, "reported_at": datetime.now(timezone.utc), "report": json.dumps(report)})
+    client.put(entity)
+
+    keys = [client.key(SHARD_REPORT_KIND, f"{run_id}:{i}") for i in range(count)]
+    reports = [json.loads(e["report"]) for e in client.get_multi(keys)]
+    if len(reports) < count:
+        logging.info(f"Shard {index} reported; waiting on {count - len(reports)} more shards before aggregating.")
+        return None
+
+    # Every shard that sees all reports writes the same aggregate, so a race is harmless.
+    merged = aggregate_reports(reports)
+    merged["run_id"] = run_id
+    save_run_report(run_id, merged, client)
+    logging.info(f"All {count} shards reported. Run {run_id}: {merged.get('successful', 0)} succeeded, {merged.get('failed_count', len(merged['failed']))} failed.")
+    try:
+        delete_run_state(run_id, count, client)
+    except Exception as e:
+        logging.warning(f"Could not delete the shared state and shard reports of run {run_id}: {e}")
+    return merged
+
+def delete_run_state(run_id: str, count: int, client=None, now: datetime = None):
+    """
+    Deletes the run's shared org state and shard reports, and those of other executions that
+    are older than STALE_RUN_STATE_HOURS (by their report time and shared state save time).
+    """
+    client = client or get_datastore_client()
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(hours=STALE_RUN_STATE_HOURS)
+
+    keys = [client.key(SHARD_REPORT_KIND, f"{run_id}:{i}") for i in range(count)]
+    query = client.query(kind=SHARD_REPORT_KIND)
+    query.add_filter("reported_at", "<", cutoff)
+    query.keys_only()
+    keys.extend(entity.key for entity in query.fetch() if not entity.key.name.startswith(f"{run_id}:"))
+
+    # A shared state is a manifest named after its run plus chunks named "<run id>:<generation>:<i>".
+    query = client.query(kind=SHARED_STATE_KIND)
+    query.keys_only()
+    names_by_run = {}
+    for entity in query.fetch():
+        names_by_run.setdefault(entity.key.name.split(":", 1)[0], []).append(entity.key.name)
+    stale_runs = {run_id}
+    others = [client.key(SHARED_STATE_KIND, name) for name in names_by_run if name != run_id]
+    if others:
+        stale_runs.update(
+            manifest.key.name for manifest in client.get_multi(others)
+            if manifest.get("saved_at") and manifest["saved_at"] < cutoff
+        )
+    keys.extend(client.key(SHARED_STATE_KIND, name) for run in stale_runs for name in names_by_run.get(run, []))
+
+    for start in range(0, len(keys), WRITE_BATCH_MAX_ENTITIES):
+        client.delete_multi(keys[start:start + WRITE_BATCH_MAX_ENTITIES])
+    logging.info(f"Deleted {len(keys)} shared state and shard report entities of run {run_id} and stale runs.")
+
+# Latency statistics cannot be merged exactly without the raw samples, so the merged report
+# keeps the worst shard's value for these (an upper bound) and sums every other counter.
+_MAX_MERGED_STATS = ("p50", "p95", "p99", "max")
+
+def _merge_stats(merged: dict, stats: dict):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            _merge_stats(merged.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if key in _MAX_MERGED_STATS:
+                merged[key] = max(merged.get(key, 0), value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+def aggregate_reports(reports: list) -> dict:
+    """
+    Merges per-shard run reports: counts are summed, failure lists concatenated and the
+    slowest projects re-ranked. Stages ran in parallel on every shard, so each stage and the
+    run itself take as long as on the slowest shard.
+    """
+    merged = {"shards": len(reports), "failed": [], "slowest_projects": []}
+    for report in reports:
+        for key, value in report.items():
+            if key == "failed":
+                merged["failed"].extend(value)
+            elif key == "slowest_projects":
+                merged["slowest_projects"].extend(value)
+            elif key == "stages":
+                stages = merged.setdefault("stages", {})
+                for stage, seconds in value.items():
+                    stages[stage] = max(stages.get(stage, 0), seconds)
+            elif isinstance(value, dict):
+                _merge_stats(merged.setdefault(key, {}), value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                merged[key] = merged.get(key, 0) + value
+    if reports and "duration_seconds" in reports[0]:
+        merged["duration_seconds"] = max(r.get("duration_seconds", 0) for r in reports)
+    if reports and "started_at" in reports[0]:
+        merged["started_at"] = min(r["started_at"] for r in reports)
+    merged["slowest_projects"] = sorted(merged["slowest_projects"], key=lambda p: p["seconds"], reverse=True)[:SLOWEST_PROJECTS_IN_REPORT]
+    return merged
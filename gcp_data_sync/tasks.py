@@ -1,22 +1,31 @@
 import logging
 import asyncio
-from celery import group
+import time
+from functools import partial
 from .celery_app import celery_app
+from .circuit_breaker import track_transient_failures
 from .datastore_client import save_dashboard_data
+from .executor import MAX_WORKERS, get_collector_pool, run_ordered
+from .negative_cache import CACHED_FAILURES_FIELD, get_cached_failures, invalidate_negative_cache
+from .run_cache import evict
+from .run_metrics import get_run_metrics
 from .firewall import get_denied_internet_ingress_rules
-from .org_policies import get_all_effective_policies
-from .scc_services import get_security_center_services
-from .sha_modules import get_sha_custom_modules, get_sha_modules
-from .vpc_sc import get_vpc_sc_status
+from .org_policies import ORG_POLICY_DETAILS_FIELD, get_all_effective_policies, get_all_effective_policies_async, pack_policy_details
+from .scc_services import get_security_center_services, get_security_center_services_async
+from .sha_modules import get_sha_custom_modules, get_sha_custom_modules_async, get_sha_modules, get_sha_modules_async
+from .vpc_sc import get_vpc_sc_status, get_vpc_sc_status_async
 
 # Silence the successful task completion log message from Celery
 from celery.app.log import get_logger
 celery_trace_logger = get_logger('celery.app.trace')
 celery_trace_logger.setLevel(logging.WARNING)
 
+def _get_all_effective_policies_sync(project_id, project=None):
+    return asyncio.run(get_all_effective_policies(project_id, project))
+
 @celery_app.task
 def get_all_effective_policies_task(project_id):
-    return asyncio.run(get_all_effective_policies(project_id))
+    return _get_all_effective_policies_sync(project_id)
 
 @celery_app.task
 def get_vpc_sc_status_task(project_id):
@@ -38,67 +47,207 @@ def get_security_center_services_task(project_id):
 def get_denied_internet_ingress_rules_task(project_id):
     return get_denied_internet_ingress_rules(project_id)
 
-@celery_app.task(bind=True)
-def refresh_single_project_data_task(self, project_id):
+@celery_app.task
+def invalidate_negative_cache_task(project_id=None):
+    """Drops cached API failures for one project, or for all projects when project_id is None."""
+    return invalidate_negative_cache(project_id)
+
+# The sections of a project's dashboard data, and the collectors that produce each one.
+SECTION_COLLECTORS = {
+    "org_policies": ("org_policies",),
+    "vpc_sc_status": ("vpc_sc_status",),
+    "sha_modules": ("sha_custom_modules", "sha_module_details"),
+    "security_services": ("security_services",),
+    "firewall_rules": ("firewall_rules",),
+}
+SECTIONS = tuple(SECTION_COLLECTORS)
+
+def _project_collectors(project):
+    """Returns the collectors for a project, keyed by name."""
+    return {
+        "org_policies": partial(_get_all_effective_policies_sync, project=project),
+        "vpc_sc_status": partial(get_vpc_sc_status, project_number=project.get("project_number")),
+        "sha_custom_modules": get_sha_custom_modules,
+        "sha_module_details": get_sha_modules,
+        "security_services": get_security_center_services,
+        "firewall_rules": get_denied_internet_ingress_rules,
+    }
+
+def _project_async_collectors(ctx, project):
+    """Returns the async collectors for a project, keyed by name, for a pipeline run's context."""
+    return {
+        "org_policies": partial(get_all_effective_policies_async, ctx, project=project),
+        "vpc_sc_status": partial(get_vpc_sc_status_async, ctx, project_number=project.get("project_number")),
+        "sha_custom_modules": partial(get_sha_custom_modules_async, ctx),
+        "sha_module_details": partial(get_sha_modules_async, ctx),
+        "security_services": partial(get_security_center_services_async, ctx),
+        # Compute has no async client, so firewall rules are listed on a worker thread.
+        "firewall_rules": partial(asyncio.to_thread, get_denied_internet_ingress_rules),
+    }
+
+class TransientFailuresError(Exception):
+    """Raised for a project whose collection hit transient API failures, so it can be retried later."""
+
+def _run_collector(name, collector, project_id):
+    """Runs a collector, returning its result and the transient failures it hit, and records its wall time."""
+    started = time.monotonic()
+    failed = True
+    try:
+        with track_transient_failures() as failures:
+            result = collector(project_id)
+        failed = False
+        return result, failures
+    finally:
+        get_run_metrics().record_collector(name, time.monotonic() - started, failed)
+
+async def _run_collector_async(name, collector, project_id):
+    started = time.monotonic()
+    failed = True
+    try:
+        with track_transient_failures() as failures:
+            result = await collector(project_id)
+        failed = False
+        return result, failures
+    finally:
+        get_run_metrics().record_collector(name, time.monotonic() - started, failed)
+
+def _build_sha_modules(sha_custom_modules, sha_module_details):
+    all_sha_modules = []
+    if sha_custom_modules:
+        # Ensure all custom modules have a controlType for frontend stability
+        for module in sha_custom_modules:
+            module['controlType'] = 'SHA Custom Module'
+        all_sha_modules.extend(sha_custom_modules)
+    if sha_module_details and sha_module_details.get('modules'):
+        all_sha_modules.extend(sha_module_details['modules'])
+    return all_sha_modules
+
+def _build_security_services(other_security_services):
+    processed_security_services = []
+    if other_security_services:
+        for service in other_security_services:
+            if service.get('modules'):
+                service_id = service.get('details', '').replace('Service ID: ', '')
+                processed_security_services.extend([{'name': m.get('name'), 'status': m.get('status'), 'controlType': service_id, 'details': f"Part of {service.get('name')}"} for m in service['modules']])
+            else:
+                processed_security_services.append(service)
+    return processed_security_services
+
+def _assemble_security_data(project_id, raw, sections, previous):
+    """Builds a project's dashboard data from its raw collector results."""
+    builders = {
+        "org_policies": lambda: raw["org_policies"],
+        "vpc_sc_status": lambda: raw["vpc_sc_status"],
+        "sha_modules": lambda: _build_sha_modules(raw["sha_custom_modules"], raw["sha_module_details"]),
+        "security_services": lambda: _build_security_services(raw["security_services"]),
+        "firewall_rules": lambda: raw["firewall_rules"],
+    }
+    security_data = {
+        section: builders[section]() if section in sections else (previous or {}).get(section)
+        for section in SECTIONS
+    }
+    # The full org policies are stored compressed beside their compact entries and follow them.
+    if "org_policies" in sections:
+        security_data["org_policies"], security_data[ORG_POLICY_DETAILS_FIELD] = pack_policy_details(security_data["org_policies"])
+    else:
+        security_data[ORG_POLICY_DETAILS_FIELD] = (previous or {}).get(ORG_POLICY_DETAILS_FIELD)
+    # Record which calls were skipped because of failures cached by earlier runs.
+    security_data[CACHED_FAILURES_FIELD] = get_cached_failures(project_id)
+    return security_data
+
+def _defer_on_transient_failures(project_id, transient):
+    """Raises TransientFailuresError if any collector hit a transient failure."""
+    if transient:
+        summary = ", ".join(sorted({f"{api} {error_class}" for api, error_class, _ in transient}))
+        logging.warning(f"Deferring project {project_id} after {len(transient)} transient failures ({summary}).")
+        raise TransientFailuresError(f"Transient failures: {summary}")
+
+def collect_single_project_data(project, sections=None, previous=None, defer_transient=False):
     """
-    Celery task to refresh all security data for a single project.
-    This task calls the data fetching functions in parallel using a Celery group.
+    Collects security data for a single project without saving it.
+    The project is a dict from get_projects_in_org (at least a "project_id").
+    The collectors run concurrently on the shared collector pool, bounded by MAX_WORKERS.
+
+    Args:
+        project: The project dict.
+        sections: The sections (see SECTIONS) to collect. Defaults to all of them.
+        previous: The project's previously stored data; sections that are not collected
+            are copied from it.
+        defer_transient: If True, raise TransientFailuresError when any collector hit a
+            transient API failure instead of returning data with "Error" entries, so the
+            caller can retry the project later in the run.
+
+    Returns:
+        A (project_id, security_data, error_msg) tuple; security_data is None on failure.
     """
+    project_id = project["project_id"]
+    sections = sections or SECTIONS
     logging.info(f"Executing data refresh task for project: {project_id}")
+    started = time.monotonic()
     try:
-        # Run the org policies task sequentially first to avoid hitting API quota limits.
-        logging.info(f"Running org policies task sequentially for project: {project_id}")
-        org_policies_result = get_all_effective_policies_task.delay(project_id)
-
-        # Create a group of the remaining tasks to run in parallel
-        logging.info(f"Running remaining tasks in parallel for project: {project_id}")
-        other_tasks_group = group(
-            get_vpc_sc_status_task.s(project_id),
-            get_sha_custom_modules_task.s(project_id),
-            get_sha_modules_task.s(project_id),
-            get_security_center_services_task.s(project_id),
-            get_denied_internet_ingress_rules_task.s(project_id)
+        collectors = _project_collectors(project)
+        names = [name for section in sections for name in SECTION_COLLECTORS[section]]
+        results = run_ordered(
+            lambda name: _run_collector(name, collectors[name], project_id),
+            names,
+            max_workers=MAX_WORKERS,
+            mode="thread",
+            executor=get_collector_pool(),
         )
+        raw = {name: result for name, (result, _) in zip(names, results)}
+        transient = [failure for _, failures in results for failure in failures]
+        security_data = _assemble_security_data(project_id, raw, sections, previous)
+    except Exception as e:
+        logging.error(f"Error refreshing data for project {project_id}: {e}", exc_info=True)
+        return project_id, None, str(e)
+    finally:
+        # Results memoized for this project are not needed by any other project.
+        evict(f"projects/{project_id}")
+        get_run_metrics().record_project(project_id, time.monotonic() - started)
 
-        # Execute the parallel group
-        other_results_group = other_tasks_group.apply_async()
-
-        # Wait for all tasks to complete and get the results
-        org_policies = org_policies_result.get()
-        other_results = other_results_group.get()
-
-        # Unpack the results from the parallel group
-        vpc_sc_status, sha_custom_modules, sha_module_details, other_security_services, denied_firewall_rules = other_results
-
-        all_sha_modules = []
-        if sha_custom_modules:
-            # Ensure all custom modules have a controlType for frontend stability
-            for module in sha_custom_modules:
-                module['controlType'] = 'SHA Custom Module'
-            all_sha_modules.extend(sha_custom_modules)
-        if sha_module_details and sha_module_details.get('modules'):
-            all_sha_modules.extend(sha_module_details['modules'])
-
-        processed_security_services = []
-        if other_security_services:
-            for service in other_security_services:
-                if service.get('modules'):
-                    service_id = service.get('details', '').replace('Service ID: ', '')
-                    processed_security_services.extend([{'name': m.get('name'), 'status': m.get('status'), 'controlType': service_id, 'details': f"Part of {service.get('name')}"} for m in service['modules']])
-                else:
-                    processed_security_services.append(service)
-
-        security_data = {
-            "org_policies": org_policies,
-            "vpc_sc_status": vpc_sc_status,
-            "sha_modules": all_sha_modules,
-            "security_services": processed_security_services,
-            "firewall_rules": denied_firewall_rules
-        }
-
-        save_dashboard_data(project_id, security_data)
-        logging.info(f"Successfully saved data for project {project_id} to Datastore.")
-        return project_id, True, None
+    if defer_transient:
+        _defer_on_transient_failures(project_id, transient)
+    return project_id, security_data, None
+
+async def collect_single_project_data_async(ctx, project, sections=None, previous=None, defer_transient=False):
+    """
+    The async counterpart of collect_single_project_data, producing the same data. The
+    collectors run concurrently on the event loop, using the clients and the in-flight
+    request limit of ctx (an async_pipeline.AsyncCollectorContext).
+    """
+    project_id = project["project_id"]
+    sections = sections or SECTIONS
+    logging.info(f"Executing data refresh task for project: {project_id}")
+    started = time.monotonic()
+    try:
+        collectors = _project_async_collectors(ctx, project)
+        names = [name for section in sections for name in SECTION_COLLECTORS[section]]
+        results = await asyncio.gather(*(_run_collector_async(name, collectors[name], project_id) for name in names))
+        raw = {name: result for name, (result, _) in zip(names, results)}
+        transient = [failure for _, failures in results for failure in failures]
+        security_data = _assemble_security_data(project_id, raw, sections, previous)
     except Exception as e:
         logging.error(f"Error refreshing data for project {project_id}: {e}", exc_info=True)
-        return project_id, False, str(e)
+        return project_id, None, str(e)
+    finally:
+        evict(f"projects/{project_id}")
+        get_run_metrics().record_project(project_id, time.monotonic() - started)
+
+    if defer_transient:
+        _defer_on_transient_failures(project_id, transient)
+    return project_id, security_data, None
+
+def refresh_single_project_data(project):
+    """Collects all security data for a single project and saves it to Datastore."""
+    project_id, security_data, error_msg = collect_single_project_data(project)
+    if error_msg:
+        return project_id, False, error_msg
+
+    save_dashboard_data(project_id, security_data)
+    logging.info(f"Successfully saved data for project {project_id} to Datastore.")
+    return project_id, True, None
+
+@celery_app.task(bind=True)
+def refresh_single_project_data_task(self, project_id):
+    """Celery task wrapper around refresh_single_project_data."""
+    return refresh_single_project_data({"project_id": project_id})
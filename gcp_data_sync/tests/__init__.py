@@ -0,0 +1,4 @@
+import os
+
+# The sync modules refuse to import without a Datastore project; the tests never use a real one.
+os.environ.setdefault("DASHBOARD_GCP_PROJECT_ID", "test-datastore-project")
@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from google.api_core import exceptions
+
+from gcp_data_sync import main as sync_main, rate_limiter
+from gcp_data_sync.benchmark.fake_clients import FakeClient, FakeGcp, FaultInjector
+from gcp_data_sync.benchmark.fixtures import Fixture, error_to_json
+from gcp_data_sync.benchmark.memory_datastore import MAX_ENTITIES_PER_COMMIT, MAX_ENTITY_BYTES, InMemoryDatastore
+from gcp_data_sync.benchmark.runner import run_benchmark
+from gcp_data_sync.benchmark.synthetic_org import generate_org
+
+
+def _firewall(name):
+    return {"name": name, "network": "default"}
+
+
+class TestFixture(unittest.TestCase):
+
+    def test_round_trip(self):
+        """Test that a fixture saved with gzip compression loads back unchanged."""
+        fixture = Fixture("1")
+        fixture.extend("list", "p", [_firewall("a")])
+        fixture.extend("list", "p", [_firewall("b")])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fixture.json.gz")
+            fixture.save(path)
+            loaded = Fixture.load(path)
+        self.assertEqual((loaded.org_id, loaded.responses), ("1", {"list": {"p": {"items": [_firewall("a"), _firewall("b")]}}}))
+
+    def test_generated_org_is_reproducible(self):
+        """Test that the same arguments generate the same organization with the requested number of projects."""
+        first = generate_org(projects=30, folder_depth=2, folder_fanout=2, seed=3)
+        self.assertEqual(first.responses, generate_org(projects=30, folder_depth=2, folder_fanout=2, seed=3).responses)
+        projects = sum(len(r["items"]) for r in first.responses["search_projects"].values())
+        self.assertEqual(projects, 30)
+
+
+class TestFakeClients(unittest.TestCase):
+
+    def setUp(self):
+        self.fixture = Fixture("1")
+        self.fixture.set("list", "p", {"items": [_firewall(str(i)) for i in range(5)]})
+        self.fixture.set("get_project", "projects/gone", {"error": error_to_json(exceptions.PermissionDenied("denied"))})
+
+    def test_pages_cost_a_request_each(self):
+        """Test that a listing is paged by page_size and that every page after the first is a request."""
+        faults = FaultInjector()
+        client = FakeClient(FakeGcp(self.fixture, faults, page_size=2), "compute.firewalls")
+        pager = client.list(project="p")
+        self.assertEqual([firewall.name for firewall in pager], ["0", "1", "2", "3", "4"])
+        self.assertEqual(faults.snapshot()["by_method"], {"list": 3})
+        self.assertEqual(pager._response.next_page_token, "")
+
+    def test_recorded_and_missing_responses(self):
+        """Test that a recorded error is raised, a missing get is NotFound and a missing listing is empty."""
+        gcp = FakeGcp(self.fixture)
+        projects = FakeClient(gcp, "resourcemanager.projects")
+        with self.assertRaises(exceptions.PermissionDenied):
+            projects.get_project(name="projects/gone")
+        with self.assertRaises(exceptions.NotFound):
+            projects.get_project(name="projects/other")
+        self.assertEqual(list(FakeClient(gcp, "compute.firewalls").list(project="other")), [])
+
+    def test_faults_spare_listing_methods(self):
+        """Test that injected failures hit the collectors' calls only, and are counted."""
+        faults = FaultInjector(throttle_rate=1.0)
+        faults.request("search_projects")
+        with self.assertRaises(exceptions.TooManyRequests):
+            faults.request("list")
+        faults = FaultInjector(error_rate=1.0)
+        with self.assertRaises(exceptions.ServiceUnavailable):
+            faults.request("list")
+        self.assertEqual(faults.snapshot()["injected_errors"], 1)
+
+
+class TestInMemoryDatastore(unittest.TestCase):
+
+    def setUp(self):
+        self.client = InMemoryDatastore()
+
+    def _entity(self, name, **values):
+        entity = self.client.entity(self.client.key("Kind", name), exclude_from_indexes=("blob",))
+        entity.update(values)
+        return entity
+
+    def test_datastore_limits_are_enforced(self):
+        """Test that oversized entities and commits are rejected like Datastore rejects them."""
+        with self.assertRaises(exceptions.InvalidArgument):
+            self.client.put(self._entity("big", blob=b"x" * MAX_ENTITY_BYTES))
+        with self.assertRaises(exceptions.InvalidArgument):
+            self.client.put_multi([self._entity(str(i)) for i in range(MAX_ENTITIES_PER_COMMIT + 1)])
+        self.assertEqual(self.client.stats["rejected"], 2)
+
+    def test_queries_use_indexed_values(self):
+        """Test that filters and projections only see indexed properties."""
+        self.client.put_multi([self._entity("a", n=1, blob=b"a"), self._entity("b", n=2, blob=b"b")])
+        query = self.client.query(kind="Kind")
+        query.add_filter("n", ">", 1)
+        self.assertEqual([entity.key.name for entity in query.fetch()], ["b"])
+        self.assertEqual(list(self.client.query(kind="Kind", filters=[("blob", "=", b"a")]).fetch()), [])
+        projected = list(self.client.query(kind="Kind", projection=["n"]).fetch())
+        self.assertEqual(sorted(entity["n"] for entity in projected), [1, 2])
+        self.assertTrue(all(set(entity) == {"n"} for entity in projected))
+
+
+class TestRunBenchmark(unittest.TestCase):
+
+    def test_end_to_end(self):
+        """Test that the whole job runs against the fakes and that a second run reuses the first run's state."""
+        fixture = generate_org(projects=20, folder_depth=2, folder_fanout=2, seed=1)
+        # Fresh limiters without the production rate limits, so the test runs at the fakes' speed.
+        fast = {f"{api.upper()}_QPS": "5000" for api in rate_limiter.DEFAULT_API_QPS}
+        with patch.dict(os.environ, fast), patch.dict(rate_limiter._limiters, clear=True), \
+                patch.object(sync_main, "ORGANIZATION_ID", fixture.org_id):
+            results = run_benchmark(fixture, runs=2)
+        self.assertEqual(results["fixture"]["projects"], 20)
+        first, second = (run["report"] for run in results["runs"])
+        self.assertEqual((first["successful"], second["successful"]), (20, 20))
+        self.assertEqual(second["changed"] + second["unchanged"], 20)
+        self.assertGreater(second["unchanged"], 0)
+        self.assertLess(results["runs"][1]["fake_api"]["requests"], results["runs"][0]["fake_api"]["requests"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+
+from google.api_core import exceptions
+
+from gcp_data_sync import circuit_breaker
+from gcp_data_sync.circuit_breaker import (
+    CircuitOpenError, check_circuit, get_circuit_breaker_stats, project_scoped_calls, record_failure, record_success,
+    reset_circuit_breakers,
+)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.threshold = patch.object(circuit_breaker, "CIRCUIT_BREAKER_THRESHOLD", 3)
+        self.threshold.start()
+        reset_circuit_breakers()
+
+    def tearDown(self):
+        self.threshold.stop()
+        reset_circuit_breakers()
+
+    def _fail(self, error, times=3):
+        for _ in range(times):
+            record_failure("orgpolicy", error)
+
+    def test_opens_after_consecutive_persistent_failures(self):
+        """Test that the breaker opens at the threshold and then skips calls to the API only."""
+        self._fail(exceptions.PermissionDenied("denied"), times=2)
+        check_circuit("orgpolicy")
+        self._fail(exceptions.PermissionDenied("denied"), times=1)
+        with self.assertRaises(CircuitOpenError):
+            check_circuit("orgpolicy")
+        check_circuit("compute")
+        self.assertTrue(get_circuit_breaker_stats()["orgpolicy:PermissionDenied"]["open"])
+
+    def test_transient_failures_do_not_count(self):
+        """Test that transient errors never open a breaker."""
+        self._fail(exceptions.ServiceUnavailable("unavailable"), times=10)
+        check_circuit("orgpolicy")
+
+    def test_project_level_errors_of_project_calls_do_not_count(self):
+        """Test that errors the negative cache handles per project do not trip the API's breaker."""
+        with project_scoped_calls():
+            self._fail(exceptions.PermissionDenied("SERVICE_DISABLED"), times=10)
+            self._fail(exceptions.FailedPrecondition("not activated"), times=10)
+        check_circuit("orgpolicy")
+        with project_scoped_calls():
+            self._fail(exceptions.Unauthenticated("bad credentials"))
+        with self.assertRaises(CircuitOpenError):
+            check_circuit("orgpolicy")
+
+    def test_success_resets_the_count(self):
+        """Test that a success in between resets the consecutive failure count."""
+        self._fail(exceptions.PermissionDenied("denied"), times=2)
+        record_success("orgpolicy")
+        self._fail(exceptions.PermissionDenied("denied"), times=2)
+        check_circuit("orgpolicy")
+
+    def test_probe_closes_on_success(self):
+        """Test that one probe is let through after the cooldown and closes the breaker if it succeeds."""
+        self._fail(exceptions.PermissionDenied("denied"))
+        with patch.object(circuit_breaker, "CIRCUIT_BREAKER_COOLDOWN_SECONDS", 0):
+            check_circuit("orgpolicy")
+            with self.assertRaises(CircuitOpenError):
+                check_circuit("orgpolicy")
+            record_success("orgpolicy")
+        check_circuit("orgpolicy")
+
+    def test_failed_probe_reopens_whatever_the_error(self):
+        """Test that a probe failing with a transient error reopens the breaker instead of leaving it probing."""
+        self._fail(exceptions.PermissionDenied("denied"))
+        with patch.object(circuit_breaker, "CIRCUIT_BREAKER_COOLDOWN_SECONDS", 0):
+            check_circuit("orgpolicy")
+            record_failure("orgpolicy", exceptions.ServiceUnavailable("unavailable"))
+            # Reopened with a fresh cooldown, which has already passed here: the next probe goes through.
+            check_circuit("orgpolicy")
+        record_failure("orgpolicy", exceptions.DeadlineExceeded("slow"))
+        with self.assertRaises(CircuitOpenError):
+            check_circuit("orgpolicy")
+
+if __name__ == '__main__':
+    unittest.main()
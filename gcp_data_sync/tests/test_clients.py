@@ -0,0 +1,54 @@
+import unittest
+import threading
+from unittest.mock import MagicMock
+
+from gcp_data_sync import clients
+
+
+class TestClients(unittest.TestCase):
+
+    def setUp(self):
+        self.created = []
+
+        def factory(credentials=None):
+            client = MagicMock()
+            self.created.append(client)
+            return client
+
+        self.overrides = clients.client_overrides(
+            factories={"orgpolicy": factory}, access_context_manager=factory, credentials=object(),
+        )
+        self.overrides.__enter__()
+
+    def tearDown(self):
+        self.overrides.__exit__(None, None, None)
+
+    def test_shared_client_created_once(self):
+        """Test that every caller gets the same shared client."""
+        self.assertIs(clients.get_org_policy_client(), clients.get_org_policy_client())
+        self.assertEqual(len(self.created), 1)
+
+    def test_discovery_client_per_thread(self):
+        """Test that each thread gets its own discovery client and keeps reusing it."""
+        main_client = clients.get_access_context_manager_client()
+        self.assertIs(clients.get_access_context_manager_client(), main_client)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(clients.get_access_context_manager_client()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], main_client)
+        stats = clients.get_client_stats()
+        self.assertEqual((stats["discovery_clients"], stats["open_channels"]), (2, 2))
+
+    def test_close_all_closes_discovery_clients(self):
+        """Test that close_all closes the discovery clients, stops counting them and replaces them on next use."""
+        client = clients.get_access_context_manager_client()
+        clients.get_org_policy_client()
+        clients.close_all()
+        client.close.assert_called_once()
+        stats = clients.get_client_stats()
+        self.assertEqual((stats["clients"], stats["discovery_clients"], stats["open_channels"]), ([], 0, 0))
+        self.assertIsNot(clients.get_access_context_manager_client(), client)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import json
+import threading
+import unittest
+from unittest.mock import patch
+
+from google.api_core import exceptions
+
+from gcp_data_sync import datastore_client
+from gcp_data_sync.benchmark.memory_datastore import InMemoryDatastore
+from gcp_data_sync.datastore_client import (
+    PROJECTS_KIND, DatastoreBatchWriter, datastore_client_override, get_projects_data, save_projects_data,
+)
+
+
+class FlakyDatastore(InMemoryDatastore):
+    """An in-memory Datastore whose put_multi always fails and whose put fails for the names in reject."""
+
+    def __init__(self, reject=()):
+        super().__init__()
+        self.reject = set(reject)
+
+    def put_multi(self, entities):
+        entities = list(entities)
+        if len(entities) > 1:
+            raise exceptions.ServiceUnavailable("commit failed")
+        if entities[0].key.name in self.reject:
+            raise exceptions.InvalidArgument("entity rejected")
+        super().put_multi(entities)
+
+
+class BlockingDatastore(InMemoryDatastore):
+    """An in-memory Datastore whose first put_multi waits for release, recording the threads it is called on."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.threads = set()
+
+    def put_multi(self, entities):
+        self.threads.add(threading.current_thread().name.split("_")[0])
+        self.started.set()
+        self.release.wait(5)
+        super().put_multi(entities)
+
+
+class TestDatastoreBatchWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.patches = [
+            patch.object(datastore_client, "WRITE_BATCH_MAX_ENTITIES", 2),
+            patch.object(datastore_client, "WRITE_MAX_RETRIES", 0),
+            patch.object(datastore_client, "WRITE_FLUSH_INTERVAL_SECONDS", 3600),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+
+    def test_writes_are_batched(self):
+        """Test that entities are written with one put_multi per full batch and on close."""
+        client = InMemoryDatastore()
+        writer = DatastoreBatchWriter("Kind", client)
+        writer.add("a", {"value": "a"})
+        writer.add("b", {"value": "b"})
+        writer._background_flush.result()
+        self.assertEqual(client.stats["rpcs"], 1)
+        writer.add("c", {"value": "c"})
+        writer.close()
+        self.assertEqual(client.stats["rpcs"], 2)
+        self.assertEqual((writer.stats["entities"], writer.stats["failed"]), (3, 0))
+        stored = client.get(client.key("Kind", "c"))
+        self.assertEqual(stored["value"], "c")
+        self.assertEqual(stored["content_hash"], datastore_client.content_hash({"value": "c"}))
+        self.assertEqual(stored.exclude_from_indexes, {"value", "last_updated"})
+
+    def test_failed_batch_falls_back_to_single_writes(self):
+        """Test that a failed put_multi is written entity by entity and failures are reported per entity."""
+        client = FlakyDatastore(reject={"b"})
+        writer = DatastoreBatchWriter("Kind", client)
+        writer.add("a", {"value": 1})
+        writer.add("b", {"value": 2})
+        writer.close()
+        self.assertEqual(list(writer.failures), ["b"])
+        self.assertIsNotNone(client.get(client.key("Kind", "a")))
+        self.assertIsNone(client.get(client.key("Kind", "b")))
+        self.assertEqual((writer.stats["entities"], writer.stats["failed"]), (1, 1))
+
+    def test_add_does_not_wait_for_the_write(self):
+        """Test that a flush triggered by add runs on the writer's thread and that flush waits for it."""
+        client = BlockingDatastore()
+        writer = DatastoreBatchWriter("Kind", client)
+        writer.add("a", {"value": 1})
+        writer.add("b", {"value": 2})
+        self.assertTrue(client.started.wait(5))
+        # The caller goes on while put_multi is still in progress.
+        writer.add("c", {"value": 3})
+        self.assertEqual(client.stats["entities_written"], 0)
+        client.release.set()
+        writer.close()
+        self.assertEqual(client.threads, {"datastore-writer", threading.current_thread().name})
+        self.assertEqual((writer.stats["entities"], client.stats["entities_written"]), (3, 3))
+
+
+class TestContentHashes(unittest.TestCase):
+
+    def test_hash_ignores_metadata(self):
+        """Test that the content hash ignores the stored metadata and key order."""
+        data = {"a": 1, "b": [1, 2]}
+        stored = datastore_client.with_content_hash(data)
+        self.assertEqual(datastore_client.content_hash(stored), datastore_client.content_hash({"b": [1, 2], "a": 1}))
+        self.assertNotEqual(datastore_client.content_hash(data), datastore_client.content_hash({"a": 2, "b": [1, 2]}))
+
+    def test_unchanged_data_is_skipped(self):
+        """Test that data whose hash matches the stored one is not written again."""
+        client = InMemoryDatastore()
+        first = DatastoreBatchWriter("Kind", client)
+        first.add("a", {"value": 1})
+        first.add("b", {"value": 2})
+        first.close()
+
+        known = datastore_client.load_content_hashes("Kind", client)
+        self.assertEqual(set(known), {"a", "b"})
+        second = DatastoreBatchWriter("Kind", client, known_hashes=known)
+        self.assertFalse(second.add("a", {"value": 1}))
+        self.assertTrue(second.add("b", {"value": 3}))
+        second.close()
+        self.assertEqual((second.unchanged, second.changed), ({"a"}, {"b"}))
+        self.assertEqual(second.stats["entities"], 1)
+        self.assertEqual(client.get(client.key("Kind", "b"))["value"], 3)
+
+
+class TestProjectsData(unittest.TestCase):
+
+    def setUp(self):
+        self.client = InMemoryDatastore()
+        self.override = datastore_client_override(self.client)
+        self.override.__enter__()
+        self.shard_size = patch.object(datastore_client, "PROJECTS_SHARD_SIZE", 2)
+        self.shard_size.start()
+
+    def tearDown(self):
+        self.shard_size.stop()
+        self.override.__exit__(None, None, None)
+
+    def _names(self):
+        query = self.client.query(kind=PROJECTS_KIND)
+        query.keys_only()
+        return sorted(entity.key.name for entity in query.fetch())
+
+    def _projects(self, *folders):
+        return [{"project_id": f"p{i}", "folder_name": folder} for i, folder in enumerate(folders)]
+
+    def test_round_trip_in_shards(self):
+        """Test that the project list is saved in shards with a folder index and read back whole."""
+        projects = self._projects("a", "a", "a", "b", "b")
+        self.assertTrue(save_projects_data("1", {"projects": projects, "folders": 2}))
+        manifest = self.client.get(self.client.key(PROJECTS_KIND, "1"))
+        self.assertEqual((manifest["shards"], manifest["count"], manifest["folders"]), (3, 5, 2))
+        self.assertEqual(json.loads(manifest["folder_shards"]), {"a": [0, 1], "b": [1, 2]})
+        self.assertEqual(len(self._names()), 4)
+        self.assertEqual(get_projects_data("1")["projects"], projects)
+
+    def test_previous_shards_are_deleted(self):
+        """Test that a new list replaces the previous list's shards, and an unchanged list keeps them."""
+        save_projects_data("1", {"projects": self._projects("a", "a", "a")})
+        save_projects_data("1", {"projects": self._projects("a", "a", "a")})
+        self.assertEqual(len(self._names()), 3)
+        projects = self._projects("b")
+        save_projects_data("1", {"projects": projects})
+        generation = self.client.get(self.client.key(PROJECTS_KIND, "1"))["generation"]
+        self.assertEqual(self._names(), ["1", f"1:{generation}:0"])
+        self.assertEqual(get_projects_data("1")["projects"], projects)
+
+    def test_missing_shard_fails_the_read(self):
+        """Test that a list with a missing shard is not returned partially."""
+        save_projects_data("1", {"projects": self._projects("a", "a", "a")})
+        self.client.delete(self.client.key(PROJECTS_KIND, self._names()[1]))
+        self.assertIsNone(get_projects_data("1"))
+
+if __name__ == '__main__':
+    unittest.main()
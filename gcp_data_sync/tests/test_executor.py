@@ -0,0 +1,137 @@
+import unittest
+import threading
+import time
+
+from gcp_data_sync.executor import TaskTimeoutError, get_collector_pool, run_ordered, shutdown_collector_pool
+
+
+class TestRunOrdered(unittest.TestCase):
+
+    def test_results_keep_item_order(self):
+        """Test that results come back in item order, whatever order the items finish in."""
+        for mode in ("thread", "asyncio"):
+            with self.subTest(mode=mode):
+                results = run_ordered(lambda n: time.sleep(0.01 * (5 - n)) or n * 10, range(5), max_workers=5, mode=mode)
+                self.assertEqual(results, [0, 10, 20, 30, 40])
+
+    def test_max_workers_bounds_concurrency(self):
+        """Test that no more than max_workers items run at once."""
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def work(_):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+        run_ordered(work, range(10), max_workers=3, mode="thread")
+        self.assertLessEqual(peak[0], 3)
+
+    def test_failure_is_raised_without_on_error(self):
+        """Test that the first failure is re-raised when no on_error is given."""
+        def work(n):
+            if n == 2:
+                raise ValueError("boom")
+            return n
+
+        with self.assertRaises(ValueError):
+            run_ordered(work, range(4), mode="thread")
+
+    def test_on_error_result_replaces_failure(self):
+        """Test that on_error's return value becomes the failed item's result."""
+        def work(n):
+            if n == 1:
+                raise ValueError("boom")
+            return n
+
+        results = run_ordered(work, range(3), mode="thread", on_error=lambda item, e: f"failed {item}: {e}")
+        self.assertEqual(results, [0, "failed 1: boom", 2])
+
+    def test_timeout_is_reported_through_on_error(self):
+        """Test that an item running past its timeout is abandoned with a TaskTimeoutError."""
+        release = threading.Event()
+        errors = []
+
+        def work(n):
+            if n == 0:
+                release.wait(5)
+            return n
+
+        def on_error(item, e):
+            errors.append((item, type(e)))
+            return "timed out"
+
+        try:
+            started = time.monotonic()
+            results = run_ordered(work, range(3), max_workers=3, timeout=0.1, mode="thread", on_error=on_error)
+            self.assertLess(time.monotonic() - started, 2)
+        finally:
+            release.set()
+        self.assertEqual(results, ["timed out", 1, 2])
+        self.assertEqual(errors, [(0, TaskTimeoutError)])
+
+    def test_asyncio_timeout(self):
+        """Test that coroutines running past their timeout are abandoned in asyncio mode."""
+        import asyncio
+
+        async def work(n):
+            await asyncio.sleep(5 if n == 1 else 0)
+            return n
+
+        results = run_ordered(work, range(3), timeout=0.1, mode="asyncio", on_error=lambda item, e: type(e).__name__)
+        self.assertEqual(results, [0, "TaskTimeoutError", 2])
+
+    def test_on_result_replacement(self):
+        """Test that on_result sees every result as it finishes and can replace it."""
+        seen = []
+
+        def on_result(index, item, result):
+            seen.append((index, item, result))
+            return "handed off" if item == 1 else None
+
+        results = run_ordered(lambda n: n * 2, range(3), mode="thread", on_result=on_result)
+        self.assertEqual(results, [0, "handed off", 4])
+        self.assertEqual(sorted(seen), [(0, 0, 0), (1, 1, 2), (2, 2, 4)])
+
+    def test_asyncio_callbacks_run_off_the_loop(self):
+        """Test that in asyncio mode on_result runs on one thread other than the event loop's."""
+        import asyncio
+
+        loop_threads, callback_threads = set(), set()
+
+        async def work(n):
+            loop_threads.add(threading.get_ident())
+            await asyncio.sleep(0)
+            return n
+
+        def on_result(index, item, result):
+            callback_threads.add(threading.get_ident())
+            time.sleep(0.01)
+
+        self.assertEqual(run_ordered(work, range(5), mode="asyncio", on_result=on_result), list(range(5)))
+        self.assertEqual(len(callback_threads), 1)
+        self.assertFalse(callback_threads & loop_threads)
+
+    def test_shared_pool_is_reused(self):
+        """Test that runs on the collector pool reuse its threads and leave it running."""
+        try:
+            pool = get_collector_pool()
+            first = set(run_ordered(lambda _: threading.get_ident(), range(4), mode="thread", executor=pool))
+            second = set(run_ordered(lambda _: threading.get_ident(), range(4), mode="thread", executor=pool))
+            self.assertIs(get_collector_pool(), pool)
+            self.assertLessEqual(first | second, {thread.ident for thread in pool._threads})
+        finally:
+            shutdown_collector_pool()
+        self.assertIsNot(get_collector_pool(), pool)
+        shutdown_collector_pool()
+
+    def test_unknown_mode(self):
+        """Test that an unknown execution mode is rejected."""
+        with self.assertRaises(ValueError):
+            run_ordered(lambda n: n, [1], mode="fibers")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from google.cloud import resourcemanager_v3
+
+from gcp_data_sync import clients, folder_graph, rate_limiter
+from gcp_data_sync.benchmark.memory_datastore import InMemoryDatastore
+from gcp_data_sync.circuit_breaker import reset_circuit_breakers
+from gcp_data_sync.datastore_client import datastore_client_override
+from gcp_data_sync.folder_graph import refresh_folder_graph
+
+ROOT = "organizations/1"
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class TestRefreshFolderGraph(unittest.TestCase):
+    """Runs refresh_folder_graph against a mock folders client holding an org of folders a, a/a1, a/a1/x and b."""
+
+    def setUp(self):
+        self.folders = {}
+        for name, parent in (("a", ROOT), ("b", ROOT), ("a1", "folders/a"), ("x", "folders/a1")):
+            self._add(name, parent)
+        self.lagging = set()  # folders the search does not return yet
+        self.folders_client = MagicMock()
+        self.folders_client.list_folders.side_effect = lambda request: [
+            folder for folder in self.folders.values() if folder.parent == request.parent
+        ]
+        self.folders_client.search_folders.side_effect = lambda request: [
+            folder for name, folder in self.folders.items() if name not in self.lagging
+        ]
+        self.overrides = clients.client_overrides(
+            factories={"resourcemanager.folders": lambda credentials=None: self.folders_client}, credentials=object(),
+        )
+        self.overrides.__enter__()
+        self.datastore_override = datastore_client_override(InMemoryDatastore())
+        self.datastore_override.__enter__()
+        limiter = rate_limiter.ApiLimiter("cloudresourcemanager", qps=1000, max_concurrency=10)
+        self.limiters = patch.dict(rate_limiter._limiters, {"cloudresourcemanager": limiter})
+        self.limiters.start()
+        reset_circuit_breakers()
+
+    def tearDown(self):
+        self.limiters.stop()
+        self.datastore_override.__exit__(None, None, None)
+        self.overrides.__exit__(None, None, None)
+        reset_circuit_breakers()
+
+    def _add(self, name, parent, etag="1"):
+        self.folders[f"folders/{name}"] = resourcemanager_v3.Folder(
+            name=f"folders/{name}", display_name=name.upper(), parent=parent, etag=etag,
+        )
+
+    def _refresh(self, now=NOW):
+        self.folders_client.reset_mock()
+        graph = refresh_folder_graph("1", now=now)
+        listed = sorted(call.kwargs["request"].parent for call in self.folders_client.list_folders.call_args_list)
+        return graph, listed
+
+    def _parents(self, graph):
+        return {name: folder["parent"] for name, folder in graph["folders"].items()}
+
+    def test_first_run_lists_every_folder(self):
+        """Test that without a cached graph every folder is listed, level by level, and nothing is searched."""
+        graph, listed = self._refresh()
+        self.assertEqual(listed, ["folders/a", "folders/a1", "folders/b", "folders/x", ROOT])
+        self.folders_client.search_folders.assert_not_called()
+        self.assertEqual(list(graph["folders"]), ["folders/a", "folders/b", "folders/a1", "folders/x"])
+        self.assertEqual(graph["full_refresh_at"], NOW.isoformat())
+
+    def test_unchanged_org_is_only_searched(self):
+        """Test that a run whose search matches the cached graph lists nothing."""
+        first, _ = self._refresh()
+        graph, listed = self._refresh(NOW + timedelta(hours=1))
+        self.assertEqual(listed, [])
+        self.assertEqual(self.folders_client.search_folders.call_count, 1)
+        self.assertEqual(graph["folders"], first["folders"])
+        self.assertEqual(graph["full_refresh_at"], NOW.isoformat())
+
+    def test_folder_created_deep_in_an_unchanged_subtree(self):
+        """Test that a folder created below unchanged ancestors is found and only its parent is listed."""
+        self._refresh()
+        self._add("y", "folders/a1")
+        graph, listed = self._refresh(NOW + timedelta(hours=1))
+        self.assertEqual(listed, ["folders/a1"])
+        self.assertEqual(self._parents(graph)["folders/y"], "folders/a1")
+
+    def test_moved_and_deleted_folders(self):
+        """Test that a moved folder's old and new parents are listed and a deleted folder's subtree is dropped."""
+        self._refresh()
+        self._add("x", "folders/b", etag="2")
+        del self.folders["folders/a1"]
+        self._add("orphan", "folders/a1")
+        graph, listed = self._refresh(NOW + timedelta(hours=1))
+        self.assertEqual(listed, ["folders/a", "folders/b"])
+        self.assertEqual(self._parents(graph), {"folders/a": ROOT, "folders/b": ROOT, "folders/x": "folders/b"})
+
+    def test_folders_missing_from_the_search_are_listed(self):
+        """Test that a listed folder the search does not return yet is listed with its whole subtree."""
+        self._refresh()
+        self._add("b", ROOT, etag="2")
+        self._add("new", ROOT)
+        self._add("below", "folders/new")
+        self.lagging = {"folders/new", "folders/below"}
+        graph, listed = self._refresh(NOW + timedelta(hours=1))
+        self.assertEqual(listed, ["folders/below", "folders/new", ROOT])
+        self.assertEqual(self._parents(graph)["folders/below"], "folders/new")
+
+    def test_other_orgs_folders_are_ignored(self):
+        """Test that folders of other organizations in the search results are neither kept nor listed."""
+        self._refresh()
+        self._add("elsewhere", "organizations/2")
+        self._add("under-elsewhere", "folders/elsewhere")
+        graph, listed = self._refresh(NOW + timedelta(hours=1))
+        self.assertEqual(listed, [])
+        self.assertNotIn("folders/elsewhere", graph["folders"])
+
+    def test_full_listing_when_stale_or_search_fails(self):
+        """Test that every folder is listed again once the last full listing is too old, or if the search fails."""
+        self._refresh()
+        graph, listed = self._refresh(NOW + timedelta(hours=folder_graph.FOLDER_GRAPH_MAX_AGE_HOURS + 1))
+        self.assertEqual(len(listed), 5)
+        self.assertNotEqual(graph["full_refresh_at"], NOW.isoformat())
+
+        self.folders_client.search_folders.side_effect = RuntimeError("search unavailable")
+        with patch.object(folder_graph, "FOLDER_GRAPH_MAX_AGE_HOURS", 1000):
+            _, listed = self._refresh(NOW + timedelta(hours=2))
+        self.assertEqual(len(listed), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from gcp_data_sync import datastore_client, incremental
+from gcp_data_sync.benchmark.memory_datastore import InMemoryDatastore
+from gcp_data_sync.datastore_client import DashboardDataLoader, content_hash, datastore_client_override
+from gcp_data_sync.tasks import SECTIONS
+
+NOW = datetime(2026, 1, 2, tzinfo=timezone.utc)
+
+
+def _stored(fingerprint="f", hours_ago=1, now=NOW, **section_hours_ago):
+    collected_at = {
+        section: (now - timedelta(hours=section_hours_ago.get(section, hours_ago))).isoformat() for section in SECTIONS
+    }
+    return {"sync_fingerprint": fingerprint, "sections_collected_at": collected_at}
+
+
+class TestPlanSections(unittest.TestCase):
+
+    def test_full_collection_cases(self):
+        """Test that missing data, changed inputs and a forced resync re-collect every section."""
+        self.assertEqual(incremental.plan_sections(None, "f", NOW, False), (list(SECTIONS), "no stored data"))
+        self.assertEqual(incremental.plan_sections(_stored("old"), "f", NOW, False), (list(SECTIONS), "inputs changed"))
+        self.assertEqual(incremental.plan_sections(_stored(), "f", NOW, True), (list(SECTIONS), "full resync requested"))
+
+    def test_current_data_is_kept(self):
+        """Test that unchanged data within every staleness budget is not re-collected."""
+        self.assertEqual(incremental.plan_sections(_stored(), "f", NOW, False), ([], "current"))
+
+    def test_only_stale_sections_are_collected(self):
+        """Test that only the sections past their staleness budget are re-collected."""
+        sections, reason = incremental.plan_sections(_stored(firewall_rules=7), "f", NOW, False)
+        self.assertEqual((sections, reason), (["firewall_rules"], "stale sections"))
+
+    def test_max_staleness(self):
+        """Test that data older than MAX_STALENESS_HOURS is re-collected in full."""
+        stored = _stored(hours_ago=incremental.MAX_STALENESS_HOURS + 1)
+        self.assertEqual(incremental.plan_sections(stored, "f", NOW, False), (list(SECTIONS), "max staleness exceeded"))
+
+
+class TestSyncMetadata(unittest.TestCase):
+
+    def test_metadata_is_not_hashed(self):
+        """Test that the fingerprint and collection times do not change the content hash."""
+        data = {"firewall_rules": []}
+        recorded = incremental._record_collection(dict(data), _stored(), "f2", ["firewall_rules"], NOW)
+        self.assertEqual(recorded["sections_collected_at"]["firewall_rules"], NOW.isoformat())
+        self.assertEqual(content_hash(recorded), content_hash(data))
+
+
+class TestDashboardDataLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.client = InMemoryDatastore()
+        for project_id in ("a", "b", "c"):
+            entity = self.client.entity(self.client.key(datastore_client.DATASTORE_KIND, project_id))
+            entity["project_id"] = project_id
+            self.client.put(entity)
+        self.override = datastore_client_override(self.client)
+        self.override.__enter__()
+        self.batch_size = patch.object(datastore_client, "READ_BATCH_SIZE", 2)
+        self.batch_size.start()
+
+    def tearDown(self):
+        self.batch_size.stop()
+        self.override.__exit__(None, None, None)
+
+    def test_projects_are_read_in_batches(self):
+        """Test that the stored data is read with one get_multi per batch of projects."""
+        loader = DashboardDataLoader(["a", "b", "c", "missing"])
+        rpcs = self.client.stats["rpcs"]
+        self.assertEqual(loader.get("b")["project_id"], "b")
+        self.assertEqual(loader.get("a")["project_id"], "a")
+        self.assertEqual(self.client.stats["rpcs"] - rpcs, 1)
+        self.assertIsNone(loader.get("missing"))
+        self.assertEqual(loader.get("c")["project_id"], "c")
+        self.assertEqual(self.client.stats["rpcs"] - rpcs, 2)
+
+    def test_repeated_and_unknown_projects_are_read_alone(self):
+        """Test that projects outside the list or asked for again are read on their own."""
+        loader = DashboardDataLoader(["a"])
+        self.assertEqual(loader.get("a")["project_id"], "a")
+        self.assertEqual(loader.get("a")["project_id"], "a")
+        self.assertEqual(loader.get("c")["project_id"], "c")
+
+    def test_current_project_is_not_collected(self):
+        """Test that a project with current stored data is skipped without collecting anything."""
+        entity = self.client.get(self.client.key(datastore_client.DATASTORE_KIND, "a"))
+        entity.update(_stored(now=datetime.now(timezone.utc)))
+        self.client.put(entity)
+        loader = DashboardDataLoader(["a"])
+        with patch.object(incremental, "compute_fingerprint", return_value="f"), \
+                patch.object(incremental, "collect_single_project_data") as collect:
+            result = incremental.collect_project_incrementally({"project_id": "a"}, stored_data=loader)
+        self.assertEqual(result, ("a", None, None))
+        collect.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from google.api_core import exceptions
+
+from gcp_data_sync import negative_cache
+from gcp_data_sync.benchmark.memory_datastore import InMemoryDatastore
+from gcp_data_sync.circuit_breaker import CallSkippedError, reset_circuit_breakers
+from gcp_data_sync.datastore_client import datastore_client_override
+from gcp_data_sync.negative_cache import NEGATIVE_CACHE_KIND, call_project_api
+
+
+class NegativeCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = InMemoryDatastore()
+        self.override = datastore_client_override(self.client)
+        self.override.__enter__()
+        negative_cache.reset_negative_cache()
+        reset_circuit_breakers()
+
+    def tearDown(self):
+        self.override.__exit__(None, None, None)
+        negative_cache.reset_negative_cache()
+        reset_circuit_breakers()
+
+    def _names(self):
+        query = self.client.query(kind=NEGATIVE_CACHE_KIND)
+        query.keys_only()
+        return sorted(entity.key.name for entity in query.fetch())
+
+    def _store(self, project_id, api, expires_at):
+        entity = self.client.entity(self.client.key(NEGATIVE_CACHE_KIND, f"{project_id}|{api}"), exclude_from_indexes=("error", "cached_at"))
+        entity.update({
+            "project_id": project_id, "api": api, "error_kind": "api_disabled", "error": "SERVICE_DISABLED",
+            "cached_at": datetime.now(timezone.utc).isoformat(), "expires_at": expires_at,
+        })
+        self.client.put(entity)
+
+
+class TestNegativeCache(NegativeCacheTestCase):
+
+    def _fail(self, error):
+        def func():
+            raise error
+        with self.assertRaises(type(error)):
+            call_project_api("p", "compute", func)
+
+    def test_failure_is_cached_and_skipped(self):
+        """Test that a permission error is cached and the next call is skipped without calling the API."""
+        self._fail(exceptions.PermissionDenied("denied"))
+        calls = []
+        with self.assertRaises(CallSkippedError):
+            call_project_api("p", "compute", lambda: calls.append(1))
+        self.assertEqual(calls, [])
+        self.assertEqual([entry["error_kind"] for entry in negative_cache.get_cached_failures("p")], ["permission_denied"])
+
+    def test_one_entity_per_project_and_api(self):
+        """Test that a failure of another kind replaces the project's entry for the API."""
+        self._fail(exceptions.PermissionDenied("denied"))
+        negative_cache.reset_negative_cache()
+        self._store("p", "compute", datetime.now(timezone.utc) - timedelta(seconds=1))
+        negative_cache.reset_negative_cache()
+        self._fail(exceptions.FailedPrecondition("not activated"))
+        self.assertEqual(self._names(), ["p|compute"])
+        self.assertEqual(self.client.get(self.client.key(NEGATIVE_CACHE_KIND, "p|compute"))["error_kind"], "not_activated")
+
+    def test_other_errors_are_not_cached(self):
+        """Test that errors other than disabled APIs and missing permissions are not cached."""
+        self._fail(exceptions.NotFound("missing"))
+        self.assertEqual(self._names(), [])
+
+    def test_expired_entries_are_not_loaded_and_deleted(self):
+        """Test that expired entries are filtered out by the load query and deleted."""
+        now = datetime.now(timezone.utc)
+        self._store("old", "compute", now - timedelta(hours=1))
+        self._store("p", "compute", now + timedelta(hours=1))
+        self.assertIsNone(negative_cache.get_cached_failure("old", "compute"))
+        self.assertIsNotNone(negative_cache.get_cached_failure("p", "compute"))
+        self.assertEqual(self._names(), ["p|compute"])
+
+    def test_success_deletes_entry(self):
+        """Test that a successful call deletes the project's entry for the API once it has expired."""
+        self._store("p", "compute", datetime.now(timezone.utc) + timedelta(seconds=1))
+        negative_cache.get_cached_failure("p", "compute")
+        with negative_cache._lock:
+            negative_cache._entries[("p", "compute")]["expires_at"] = datetime.now(timezone.utc).isoformat()
+        self.assertEqual(call_project_api("p", "compute", lambda: "ok"), "ok")
+        self.assertEqual(self._names(), [])
+        self.assertEqual(negative_cache.get_cached_failures("p"), [])
+
+if __name__ == '__main__':
+    unittest.main()
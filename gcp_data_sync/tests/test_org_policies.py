@@ -0,0 +1,181 @@
+import asyncio
+import json
+import unittest
+import zlib
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+from google.cloud import orgpolicy_v2
+
+from gcp_data_sync import clients, org_policies, rate_limiter, run_cache
+from gcp_data_sync.circuit_breaker import reset_circuit_breakers
+
+
+def _policy(node, constraint, enforce=None, allowed=None, inherit=False, reset=False):
+    rule = None
+    if enforce is not None:
+        rule = orgpolicy_v2.PolicySpec.PolicyRule(enforce=enforce)
+    elif allowed is not None:
+        rule = orgpolicy_v2.PolicySpec.PolicyRule(values=orgpolicy_v2.PolicySpec.PolicyRule.StringValues(allowed_values=allowed))
+    spec = orgpolicy_v2.PolicySpec(rules=[rule] if rule else [], inherit_from_parent=inherit, reset=reset)
+    return orgpolicy_v2.Policy(name=f"{node}/policies/{constraint}", spec=spec)
+
+
+def _at(*policies):
+    return {policy.name.split("/")[-1]: policy for policy in policies}
+
+
+class TestEffectivePolicyEvaluation(unittest.TestCase):
+    constraint = "gcp.resourceLocations"
+
+    def test_child_policy_replaces_parent(self):
+        """Test that a child policy without inherit_from_parent replaces its parent's rules."""
+        org = _policy("organizations/1", self.constraint, allowed=["in:eu-locations"])
+        folder = _policy("folders/2", self.constraint, allowed=["in:us-locations"])
+        rules, sources = org_policies._evaluate_effective_policy(self.constraint, [_at(org), _at(folder), {}])
+        self.assertEqual([list(r.values.allowed_values) for r in rules], [["in:us-locations"]])
+        self.assertEqual(sources, [folder])
+
+    def test_inherit_from_parent_merges_rules(self):
+        """Test that inherit_from_parent merges a policy's rules with its parent's."""
+        org = _policy("organizations/1", self.constraint, allowed=["in:eu-locations"])
+        project = _policy("projects/p", self.constraint, allowed=["in:us-locations"], inherit=True)
+        rules, sources = org_policies._evaluate_effective_policy(self.constraint, [_at(org), {}, _at(project)])
+        self.assertEqual([list(r.values.allowed_values) for r in rules], [["in:eu-locations"], ["in:us-locations"]])
+        self.assertEqual(sources, [org, project])
+
+    def test_reset_restores_default(self):
+        """Test that reset drops every rule set above it."""
+        org = _policy("organizations/1", self.constraint, enforce=True)
+        folder = _policy("folders/2", self.constraint, reset=True)
+        rules, sources = org_policies._evaluate_effective_policy(self.constraint, [_at(org), _at(folder)])
+        self.assertEqual(rules, [])
+        self.assertEqual(sources, [folder])
+
+    def test_unset_constraint(self):
+        """Test that a constraint set nowhere has no rules."""
+        self.assertEqual(org_policies._evaluate_effective_policy(self.constraint, [{}, {}]), ([], []))
+
+
+class TestPolicyDetails(unittest.TestCase):
+
+    def test_rule_summaries(self):
+        """Test that the summary lists each rule's enforcement or values and its condition."""
+        rules = [
+            orgpolicy_v2.PolicySpec.PolicyRule(enforce=True, condition={"expression": "resource.matchTag('env', 'prod')"}),
+            orgpolicy_v2.PolicySpec.PolicyRule(values={"allowed_values": ["in:eu-locations"], "denied_values": ["us-east1"]}),
+            orgpolicy_v2.PolicySpec.PolicyRule(deny_all=True),
+        ]
+        policy = orgpolicy_v2.Policy(name="projects/p/policies/c", spec=orgpolicy_v2.PolicySpec(rules=rules, inherit_from_parent=True))
+        self.assertEqual(org_policies._policy_summary(policy), {
+            "rules": [
+                {"enforce": True, "condition": "resource.matchTag('env', 'prod')"},
+                {"allowed_values": ["in:eu-locations"], "denied_values": ["us-east1"]},
+                {"deny_all": True},
+            ],
+            "inherit_from_parent": True,
+        })
+
+    def test_evaluated_policy_lists_its_sources(self):
+        """Test that an evaluated policy's summary names the nodes it was set on and their latest update."""
+        org = _policy("organizations/1", "c", enforce=True)
+        org.spec.update_time = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        folder = _policy("folders/2", "c", enforce=False, inherit=True)
+        folder.spec.update_time = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        evaluated = orgpolicy_v2.Policy(name="projects/p/policies/c")
+        summary = org_policies._policy_summary(evaluated, [org, folder])
+        self.assertEqual(summary["set_on"], ["organizations/1", "folders/2"])
+        self.assertEqual(summary["update_time"], "2026-03-01T00:00:00+00:00")
+        self.assertEqual(summary["rules"], [])
+
+    def test_payloads_are_packed_into_one_blob(self):
+        """Test that the full policies move into a compressed blob keyed by constraint."""
+        org = _policy("organizations/1", "c", enforce=True)
+        entries = [
+            org_policies._policy_result("c", _policy("projects/p", "c"), [org]),
+            org_policies._error_result("d", RuntimeError("boom")),
+        ]
+        packed, blob = org_policies.pack_policy_details(entries)
+        self.assertFalse(any("payload" in entry for entry in packed))
+        self.assertIn("payload", entries[0])
+        payloads = json.loads(zlib.decompress(blob))
+        self.assertEqual(list(payloads), ["c"])
+        self.assertEqual(payloads["c"]["sources"][0]["name"], "organizations/1/policies/c")
+        self.assertEqual(org_policies.pack_policy_details(entries[1:]), (entries[1:], None))
+
+
+class TestHierarchyEvaluation(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.policies = {
+            "organizations/1": [_policy("organizations/1", "compute.vmExternalIpAccess", enforce=True)],
+            "folders/2": [],
+            "projects/a": [],
+            "projects/b": [_policy("projects/b", "compute.vmExternalIpAccess", reset=True)],
+        }
+        self.client.list_policies.side_effect = lambda parent: list(self.policies[parent])
+        self.enforced_by_default = {"iam.managed.disableServiceAccountKeyCreation"}
+        self.client.get_effective_policy.side_effect = self._effective_policy
+        self.overrides = clients.client_overrides(factories={"orgpolicy": lambda credentials=None: self.client}, credentials=object())
+        self.overrides.__enter__()
+        limiter = rate_limiter.ApiLimiter("orgpolicy", qps=1000, max_concurrency=10)
+        self.limiters = patch.dict(rate_limiter._limiters, {"orgpolicy": limiter})
+        self.limiters.start()
+        run_cache.clear_run_cache()
+        reset_circuit_breakers()
+
+    def tearDown(self):
+        self.limiters.stop()
+        self.overrides.__exit__(None, None, None)
+        run_cache.clear_run_cache()
+
+    def _effective_policy(self, name):
+        """Evaluates a project's effective policy like the API, with the constraints' defaults."""
+        resource, constraint = name.split("/policies/")
+        nodes = ["organizations/1", "folders/2", resource]
+        rules = org_policies._evaluate_effective_rules(constraint, [_at(*self.policies[node]) for node in nodes])
+        if not rules and constraint in self.enforced_by_default:
+            rules = [orgpolicy_v2.PolicySpec.PolicyRule(enforce=True)]
+        return orgpolicy_v2.Policy(name=name, spec=orgpolicy_v2.PolicySpec(rules=rules))
+
+    def test_ancestor_policies_are_listed_once(self):
+        """Test that org and folder policies are listed once for all projects below them."""
+        ancestry = ["organizations/1", "folders/2"]
+        a = org_policies.get_all_policies_by_hierarchy("a", {"project_id": "a", "ancestry": ancestry})
+        b = org_policies.get_all_policies_by_hierarchy("b", {"project_id": "b", "ancestry": ancestry})
+        parents = [call.kwargs["parent"] for call in self.client.list_policies.call_args_list]
+        self.assertEqual(sorted(parents), ["folders/2", "organizations/1", "projects/a", "projects/b"])
+        status = lambda results: {r["name"]: r["status"] for r in results}["compute.vmExternalIpAccess"]
+        self.assertEqual((status(a), status(b)), ("Enabled", "Disabled"))
+        self.assertEqual(len(a), len(org_policies.EFFECTIVE_ORG_POLICIES_TO_CHECK))
+
+    def test_listing_failure_marks_every_constraint(self):
+        """Test that a failed listing yields an Error entry for every checked constraint."""
+        self.client.list_policies.side_effect = RuntimeError("boom")
+        results = org_policies.get_all_policies_by_hierarchy("a", {"project_id": "a", "ancestry": ["organizations/1"]})
+        self.assertEqual({r["status"] for r in results}, {"Error"})
+
+    def test_unset_constraints_use_their_default(self):
+        """Test that both evaluation modes agree on constraints enforced by default and not set anywhere."""
+        project = {"project_id": "a", "ancestry": ["organizations/1", "folders/2"]}
+        statuses = {}
+        for mode in ("hierarchy", "effective"):
+            run_cache.clear_run_cache()
+            with patch.object(org_policies, "ORG_POLICY_EVALUATION", mode):
+                results = asyncio.run(org_policies.get_all_effective_policies("a", project))
+            statuses[mode] = {r["name"]: r["status"] for r in results}
+        self.assertEqual(statuses["hierarchy"], statuses["effective"])
+        self.assertEqual(statuses["hierarchy"]["iam.managed.disableServiceAccountKeyCreation"], "Enabled")
+
+    def test_defaults_are_fetched_once_per_run(self):
+        """Test that a constraint's default is fetched for the first project that needs it only."""
+        ancestry = ["organizations/1", "folders/2"]
+        for project_id in ("a", "b"):
+            org_policies.get_all_policies_by_hierarchy(project_id, {"project_id": project_id, "ancestry": ancestry})
+        fetched = [call.kwargs["name"].split("/policies/")[1] for call in self.client.get_effective_policy.call_args_list]
+        # Project b resets compute.vmExternalIpAccess to its default, which a has from the org.
+        self.assertEqual(sorted(fetched), sorted(set(org_policies.EFFECTIVE_ORG_POLICIES_TO_CHECK)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from fastapi import HTTPException
+from google.cloud import resourcemanager_v3
+
+from gcp_data_sync import clients, projects
+from gcp_data_sync.circuit_breaker import reset_circuit_breakers
+
+
+def _project(project_id, number, parent, environment="N/A"):
+    labels = {"environment": environment} if environment != "N/A" else {}
+    return resourcemanager_v3.Project(
+        project_id=project_id, name=f"projects/{number}", parent=parent, display_name=project_id,
+        labels=labels, state=resourcemanager_v3.Project.State.ACTIVE,
+    )
+
+
+class TestProjectsInOrg(unittest.TestCase):
+
+    def setUp(self):
+        self.projects = {
+            "organizations/1": [_project("org-project", 10, "organizations/1")],
+            "folders/a": [_project("a-project", 11, "folders/a", "prod")],
+            "folders/a1": [_project("a1-project", 12, "folders/a1")],
+            "folders/b": [_project("b-project", 13, "folders/b"), _project("a-project", 11, "folders/a")],
+        }
+        self.graph = {"folders": {
+            "folders/a": {"display_name": "A", "parent": "organizations/1"},
+            "folders/b": {"display_name": "B", "parent": "organizations/1"},
+            "folders/a1": {"display_name": "A1", "parent": "folders/a"},
+        }}
+        self.projects_client = MagicMock()
+        self.projects_client.search_projects.side_effect = (
+            lambda request: list(self.projects.get(request.query.split(":", 1)[1], []))
+        )
+        self.folders_client = MagicMock()
+        self.overrides = clients.client_overrides(factories={
+            "resourcemanager.projects": lambda credentials=None: self.projects_client,
+            "resourcemanager.folders": lambda credentials=None: self.folders_client,
+        }, credentials=object())
+        self.overrides.__enter__()
+        self.patches = [
+            patch.dict("os.environ", {"ORGANIZATION_ID": "1"}),
+            patch.object(projects, "refresh_folder_graph", return_value=self.graph),
+        ]
+        for p in self.patches:
+            p.start()
+        reset_circuit_breakers()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.overrides.__exit__(None, None, None)
+        reset_circuit_breakers()
+
+    def test_projects_are_listed_depth_first_with_ancestry(self):
+        """Test that every node's projects are listed once and assembled depth first with their ancestry."""
+        results = projects.get_projects_in_org()
+        self.assertEqual([p["project_id"] for p in results], ["org-project", "a-project", "a1-project", "b-project"])
+        queries = sorted(call.kwargs["request"].query for call in self.projects_client.search_projects.call_args_list)
+        self.assertEqual(queries, ["parent:folders/a", "parent:folders/a1", "parent:folders/b", "parent:organizations/1"])
+        a1 = results[2]
+        self.assertEqual(a1["ancestry"], ["organizations/1", "folders/a", "folders/a1"])
+        self.assertEqual((a1["folder_path"], a1["folder_name"], a1["project_number"]), (["A", "A1"], "A1", "12"))
+        self.assertEqual(results[0]["folder_path"], [])
+        self.assertNotIn("folder_name", results[0])
+        self.assertEqual(results[1]["environment"], "prod")
+
+    def test_folder_name_starts_at_folder(self):
+        """Test that a folderName limits the scan to that folder's subtree."""
+        self.folders_client.search_folders.return_value = [resourcemanager_v3.Folder(name="folders/a", display_name="A")]
+        results = projects.get_projects_in_org(folderName="A")
+        self.assertEqual([p["project_id"] for p in results], ["a-project", "a1-project"])
+        self.assertEqual(results[1]["ancestry"], ["organizations/1", "folders/a", "folders/a1"])
+
+    def test_unknown_folder_name(self):
+        """Test that an unknown folderName returns no projects."""
+        self.folders_client.search_folders.return_value = []
+        self.assertEqual(projects.get_projects_in_org(folderName="missing"), [])
+
+    def test_missing_organization_id(self):
+        """Test that the scan is refused when ORGANIZATION_ID is not set."""
+        with patch.dict("os.environ", {"ORGANIZATION_ID": ""}):
+            with self.assertRaises(HTTPException) as raised:
+                projects.get_projects_in_org()
+        self.assertEqual(raised.exception.status_code, 500)
+
+if __name__ == '__main__':
+    unittest.main()
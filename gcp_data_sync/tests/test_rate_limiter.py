@@ -0,0 +1,197 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from google.api_core import exceptions
+
+from gcp_data_sync import rate_limiter
+from gcp_data_sync.circuit_breaker import reset_circuit_breakers
+from gcp_data_sync.rate_limiter import ApiLimiter, call_api, call_api_async, collect_pages, list_pages
+
+
+class FakePager:
+    """A pager over pages of items that, like the google pagers, exposes the current response as _response."""
+
+    def __init__(self, pages, on_page=None):
+        self._pages = pages
+        self._response = None
+        self.on_page = on_page
+
+    def _responses(self):
+        for index, page in enumerate(self._pages):
+            if self.on_page:
+                self.on_page()
+            yield SimpleNamespace(items=page, next_page_token=str(index + 1) if index + 1 < len(self._pages) else "")
+
+    def __iter__(self):
+        for self._response in self._responses():
+            yield from self._response.items
+
+
+class FakeAsyncPager(FakePager):
+
+    async def __aiter__(self):
+        for self._response in self._responses():
+            for item in self._response.items:
+                yield item
+
+
+class TestApiLimiter(unittest.TestCase):
+
+    def test_throttle_halves_concurrency(self):
+        """Test that each throttle halves the concurrency limit, down to a single slot."""
+        limiter = ApiLimiter("test", qps=1000, max_concurrency=8)
+        for expected in (4, 2, 1, 1):
+            limiter.acquire()
+            limiter.release(throttled=True)
+            self.assertEqual(limiter.concurrency_limit, expected)
+        self.assertEqual(limiter.snapshot()["throttles"], 4)
+
+    def test_success_grows_concurrency_up_to_max(self):
+        """Test that successes grow the limit additively and never past max_concurrency."""
+        limiter = ApiLimiter("test", qps=1000, max_concurrency=4)
+        limiter.concurrency_limit = 2.0
+        limiter.acquire()
+        limiter.release()
+        self.assertEqual(limiter.concurrency_limit, 2.5)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release()
+        self.assertEqual(limiter.concurrency_limit, 4)
+
+    def test_bucket_limits_rate(self):
+        """Test that calls past the burst wait for the bucket to refill."""
+        limiter = ApiLimiter("test", qps=1, max_concurrency=10)
+        self.assertEqual(limiter._try_acquire(), 0)
+        wait = limiter._try_acquire()
+        self.assertGreater(wait, 0.9)
+        self.assertLessEqual(wait, 1)
+
+    def test_full_concurrency_blocks(self):
+        """Test that no slot is handed out while every slot is in flight."""
+        limiter = ApiLimiter("test", qps=1000, max_concurrency=1)
+        limiter.acquire()
+        self.assertIsNone(limiter._try_acquire())
+        limiter.release()
+        self.assertEqual(limiter._try_acquire(), 0)
+
+    def test_async_waiter_is_woken_by_release(self):
+        """Test that acquire_async waits for a slot without polling and is woken as soon as it is released."""
+        limiter = ApiLimiter("test", qps=1000, max_concurrency=1)
+
+        async def scenario():
+            await limiter.acquire_async()
+            waiter = asyncio.ensure_future(limiter.acquire_async())
+            await asyncio.sleep(0.05)
+            self.assertFalse(waiter.done())
+            self.assertEqual(len(limiter._async_waiters), 1)
+            limiter.release()
+            await asyncio.wait_for(waiter, 1)
+
+        asyncio.run(scenario())
+        self.assertEqual((limiter.in_flight, limiter._async_waiters), (1, []))
+
+    def test_async_waiter_is_woken_from_another_thread(self):
+        """Test that a release on a worker thread wakes a task waiting on the event loop."""
+        limiter = ApiLimiter("test", qps=1000, max_concurrency=1)
+
+        async def scenario():
+            await limiter.acquire_async()
+            waiter = asyncio.ensure_future(limiter.acquire_async())
+            await asyncio.sleep(0)
+            await asyncio.to_thread(limiter.release)
+            await asyncio.wait_for(waiter, 1)
+
+        asyncio.run(scenario())
+        self.assertEqual(limiter.in_flight, 1)
+
+
+class TestCallApi(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = ApiLimiter("testapi", qps=1000, max_concurrency=4)
+        self.limiters = patch.dict(rate_limiter._limiters, {"testapi": self.limiter})
+        self.limiters.start()
+        self.backoff = patch.object(rate_limiter, "BACKOFF_BASE_SECONDS", 0)
+        self.backoff.start()
+        reset_circuit_breakers()
+
+    def tearDown(self):
+        self.backoff.stop()
+        self.limiters.stop()
+        reset_circuit_breakers()
+
+    def test_quota_errors_are_retried(self):
+        """Test that quota errors are retried and shrink the concurrency limit."""
+        outcomes = [exceptions.TooManyRequests("slow down"), exceptions.ResourceExhausted("quota"), "ok"]
+
+        def func():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(call_api("testapi", func), "ok")
+        stats = self.limiter.snapshot()
+        self.assertEqual((stats["calls"], stats["retries"], stats["throttles"]), (3, 2, 2))
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_other_errors_are_raised(self):
+        """Test that non-quota errors are raised without a retry."""
+        def func():
+            raise exceptions.NotFound("missing")
+
+        with self.assertRaises(exceptions.NotFound):
+            call_api("testapi", func)
+        stats = self.limiter.snapshot()
+        self.assertEqual((stats["calls"], stats["retries"], stats["failures"]), (1, 0, 1))
+
+    def test_every_page_takes_a_token(self):
+        """Test that a listing under call_api takes a token for each page after the first."""
+        self.limiter.qps = 1e-6
+        self.limiter.capacity = self.limiter.tokens = 5
+        pager = FakePager([[1, 2], [3], [4, 5]])
+        self.assertEqual(call_api("testapi", lambda: list_pages(pager)), [1, 2, 3, 4, 5])
+        self.assertEqual(self.limiter.snapshot()["pages"], 2)
+        self.assertAlmostEqual(self.limiter.tokens, 2, places=3)
+
+    def test_pages_wait_for_the_bucket(self):
+        """Test that the request for a further page waits while the bucket is empty."""
+        self.limiter.qps = 20
+        self.limiter.capacity = self.limiter.tokens = 1
+        fetched = []
+        pager = FakePager([[1], [2], [3]], on_page=lambda: fetched.append(rate_limiter.time.monotonic()))
+        call_api("testapi", lambda: list_pages(pager))
+        self.assertGreaterEqual(fetched[-1] - fetched[0], 0.09)
+
+    def test_pages_outside_call_api_take_no_token(self):
+        """Test that list_pages leaves limiters alone when it is not run through call_api."""
+        self.assertEqual(list_pages(FakePager([[1], [2]])), [1, 2])
+        self.assertEqual(self.limiter.snapshot()["pages"], 0)
+
+    def test_cancelled_call_releases_its_slot(self):
+        """Test that a call cancelled while awaiting its API call gives its concurrency slot back."""
+        async def hang():
+            await asyncio.sleep(10)
+
+        async def scenario():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(call_api_async("testapi", hang), 0.01)
+
+        asyncio.run(scenario())
+        stats = self.limiter.snapshot()
+        self.assertEqual((stats["in_flight"], stats["calls"]), (0, 1))
+        self.assertIsNone(rate_limiter._current_limiter.get())
+
+    def test_async_pages_take_tokens(self):
+        """Test that collect_pages under call_api_async takes a token for each page after the first."""
+        async def listing():
+            return FakeAsyncPager([[1], [2], [3]])
+
+        items = asyncio.run(call_api_async("testapi", lambda: collect_pages(listing())))
+        self.assertEqual(items, [1, 2, 3])
+        self.assertEqual(self.limiter.snapshot()["pages"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+from gcp_data_sync import rollups
+from gcp_data_sync.benchmark.memory_datastore import InMemoryDatastore
+from gcp_data_sync.datastore_client import DATASTORE_KIND, datastore_client_override
+from gcp_data_sync.rollups import FIREWALL_CONTROL, build_rollup, control_statuses, update_compliance_rollups
+
+PROJECTS = [
+    {"project_id": "a", "environment": "prod", "ancestry": ["organizations/1", "folders/10", "folders/11"],
+     "folder_path": ["Top", "Team"]},
+    {"project_id": "b", "environment": "prod", "ancestry": ["organizations/1", "folders/10"], "folder_path": ["Top"]},
+    {"project_id": "c", "ancestry": ["organizations/1"]},
+]
+
+
+def _counts(rollup, group):
+    """Expands a group's flat counts to {control: {status: count}}, without zero counts."""
+    statuses = rollup["statuses"]
+    return {
+        control: {status: count for status, count in zip(statuses, group["counts"][c * len(statuses):(c + 1) * len(statuses)]) if count}
+        for c, control in enumerate(rollup["controls"])
+    }
+
+
+class TestControlStatuses(unittest.TestCase):
+
+    def test_sections(self):
+        """Test that every section's entries become controls, with Unknown for a missing status."""
+        statuses = control_statuses({
+            "org_policies": [{"name": "compute.vmExternalIpAccess", "status": "Enabled"}, "not an entry", {"status": "Error"}],
+            "sha_modules": [{"name": "Public Bucket Acl", "status": "Disabled"}],
+            "security_services": [{"name": "Event Threat Detection"}],
+            "vpc_sc_status": {"name": "VPC Service Controls", "status": "Enabled"},
+        })
+        self.assertEqual(statuses, {
+            "org_policies/compute.vmExternalIpAccess": "Enabled",
+            "sha_modules/Public Bucket Acl": "Disabled",
+            "security_services/Event Threat Detection": "Unknown",
+            "vpc_sc_status/VPC Service Controls": "Enabled",
+        })
+
+    def test_firewall_rules_are_one_control(self):
+        """Test that a project's firewall rules count as one control: Skipped, Enabled if any rule is, else Disabled."""
+        for rules, expected in (
+            ([{"status": "Disabled"}, {"status": "Enabled"}], "Enabled"),
+            ([], "Disabled"),
+            ([{"status": "Enabled"}, {"status": "Skipped"}], "Skipped"),
+        ):
+            with self.subTest(rules=rules):
+                self.assertEqual(control_statuses({"firewall_rules": rules}), {FIREWALL_CONTROL: expected})
+        self.assertEqual(control_statuses({"firewall_rules": None}), {})
+
+
+class TestBuildRollup(unittest.TestCase):
+
+    def test_counts_per_group(self):
+        """Test that projects are counted in the totals, in every folder above them and in their environment."""
+        statuses = {
+            "a": {"org_policies/x": "Enabled", FIREWALL_CONTROL: "Disabled"},
+            "b": {"org_policies/x": "Disabled"},
+            "c": {"org_policies/x": "Enabled"},
+        }
+        rollup = build_rollup("1", PROJECTS, statuses)
+        self.assertEqual((rollup["projects"], rollup["projects_without_data"]), (3, 0))
+        self.assertEqual(rollup["controls"], [FIREWALL_CONTROL, "org_policies/x"])
+        self.assertEqual(rollup["statuses"], ["Disabled", "Enabled"])
+        self.assertEqual(_counts(rollup, rollup["totals"]), {
+            FIREWALL_CONTROL: {"Disabled": 1}, "org_policies/x": {"Enabled": 2, "Disabled": 1},
+        })
+        self.assertEqual({name: (f["display_name"], f["projects"]) for name, f in rollup["folders"].items()},
+                         {"folders/10": ("Top", 2), "folders/11": ("Team", 1)})
+        self.assertEqual(_counts(rollup, rollup["folders"]["folders/11"])["org_policies/x"], {"Enabled": 1})
+        self.assertEqual({env: group["projects"] for env, group in rollup["environments"].items()}, {"prod": 2, "N/A": 1})
+
+    def test_projects_without_statuses(self):
+        """Test that projects without statuses are reported but not counted."""
+        rollup = build_rollup("1", PROJECTS, {"a": {"org_policies/x": "Enabled"}, "b": {}})
+        self.assertEqual((rollup["projects"], rollup["projects_without_data"]), (1, 2))
+        self.assertEqual(rollup["totals"]["counts"], [1])
+        self.assertEqual(build_rollup("1", PROJECTS, {})["totals"], {"projects": 0, "counts": []})
+
+
+class TestUpdateComplianceRollups(unittest.TestCase):
+
+    def setUp(self):
+        self.client = InMemoryDatastore()
+        self.override = datastore_client_override(self.client)
+        self.override.__enter__()
+
+    def tearDown(self):
+        self.override.__exit__(None, None, None)
+
+    def test_shards_contribute_their_stored_states(self):
+        """Test that the rollup counts other shards' stored states and reads uncollected projects' dashboard data."""
+        update_compliance_rollups("1", PROJECTS, PROJECTS[:1], {"a": {"org_policies/x": "Enabled"}}, index=0, count=2)
+        entity = self.client.entity(self.client.key(DATASTORE_KIND, "c"))
+        entity.update({"org_policies": [{"name": "x", "status": "Disabled"}]})
+        self.client.put(entity)
+
+        rollup = update_compliance_rollups("1", PROJECTS, PROJECTS[1:], {"b": {"org_policies/x": "Enabled"}}, index=1, count=2)
+        self.assertEqual(rollup["projects"], 3)
+        self.assertEqual(_counts(rollup, rollup["totals"]), {"org_policies/x": {"Enabled": 2, "Disabled": 1}})
+        self.assertEqual(rollups._load_json_blob(rollups.ROLLUP_KIND, "1", self.client)["projects"], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+
+from gcp_data_sync import run_cache
+from gcp_data_sync.run_cache import memoize_call, memoize_call_async
+
+
+class TestRunCache(unittest.TestCase):
+
+    def setUp(self):
+        run_cache.clear_run_cache()
+
+    def tearDown(self):
+        run_cache.clear_run_cache()
+
+    def test_results_and_failures_are_memoized(self):
+        """Test that a key is fetched once and that its failure is raised to every caller."""
+        calls = []
+        self.assertEqual(memoize_call("m", "p", lambda: calls.append(1) or "value"), "value")
+        self.assertEqual(memoize_call("m", "p", lambda: calls.append(1) or "other"), "value")
+
+        def fail():
+            calls.append(1)
+            raise ValueError("boom")
+
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                memoize_call("m", "q", fail)
+        self.assertEqual(len(calls), 2)
+
+    def test_concurrent_async_callers_share_one_fetch(self):
+        """Test that callers awaiting a key that is being fetched get the owner's result."""
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        async def scenario():
+            return await asyncio.gather(*(memoize_call_async("m", "p", fetch) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(scenario()), ["value"] * 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_cancelled_owner_is_not_memoized(self):
+        """Test that when the owner's fetch is cancelled its waiters fetch again instead of getting None."""
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+            return "value"
+
+        async def scenario():
+            owner = asyncio.ensure_future(memoize_call_async("m", "p", fetch))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(memoize_call_async("m", "p", fetch))
+            await asyncio.sleep(0)
+            owner.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await owner
+            return await waiter, await memoize_call_async("m", "p", fetch)
+
+        self.assertEqual(asyncio.run(scenario()), ("value", "value"))
+        self.assertEqual(len(calls), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+
+from gcp_data_sync.benchmark.memory_datastore import InMemoryDatastore
+from gcp_data_sync.datastore_client import datastore_client_override
+from gcp_data_sync.run_journal import JOURNAL_KIND, DatastoreJournalStore, FileJournalStore, RunJournal
+
+PROJECTS = [{"project_id": "a"}, {"project_id": "b"}, {"project_id": "c"}]
+
+
+class FailingManifestDatastore(InMemoryDatastore):
+    """An in-memory Datastore whose single-entity writes (the blob manifests) fail while fail_manifests is set."""
+
+    fail_manifests = False
+
+    def put(self, entity):
+        if self.fail_manifests:
+            raise RuntimeError("interrupted")
+        super().put(entity)
+
+
+class TestRunJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FailingManifestDatastore()
+        self.override = datastore_client_override(self.client)
+        self.override.__enter__()
+        self.store = DatastoreJournalStore()
+
+    def tearDown(self):
+        self.override.__exit__(None, None, None)
+
+    def _names(self):
+        query = self.client.query(kind=JOURNAL_KIND)
+        query.keys_only()
+        return [entity.key.name for entity in query.fetch()]
+
+    def test_unfinished_run_is_resumed(self):
+        """Test that a run that did not finish is resumed with its failed and unprocessed projects."""
+        journal = RunJournal("shard-0-of-1", self.store)
+        self.assertEqual(journal.resume_or_start("run-1", PROJECTS), PROJECTS)
+        journal.mark("a")
+        journal.mark("b", "boom")
+        journal.checkpoint()
+
+        resumed = RunJournal("shard-0-of-1", self.store)
+        self.assertEqual(resumed.resume_or_start("run-2", PROJECTS[:1]), PROJECTS[1:])
+        self.assertEqual((resumed.state["run_id"], resumed.state["resumed_by"]), ("run-1", "run-2"))
+
+    def test_write_failures_are_retried(self):
+        """Test that projects whose data could not be written are not checkpointed as done."""
+        journal = RunJournal("shard-0-of-1", self.store)
+        journal.resume_or_start("run-1", PROJECTS)
+        for project in PROJECTS:
+            journal.mark(project["project_id"])
+        journal.checkpoint({"c": "too large"})
+        self.assertEqual(RunJournal("shard-0-of-1", self.store).resume_or_start("run-2", PROJECTS), PROJECTS[2:])
+
+    def test_finished_run_starts_afresh(self):
+        """Test that the run after a finished one starts from its own project list."""
+        journal = RunJournal("shard-0-of-1", self.store)
+        journal.resume_or_start("run-1", PROJECTS)
+        journal.finish()
+        self.assertEqual(RunJournal("shard-0-of-1", self.store).resume_or_start("run-2", PROJECTS[:1]), PROJECTS[:1])
+
+    def test_interrupted_save_keeps_previous_checkpoint(self):
+        """Test that a save interrupted before its manifest is switched leaves the previous checkpoint readable."""
+        journal = RunJournal("shard-0-of-1", self.store)
+        journal.resume_or_start("run-1", PROJECTS)
+        journal.mark("a")
+        journal.checkpoint()
+        journal.mark("b")
+        self.client.fail_manifests = True
+        with self.assertRaises(RuntimeError):
+            journal.checkpoint()
+        self.client.fail_manifests = False
+        self.assertEqual(self.store.load("shard-0-of-1")["results"], {"a": {"status": "done"}})
+
+    def test_previous_chunks_are_deleted(self):
+        """Test that a save deletes the chunks of the generation it replaces."""
+        journal = RunJournal("shard-0-of-1", self.store)
+        journal.resume_or_start("run-1", PROJECTS)
+        journal.mark("a")
+        journal.checkpoint()
+        self.assertEqual(len(self._names()), 2)
+
+    def test_unreadable_journal_is_deleted(self):
+        """Test that a journal missing its chunks is treated as missing and deleted."""
+        RunJournal("shard-0-of-1", self.store).resume_or_start("run-1", PROJECTS)
+        chunk = next(name for name in self._names() if ":" in name)
+        self.client.delete(self.client.key(JOURNAL_KIND, chunk))
+        self.assertIsNone(self.store.load("shard-0-of-1"))
+        self.assertEqual(self._names(), [])
+        self.assertEqual(RunJournal("shard-0-of-1", self.store).resume_or_start("run-2", PROJECTS[:1]), PROJECTS[:1])
+
+
+class TestFileJournalStore(unittest.TestCase):
+
+    def test_unreadable_file_is_deleted(self):
+        """Test that a corrupt journal file is treated as missing and deleted."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "journal.json")
+            with open(path, "w") as f:
+                f.write('{"shard-0-of-1": {"status": "runn')
+            self.assertIsNone(FileJournalStore(path).load("shard-0-of-1"))
+            self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+    unittest.main()
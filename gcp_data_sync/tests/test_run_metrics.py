@@ -0,0 +1,87 @@
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from gcp_data_sync import run_metrics
+from gcp_data_sync.benchmark.memory_datastore import InMemoryDatastore
+from gcp_data_sync.run_metrics import (
+    RUN_REPORT_KIND, build_run_report, get_run_metrics, note_page, payload_size, percentiles, reset_run_metrics,
+    save_run_report, timed_stage, track_api_call,
+)
+
+
+class TestSummaries(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        """Test that percentiles use the nearest rank of the sorted values."""
+        stats = percentiles([i / 10 for i in range(100, 0, -1)])
+        self.assertEqual(stats, {"count": 100, "p50": 5.0, "p95": 9.5, "p99": 9.9, "max": 10.0, "total": 505.0})
+
+    def test_single_and_no_values(self):
+        """Test that one value is every percentile and that no values only report a count."""
+        self.assertEqual(percentiles([0.1234])["p50"], 0.123)
+        self.assertEqual(percentiles([0.1234])["p99"], 0.123)
+        self.assertEqual(percentiles([]), {"count": 0})
+
+    def test_payload_size(self):
+        """Test that dicts are measured as JSON, lists summed and unknown objects counted as empty."""
+        self.assertEqual(payload_size({"a": 1}), len('{"a": 1}'))
+        self.assertEqual(payload_size([{"a": 1}, {"a": 1}]), 2 * len('{"a": 1}'))
+        self.assertEqual(payload_size(object()), 0)
+
+
+class TestRunMetrics(unittest.TestCase):
+
+    def setUp(self):
+        reset_run_metrics()
+
+    def tearDown(self):
+        reset_run_metrics()
+
+    def test_api_calls_count_rpcs_pages_and_failures(self):
+        """Test that a tracked call records its retries and pages, and a failing one its failure."""
+        with track_api_call("compute") as call:
+            call["rpcs"] = 2
+            note_page()
+            note_page()
+            call["result"] = {"a": 1}
+        with self.assertRaises(ValueError):
+            with track_api_call("compute") as call:
+                call["rpcs"] = 1
+                raise ValueError("boom")
+        note_page()
+
+        api = get_run_metrics().snapshot()["apis"]["compute"]
+        self.assertEqual((api["calls"], api["rpcs"], api["retries"], api["pages"]), (2, 3, 1, 3))
+        self.assertEqual((api["failures"], api["payload_bytes"], api["count"]), (1, len('{"a": 1}'), 2))
+
+    def test_report(self):
+        """Test that the report has the run's throughput, stages, slowest projects and capped failures."""
+        with timed_stage("collect"):
+            pass
+        metrics = get_run_metrics()
+        for index in range(5):
+            metrics.record_project(f"p{index}", index)
+        metrics.record_collector("firewall", 0.5, failed=True)
+        started = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        failed = [{"project_id": f"f{index}"} for index in range(3)]
+        with patch.object(run_metrics, "SLOWEST_PROJECTS_IN_REPORT", 2), patch.object(run_metrics, "FAILURES_IN_REPORT", 2):
+            report = build_run_report("run-1", started, started + timedelta(minutes=2), {"successful": 7}, failed)
+
+        self.assertEqual((report["duration_seconds"], report["throughput_per_minute"]), (120.0, 5.0))
+        self.assertIn("collect", report["stages"])
+        self.assertEqual([p["project_id"] for p in report["slowest_projects"]], ["p4", "p3"])
+        self.assertEqual(report["collectors"]["firewall"]["errors"], 1)
+        self.assertEqual((report["failed_count"], len(report["failed"])), (3, 2))
+
+    def test_save_run_report(self):
+        """Test that a report is stored as JSON with its run id and start time indexed."""
+        client = InMemoryDatastore()
+        save_run_report("run-1", {"run_id": "run-1", "started_at": "2026-01-01T00:00:00", "successful": 1}, client=client)
+        entity = client.get(client.key(RUN_REPORT_KIND, "run-1"))
+        self.assertEqual((entity["run_id"], entity["started_at"]), ("run-1", "2026-01-01T00:00:00"))
+        self.assertEqual(json.loads(entity["report"])["successful"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from google.api_core import exceptions
+
+from gcp_data_sync import clients, negative_cache, run_cache, tasks
+from gcp_data_sync.benchmark.memory_datastore import InMemoryDatastore
+from gcp_data_sync.circuit_breaker import reset_circuit_breakers
+from gcp_data_sync.datastore_client import datastore_client_override
+from gcp_data_sync.scc_services import get_security_center_services
+from gcp_data_sync.sha_modules import get_sha_modules
+
+
+def _state(name):
+    return SimpleNamespace(name=name)
+
+
+def _service(service_id, state, modules=None):
+    return SimpleNamespace(
+        name=f"projects/p/locations/global/securityCenterServices/{service_id}",
+        effective_enablement_state=_state(state),
+        modules={name: SimpleNamespace(effective_enablement_state=_state(s)) for name, s in (modules or {}).items()},
+    )
+
+
+class SccTestCase(unittest.TestCase):
+    """Runs the collectors against a mock Security Center client and an in-memory Datastore."""
+
+    def setUp(self):
+        self.scc_client = MagicMock()
+        self.overrides = clients.client_overrides(
+            factories={"securitycentermanagement": lambda credentials=None: self.scc_client}, credentials=object(),
+        )
+        self.overrides.__enter__()
+        self.datastore = InMemoryDatastore()
+        self.datastore_override = datastore_client_override(self.datastore)
+        self.datastore_override.__enter__()
+        run_cache.clear_run_cache()
+        negative_cache.reset_negative_cache()
+        reset_circuit_breakers()
+
+    def tearDown(self):
+        self.datastore_override.__exit__(None, None, None)
+        self.overrides.__exit__(None, None, None)
+        run_cache.clear_run_cache()
+        negative_cache.reset_negative_cache()
+        reset_circuit_breakers()
+
+
+class TestSharedServicesListing(SccTestCase):
+
+    def test_sha_and_scc_share_one_listing(self):
+        """Test that the SHA and SCC collectors of a project list the services only once."""
+        self.scc_client.list_security_center_services.return_value = [
+            _service("SECURITY_HEALTH_ANALYTICS", "ENABLED", {"PUBLIC_BUCKET_ACL": "ENABLED"}),
+            _service("event-threat-detection", "DISABLED"),
+        ]
+        services = get_security_center_services("p")
+        sha = get_sha_modules("p")
+        self.assertEqual(self.scc_client.list_security_center_services.call_count, 1)
+        self.assertEqual([(s["name"], s["status"]) for s in services], [("Event Threat Detection", "Disabled")])
+        self.assertEqual(sha["status"], "Enabled")
+        self.assertEqual([(m["name"], m["status"]) for m in sha["modules"]], [("Public Bucket Acl", "Enabled")])
+
+
+class TestServicesErrors(SccTestCase):
+
+    def test_permission_denied_yields_error_rows(self):
+        """Test that a failed listing yields Error rows the project's data can be built from."""
+        self.scc_client.list_security_center_services.side_effect = exceptions.PermissionDenied("denied")
+        services = get_security_center_services("p")
+        sha = get_sha_modules("p")
+        self.assertEqual([(s["name"], s["status"]) for s in services], [("Security Center Services", "Error")])
+        self.assertIn("Permission Denied", services[0]["details"])
+        self.assertEqual((sha["status"], [m["status"] for m in sha["modules"]]), ("Error", ["Error"]))
+        self.assertEqual(tasks._build_sha_modules([], sha), sha["modules"])
+        self.assertEqual(tasks._build_security_services(services), services)
+
+    def test_negative_cached_project_is_skipped(self):
+        """Test that a project whose permission error was cached by an earlier run yields Skipped rows without listing."""
+        self.scc_client.list_security_center_services.side_effect = exceptions.PermissionDenied("denied")
+        get_security_center_services("p")
+        run_cache.clear_run_cache()
+        negative_cache.reset_negative_cache()
+        self.scc_client.list_security_center_services.reset_mock()
+
+        services = get_security_center_services("p")
+        sha = get_sha_modules("p")
+        self.scc_client.list_security_center_services.assert_not_called()
+        self.assertEqual([s["status"] for s in services], ["Skipped"])
+        self.assertEqual((sha["status"], [m["status"] for m in sha["modules"]]), ("Skipped", ["Skipped"]))
+        self.assertEqual(tasks._build_security_services(services), services)
+
+if __name__ == '__main__':
+    unittest.main()
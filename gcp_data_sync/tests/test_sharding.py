@@ -0,0 +1,118 @@
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from gcp_data_sync import clients, run_cache, sharding
+from gcp_data_sync.benchmark.memory_datastore import InMemoryDatastore
+from gcp_data_sync.circuit_breaker import reset_circuit_breakers
+from gcp_data_sync.datastore_client import datastore_client_override, save_chunked_blob
+from gcp_data_sync.run_metrics import RUN_REPORT_KIND
+
+
+class TestShardAssignment(unittest.TestCase):
+
+    def test_shards_partition_projects(self):
+        """Test that every project lands in exactly one shard, the same one every time."""
+        projects = [{"project_id": f"project-{i}"} for i in range(200)]
+        shards = [sharding.select_shard(projects, index, 4) for index in range(4)]
+        self.assertEqual(sorted(p["project_id"] for shard in shards for p in shard), sorted(p["project_id"] for p in projects))
+        self.assertTrue(all(shards))
+        self.assertEqual(sharding.shard_for("project-7", 4), sharding.shard_for("project-7", 4))
+
+
+class TestAggregateReports(unittest.TestCase):
+
+    def test_reports_are_merged(self):
+        """Test that counters are summed, stages and latencies take the slowest shard and lists are joined."""
+        reports = [
+            {"successful": 3, "failed": [{"project_id": "a"}], "duration_seconds": 10, "started_at": "2026-01-01T00:00:05",
+             "stages": {"collect": 8}, "collectors": {"firewall": {"count": 3, "p95": 1.5}},
+             "slowest_projects": [{"project_id": "x", "seconds": 2}]},
+            {"successful": 4, "failed": [], "duration_seconds": 12, "started_at": "2026-01-01T00:00:00",
+             "stages": {"collect": 9}, "collectors": {"firewall": {"count": 4, "p95": 0.5}},
+             "slowest_projects": [{"project_id": "y", "seconds": 5}]},
+        ]
+        merged = sharding.aggregate_reports(reports)
+        self.assertEqual((merged["shards"], merged["successful"], merged["failed"]), (2, 7, [{"project_id": "a"}]))
+        self.assertEqual((merged["duration_seconds"], merged["started_at"]), (12, "2026-01-01T00:00:00"))
+        self.assertEqual(merged["stages"], {"collect": 9})
+        self.assertEqual(merged["collectors"]["firewall"], {"count": 7, "p95": 1.5})
+        self.assertEqual([p["project_id"] for p in merged["slowest_projects"]], ["y", "x"])
+
+
+class TestShardReports(unittest.TestCase):
+
+    def setUp(self):
+        self.client = InMemoryDatastore()
+        self.override = datastore_client_override(self.client)
+        self.override.__enter__()
+
+    def tearDown(self):
+        self.override.__exit__(None, None, None)
+
+    def _names(self, kind):
+        query = self.client.query(kind=kind)
+        query.keys_only()
+        return sorted(entity.key.name for entity in query.fetch())
+
+    def test_last_report_merges_and_cleans_up(self):
+        """Test that the last shard to report merges the reports and deletes the run's shared state and reports."""
+        save_chunked_blob(sharding.SHARED_STATE_KIND, "run-1", b"state")
+        self.assertIsNone(sharding.save_shard_report({"successful": 1, "failed": []}, "run-1", 0, 2))
+        merged = sharding.save_shard_report({"successful": 2, "failed": []}, "run-1", 1, 2)
+        self.assertEqual(merged["successful"], 3)
+        self.assertEqual(json.loads(self.client.get(self.client.key(RUN_REPORT_KIND, "run-1"))["report"])["successful"], 3)
+        self.assertEqual(self._names(sharding.SHARED_STATE_KIND), [])
+        self.assertEqual(self._names(sharding.SHARD_REPORT_KIND), [])
+
+    def test_only_stale_runs_of_other_executions_are_deleted(self):
+        """Test that other executions' state is deleted once it is older than STALE_RUN_STATE_HOURS."""
+        save_chunked_blob(sharding.SHARED_STATE_KIND, "old", b"state")
+        save_chunked_blob(sharding.SHARED_STATE_KIND, "running", b"state")
+        sharding.save_shard_report({"successful": 1}, "old", 0, 2)
+        sharding.save_shard_report({"successful": 1}, "running", 0, 2)
+        later = datetime.now(timezone.utc) + timedelta(hours=sharding.STALE_RUN_STATE_HOURS)
+        manifest = self.client.get(self.client.key(sharding.SHARED_STATE_KIND, "running"))
+        manifest["saved_at"] = later
+        self.client.put(manifest)
+        report = self.client.get(self.client.key(sharding.SHARD_REPORT_KIND, "running:0"))
+        report["reported_at"] = later
+        self.client.put(report)
+
+        sharding.delete_run_state("current", 1, now=later + timedelta(minutes=1))
+        state_names = self._names(sharding.SHARED_STATE_KIND)
+        self.assertEqual((len(state_names), {name.split(":")[0] for name in state_names}), (2, {"running"}))
+        self.assertEqual(self._names(sharding.SHARD_REPORT_KIND), ["running:0"])
+
+
+class TestBuildOrgState(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.client.list_policies.return_value = []
+        self.overrides = clients.client_overrides(factories={"orgpolicy": lambda credentials=None: self.client}, credentials=object())
+        self.overrides.__enter__()
+        run_cache.clear_run_cache()
+        reset_circuit_breakers()
+        self.perimeters = patch.object(sharding, "build_perimeter_index", return_value={"has_access_policy": False, "resources": {}})
+        self.perimeters.start()
+
+    def tearDown(self):
+        self.perimeters.stop()
+        self.overrides.__exit__(None, None, None)
+        run_cache.clear_run_cache()
+
+    def test_every_ancestor_is_listed_once(self):
+        """Test that the policies of every org and folder in the projects' ancestry are listed once."""
+        projects = [
+            {"project_id": "a", "ancestry": ["organizations/1", "folders/2"]},
+            {"project_id": "b", "ancestry": ["organizations/1", "folders/3"]},
+        ]
+        state = sharding.build_org_state(projects)
+        parents = sorted(call.kwargs["parent"] for call in self.client.list_policies.call_args_list)
+        self.assertEqual(parents, ["folders/2", "folders/3", "organizations/1"])
+        self.assertEqual(sorted(state["ancestor_policies"]), ["folders/2", "folders/3", "organizations/1"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import MagicMock
+
+from gcp_data_sync import clients, vpc_sc
+
+
+def _acm_client(access_policies, perimeters):
+    """A fake discovery client listing access_policies and, per policy name, its perimeters (one page each)."""
+    client = MagicMock()
+    policies = client.accessPolicies.return_value
+    policies.list.return_value.execute.return_value = {"accessPolicies": access_policies}
+    policies.list_next.return_value = None
+    perimeters_api = policies.servicePerimeters.return_value
+
+    def list_perimeters(parent):
+        request = MagicMock()
+        request.execute.return_value = {"servicePerimeters": perimeters.get(parent, [])}
+        return request
+
+    perimeters_api.list.side_effect = list_perimeters
+    perimeters_api.list_next.return_value = None
+    return client
+
+
+class TestPerimeterIndex(unittest.TestCase):
+
+    def setUp(self):
+        vpc_sc.reset_perimeter_index()
+        self.built = []
+
+    def tearDown(self):
+        vpc_sc.reset_perimeter_index()
+
+    def _override(self, client):
+        def factory(credentials=None):
+            self.built.append(client)
+            return client
+        return clients.client_overrides(access_context_manager=factory, credentials=object())
+
+    def test_index_is_built_once_per_run(self):
+        """Test that every project check of a run shares one perimeter listing."""
+        client = _acm_client([{"name": "accessPolicies/1"}], {"accessPolicies/1": [
+            {"name": "p/enforced", "title": "Enforced", "status": {"resources": ["projects/111"]}},
+            {"name": "p/dry", "title": "Dry", "spec": {"resources": ["projects/222"]}},
+        ]})
+        with self._override(client):
+            enforced = vpc_sc.get_vpc_sc_status("a", "111")
+            dry_run = vpc_sc.get_vpc_sc_status("b", "222")
+            outside = vpc_sc.get_vpc_sc_status("c", "333")
+        self.assertEqual(client.accessPolicies.return_value.list.call_count, 1)
+        self.assertEqual((enforced["status"], enforced["details"]), ("Enabled", "Project is protected by perimeter: Enforced"))
+        self.assertEqual(dry_run["status"], "Disabled")
+        self.assertIn("dry-run", dry_run["details"])
+        self.assertEqual(outside["status"], "Disabled")
+
+    def test_no_access_policy(self):
+        """Test that projects are reported as unprotected when the org has no access policy."""
+        with self._override(_acm_client([], {})):
+            result = vpc_sc.get_vpc_sc_status("a", "111")
+        self.assertEqual((result["status"], result["details"]), ("Disabled", "No Access Policy found for the organization."))
+
+    def test_seeded_index_is_not_rebuilt(self):
+        """Test that an index installed from the shared org state is used as is."""
+        vpc_sc.reset_perimeter_index({"has_access_policy": True, "resources": {
+            "projects/111": [{"name": "p", "title": "Shared", "dry_run": False}],
+        }})
+        with self._override(_acm_client([], {})):
+            result = vpc_sc.get_vpc_sc_status("a", "111")
+        self.assertEqual(result["status"], "Enabled")
+        self.assertEqual(self.built, [])
+
+    def test_failed_build_is_not_retried_until_reset(self):
+        """Test that a failed index build is reported for every project of the run and retried after a reset."""
+        client = _acm_client([], {})
+        client.accessPolicies.return_value.list.return_value.execute.side_effect = RuntimeError("acm unavailable")
+        with self._override(client):
+            results = [vpc_sc.get_vpc_sc_status(project, "111") for project in ("a", "b")]
+            self.assertEqual([(r["status"], r["details"]) for r in results], [("Error", "acm unavailable")] * 2)
+            self.assertEqual(client.accessPolicies.return_value.list.call_count, 1)
+
+            vpc_sc.reset_perimeter_index()
+            client.accessPolicies.return_value.list.return_value.execute.side_effect = None
+            self.assertEqual(vpc_sc.get_vpc_sc_status("a", "111")["status"], "Disabled")
+
+if __name__ == '__main__':
+    unittest.main()
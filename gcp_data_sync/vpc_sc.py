@@ -1,6 +1,8 @@
 # This file will contain the logic for fetching VPC Service Controls data.
 
+import asyncio
 import logging
+import threading
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -9,81 +11,84 @@ logging.basicConfig(level=logging.DEBUG)
 # Hardcoded Organization ID as requested for debugging/stability.
 HARDCODED_ORG_ID = "922071633244"
 
-from google.cloud import resourcemanager_v3
-from googleapiclient import discovery
-import google.auth
+from .circuit_breaker import CallSkippedError
+from .clients import get_access_context_manager_client, get_projects_client
+from .rate_limiter import call_api
 
-def get_vpc_sc_status(project_id: str):
+# The perimeter index is built once per sync run and shared by every project check.
+# A failed build is remembered too, so the rest of the run reports it instead of retrying it per project.
+_index_lock = threading.Lock()
+_perimeter_index = None
+_perimeter_index_error = None
+
+def build_perimeter_index(org_id: str = HARDCODED_ORG_ID):
     """
-    Checks if a project is protected by a VPC Service Controls perimeter.
+    Lists every access policy and service perimeter in the organization once and indexes them
+    by protected resource.
+
+    Returns:
+        A dict with "has_access_policy" and "resources", which maps each 'projects/<number>'
+        resource name to the perimeters that include it. Both enforced (status) and dry-run
+        (spec) perimeter configurations are indexed.
     """
-    logging.debug(f"[VPC-SC] Starting status check for project_id: {project_id}")
-    status = "Disabled"
-    details = "Project is not protected by any VPC Service Controls perimeter."
-    project_number = None
+    acm_client = get_access_context_manager_client()
+    policies = acm_client.accessPolicies()
+    perimeters_api = policies.servicePerimeters()
 
-    try:
-        credentials, _ = google.auth.default()
-
-        # Get the organization ID from the project ID
-        crm_client = resourcemanager_v3.ProjectsClient(credentials=credentials)
-        logging.debug(f"[VPC-SC] Fetching project details for {project_id}")
-        project_info = crm_client.get_project(name=f"projects/{project_id}")
-        logging.debug(f"[VPC-SC] Full project object received from API: {project_info}") 
-        
-        # FIX: The project number is part of the 'name' field, e.g., 'projects/123456789012'
-        project_number = project_info.name.split('/')[-1]
-        org_id = HARDCODED_ORG_ID # Using the hardcoded org ID as requested.
-        logging.debug(f"[VPC-SC] Found project number: {project_number} and using hardcoded org_id: {org_id}")
-
-        # Build the Access Context Manager client
-        acm_client = discovery.build('accesscontextmanager', 'v1', credentials=credentials, cache_discovery=False)
-
-        logging.debug(f"[VPC-SC] Listing access policies for organization {org_id}")
-        policies_request = acm_client.accessPolicies().list(parent=f"organizations/{org_id}")
-        policies_response = policies_request.execute()
-        access_policies = policies_response.get('accessPolicies', [])
-
-        project_resource_name = f"projects/{project_number}"
-        logging.debug(f"[VPC-SC] Constructed project resource name: {project_resource_name}")
-
-        if not access_policies:
-            logging.warning(f"[VPC-SC] No Access Policies found for organization {org_id}. Cannot check perimeters.")
-            return {
-                "name": "VPC SC",
-                "status": "Disabled",
-                "controlType": "VPC Service Controls",
-                "details": "No Access Policy found for the organization.",
-                "ControlObjective": "Prevent Data Exfiltration"
-            }
-
-        for policy in access_policies:
-            logging.debug(f"[VPC-SC] Checking policy: {policy['name']} ({policy['title']})")
-            perimeters_request = acm_client.accessPolicies().servicePerimeters().list(parent=policy['name'])
-            perimeters_response = perimeters_request.execute()
-            service_perimeters = perimeters_response.get('servicePerimeters', [])
-
-            for perimeter in service_perimeters:
-                logging.debug(f"[VPC-SC]   - Checking perimeter: {perimeter['name']} ({perimeter['title']})")
-                if perimeter.get('status') and perimeter['status'].get('resources'):
-                    logging.debug(f"[VPC-SC]     Perimeter resources: {perimeter['status']['resources']}")
-                    if project_resource_name in perimeter['status']['resources']:
-                        status = "Enabled"
-                        details = f"Project is protected by perimeter: {perimeter['title']}"
-                        logging.debug(f"[VPC-SC]     MATCH FOUND! Project is in this perimeter.")
-                        break
-                else:
-                    logging.debug(f"[VPC-SC]     Perimeter has no status or resources defined.")
-            
-            if status == "Enabled":
-                logging.debug(f"[VPC-SC] Project found in a perimeter within this policy. Stopping search.")
-                break
+    logging.debug(f"[VPC-SC] Listing access policies for organization {org_id}")
+    access_policies = []
+    request = policies.list(parent=f"organizations/{org_id}")
+    while request is not None:
+        response = call_api("accesscontextmanager", request.execute)
+        access_policies.extend(response.get('accessPolicies', []))
+        request = policies.list_next(request, response)
 
-    except Exception as e:
-        logging.error(f"[VPC-SC] Error fetching VPC-SC status for {project_id}: {e}")
-        status = "Error"
-        details = str(e)
+    resources = {}
+    perimeter_count = 0
+    for policy in access_policies:
+        logging.debug(f"[VPC-SC] Indexing policy: {policy['name']} ({policy.get('title')})")
+        request = perimeters_api.list(parent=policy['name'])
+        while request is not None:
+            response = call_api("accesscontextmanager", request.execute)
+            for perimeter in response.get('servicePerimeters', []):
+                perimeter_count += 1
+                for config_key, dry_run in (('status', False), ('spec', True)):
+                    for resource in (perimeter.get(config_key) or {}).get('resources', []):
+                        resources.setdefault(resource, []).append({
+                            "name": perimeter['name'],
+                            "title": perimeter.get('title', perimeter['name']),
+                            "dry_run": dry_run,
+                        })
+            request = perimeters_api.list_next(request, response)
+
+    logging.info(f"[VPC-SC] Indexed {perimeter_count} perimeters across {len(access_policies)} access policies ({len(resources)} protected resources).")
+    return {"has_access_policy": bool(access_policies), "resources": resources}
 
+def get_perimeter_index():
+    """
+    Returns the perimeter index for the current run, building it on first use. If the
+    build failed, its error is raised again for the rest of the run.
+    """
+    global _perimeter_index, _perimeter_index_error
+    with _index_lock:
+        if _perimeter_index_error is not None:
+            raise _perimeter_index_error
+        if _perimeter_index is None:
+            try:
+                _perimeter_index = build_perimeter_index()
+            except Exception as e:
+                _perimeter_index_error = e
+                raise
+        return _perimeter_index
+
+def reset_perimeter_index(index: dict = None):
+    """Discards the current perimeter index (or replaces it) and any build failure so the next run starts fresh."""
+    global _perimeter_index, _perimeter_index_error
+    with _index_lock:
+        _perimeter_index = index
+        _perimeter_index_error = None
+
+def _vpc_sc_result(project_id: str, status: str, details: str):
     logging.debug(f"[VPC-SC] Final status for {project_id}: {status}, Details: {details}")
     return {
         "name": "VPC SC",
@@ -92,3 +97,69 @@ def get_vpc_sc_status(project_id: str):
         "details": details,
         "ControlObjective": "Prevent Data Exfiltration"
     }
+
+def _evaluate_perimeters(project_id: str, project_number: str, index: dict):
+    """Builds the VPC SC entry for a project from the perimeter index."""
+    if not index["has_access_policy"]:
+        logging.warning(f"[VPC-SC] No Access Policies found for organization {HARDCODED_ORG_ID}. Cannot check perimeters.")
+        return {
+            "name": "VPC SC",
+            "status": "Disabled",
+            "controlType": "VPC Service Controls",
+            "details": "No Access Policy found for the organization.",
+            "ControlObjective": "Prevent Data Exfiltration"
+        }
+
+    status = "Disabled"
+    details = "Project is not protected by any VPC Service Controls perimeter."
+    perimeters = index["resources"].get(f"projects/{project_number}", [])
+    enforced = [p for p in perimeters if not p["dry_run"]]
+    dry_run = [p for p in perimeters if p["dry_run"]]
+    if enforced:
+        status = "Enabled"
+        details = f"Project is protected by perimeter: {enforced[0]['title']}"
+    elif dry_run:
+        details = f"Project is only in the dry-run configuration of perimeter: {dry_run[0]['title']}"
+    return _vpc_sc_result(project_id, status, details)
+
+def _vpc_sc_error(project_id: str, e: Exception):
+    logging.error(f"[VPC-SC] Error fetching VPC-SC status for {project_id}: {e}")
+    return _vpc_sc_result(project_id, "Skipped" if isinstance(e, CallSkippedError) else "Error", str(e))
+
+def get_vpc_sc_status(project_id: str, project_number: str = None):
+    """
+    Checks if a project is protected by a VPC Service Controls perimeter.
+
+    The project number should come from the org project listing; it is only looked up
+    with an extra get_project call when not provided.
+    """
+    logging.debug(f"[VPC-SC] Starting status check for project_id: {project_id}")
+    try:
+        if not project_number:
+            logging.debug(f"[VPC-SC] Fetching project details for {project_id}")
+            project_info = call_api("cloudresourcemanager", get_projects_client().get_project, name=f"projects/{project_id}")
+            # The project number is part of the 'name' field, e.g., 'projects/123456789012'
+            project_number = project_info.name.split('/')[-1]
+
+        return _evaluate_perimeters(project_id, project_number, get_perimeter_index())
+    except Exception as e:
+        return _vpc_sc_error(project_id, e)
+
+async def get_vpc_sc_status_async(ctx, project_id: str, project_number: str = None):
+    """
+    The async counterpart of get_vpc_sc_status. The perimeter index comes from the
+    discovery-based Access Context Manager client, which has no async variant, so it is
+    built on a worker thread while the event loop keeps running.
+    """
+    logging.debug(f"[VPC-SC] Starting status check for project_id: {project_id}")
+    try:
+        if not project_number:
+            logging.debug(f"[VPC-SC] Fetching project details for {project_id}")
+            projects_client = ctx.client("resourcemanager.projects")
+            project_info = await ctx.call("cloudresourcemanager", projects_client.get_project, name=f"projects/{project_id}")
+            project_number = project_info.name.split('/')[-1]
+
+        index = _perimeter_index or await asyncio.to_thread(get_perimeter_index)
+        return _evaluate_perimeters(project_id, project_number, index)
+    except Exception as e:
+        return _vpc_sc_error(project_id, e)